@@ -0,0 +1,139 @@
+"""Synthetic Reddit and Twitter objects for benchmarking offline.
+
+They are shaped like praw's Submission and Comment, and like
+GetOldTweets3's Tweet, down to the size of their __dict__, which is
+what the serializers read. Comments are made as they are iterated,
+so that a million rows do not need a million objects in memory.
+"""
+import datetime
+
+# Fields of a praw Comment or Submission, beyond those which are exported.
+COMMENT_FILLER = ['all_awardings', 'approved_at_utc', 'approved_by', 'archived',
+                  'associated_award', 'author_flair_background_color',
+                  'author_flair_css_class', 'author_flair_richtext',
+                  'author_flair_template_id', 'author_flair_text',
+                  'author_flair_text_color', 'author_flair_type', 'author_fullname',
+                  'author_patreon_flair', 'author_premium', 'awarders',
+                  'banned_at_utc', 'banned_by', 'body_html', 'can_gild',
+                  'can_mod_post', 'collapsed', 'collapsed_because_crowd_control',
+                  'collapsed_reason', 'comment_type', 'controversiality',
+                  'distinguished', 'downs', 'gilded', 'gildings', 'likes',
+                  'link_id', 'locked', 'mod_note', 'mod_reason_by',
+                  'mod_reason_title', 'mod_reports', 'no_follow', 'num_reports',
+                  'removal_reason', 'report_reasons', 'saved', 'score_hidden',
+                  'send_replies', 'subreddit_id', 'subreddit_name_prefixed',
+                  'subreddit_type', 'top_awarded_type', 'total_awards_received',
+                  'treatment_tags', 'ups', 'user_reports']
+SUBMISSION_FILLER = COMMENT_FILLER + ['allow_live_comments', 'category', 'clicked',
+                                      'content_categories', 'contest_mode', 'domain',
+                                      'hidden', 'hide_score', 'is_crosspostable',
+                                      'is_meta', 'is_original_content',
+                                      'is_reddit_media_domain', 'is_robot_indexable',
+                                      'is_self', 'is_video', 'link_flair_richtext',
+                                      'link_flair_text', 'link_flair_type', 'media',
+                                      'media_embed', 'media_only', 'over_18',
+                                      'parent_whitelist_status', 'pinned', 'pwls',
+                                      'quarantine', 'secure_media',
+                                      'secure_media_embed', 'selftext_html',
+                                      'spoiler', 'suggested_sort', 'thumbnail',
+                                      'upvote_ratio', 'url', 'visited',
+                                      'whitelist_status', 'wls']
+BODIES = ["Nice chart.", "Source?\n\nThe data looks off for 2019.",
+          'He said "this is fine", and it was not.',
+          "A longer comment, " * 20]
+
+
+class Redditor():
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class Comment():
+    def __init__(self, n, submission_id):
+        self.__dict__.update(dict.fromkeys(COMMENT_FILLER))
+        self.id = f"c{n:x}"
+        self.name = 't1_' + self.id
+        self.body = BODIES[n % len(BODIES)]
+        self.author = Redditor(f"user{n % 997}") if n % 13 else None
+        self.created_utc = 1513140549.0 + n
+        self.edited = False if n % 7 else 1513140600.0 + n
+        self.score = n % 50 - 5
+        self.is_submitter = n % 11 == 0
+        self.parent_id = 't3_' + submission_id
+        self.stickied = False
+        self.depth = 0
+        self.replies = []
+
+
+class Comments():
+    """A comment forest which makes its comments as it is iterated."""
+    def __init__(self, submission_id, n, offset):
+        self.submission_id = submission_id
+        self.n = n
+        self.offset = offset
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return (Comment(self.offset + i, self.submission_id) for i in range(self.n))
+
+    def replace_more(self, limit=32, threshold=0):
+        return []
+
+
+class Submission():
+    def __init__(self, n, comments, offset=0):
+        self.__dict__.update(dict.fromkeys(SUBMISSION_FILLER))
+        self.id = f"s{n:x}"
+        self.name = 't3_' + self.id
+        self.fullname = self.name
+        self.title = f"Synthetic submission {n}"
+        self.selftext = BODIES[n % len(BODIES)]
+        self.author = Redditor('op')
+        self.created_utc = 1513000000.0 + n
+        self.score = n * 3
+        self.num_comments = comments
+        self.permalink = f"/r/synthetic/comments/{self.id}/"
+        self.stickied = False
+        self._comments = Comments(self.id, comments, offset)
+
+    @property
+    def comments(self):
+        return self._comments
+
+
+class Tweet():
+    def __init__(self, n):
+        self.id = str(1300000000000000000 + n)
+        self.permalink = f"https://twitter.com/user{n % 997}/status/{self.id}"
+        self.username = f"user{n % 997}"
+        self.to = None
+        self.text = BODIES[n % len(BODIES)]
+        self.date = datetime.datetime(2020, 8, 15, tzinfo=datetime.timezone.utc) + \
+            datetime.timedelta(seconds=n)
+        self.retweets = n % 100
+        self.favorites = n % 300
+        self.mentions = ''
+        self.hashtags = '#giraffe' if n % 3 else ''
+        self.geo = ''
+        self.urls = ''
+        self.author_id = n % 997
+
+
+def submissions(rows, per_submission=500):
+    """Submissions with rows comments in all."""
+    result, offset = [], 0
+    while offset < rows:
+        n = min(per_submission, rows - offset)
+        result.append(Submission(len(result), n, offset))
+        offset += n
+    return result
+
+
+def tweets(rows):
+    """Tweets, made as they are iterated."""
+    return (Tweet(n) for n in range(rows))
@@ -0,0 +1,232 @@
+"""Benchmark serialization and the submit routes offline.
+
+Run from the root of the repository, with config.py at hand like for
+the app itself:
+
+    python -m benchmarks.run --scales 10,1000,100000 --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+Every benchmark is timed over a number of repeats, and run once more
+under tracemalloc for its peak memory. With --startup, importing the
+app is timed in fresh interpreters too, with its max RSS as the peak
+memory, both with the sources loaded lazily and warmed up. Results carry the commit they
+were run on, so that runs on different commits can be compared.
+"""
+from navcom_data_downloader import app, models, sources
+from navcom_data_downloader.cache import ResponseCache, MemoryBackend
+from benchmarks import fixtures
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+class StubRedditDataSource(models.RedditDataSource):
+    """A RedditDataSource serving synthetic submissions, without a client."""
+    rows = 0
+
+    def __init__(self):
+        pass
+
+    def _iter_query(self, subreddit, kind, limit=None, progress=None, checkpoint=None,
+                    comments=True, budget=None, listed=None):
+        yield from fixtures.submissions(self.rows)
+
+    def _get_submission(self, submission_id, comments=True, budget=None):
+        submission = fixtures.submissions(self.rows, per_submission=self.rows)[0]
+        submission.complete = True
+        return submission
+
+    def _iter_submissions(self, submission_ids, progress=None, comments=True, budget=None):
+        yield from fixtures.submissions(self.rows)
+
+
+class StubTwitterDataSource(models.TwitterDataSource):
+    """A TwitterDataSource serving synthetic tweets."""
+    rows = 0
+
+    def _query(self, query, max=10, receive=None):
+        tweets = list(fixtures.tweets(self.rows))
+        for start in range(0, len(tweets), models.TWEET_PAGE_SIZE):
+            receive(tweets[start:start + models.TWEET_PAGE_SIZE])
+        return tweets
+
+
+def serialize_reddit(rows):
+    submissions = fixtures.submissions(rows)
+    rds = StubRedditDataSource()
+    return lambda: rds._as_csv(submissions)
+
+
+def serialize_twitter(rows):
+    tds = StubTwitterDataSource()
+    return lambda: tds._as_csv(fixtures.tweets(rows))
+
+
+def route(path, data):
+    def benchmark(rows):
+        StubRedditDataSource.rows = rows
+        StubTwitterDataSource.rows = rows
+        client = app.test_client()
+
+        def post():
+            resp = client.post(path, data=data)
+            assert resp.status_code == 200, resp.status_code
+            return resp.data
+
+        return post
+
+    return benchmark
+
+
+BENCHMARKS = {
+    'serialize_reddit': serialize_reddit,
+    'serialize_twitter': serialize_twitter,
+    'route_reddit_submission': route('/reddit-submission-submit',
+                                     {'submission_id': 'synthetic'}),
+    'route_reddit_submissions': route('/reddit-submissions-submit',
+                                      {'submission_ids': 'synthetic,others'}),
+    'route_reddit_subreddit': route('/reddit-subreddit-submit',
+                                    {'subreddit': 'synthetic', 'kind': 'hot'}),
+    'route_twitter': route('/twitter-submit', {'string': 'synthetic', 'max': '0'}),
+}
+
+
+def stub_sources():
+    """Serve the routes from the stubs, and never from the cache."""
+    sources.register('reddit', StubRedditDataSource)
+    sources.register('twitter', StubTwitterDataSource)
+    models.response_cache = ResponseCache(MemoryBackend(0), {})
+    app.logger.setLevel('WARNING')
+
+
+def measure(name, rows, repeats):
+    run = BENCHMARKS[name](rows)
+    run()  # Warm up.
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    median = statistics.median(latencies)
+    return {'benchmark': name,
+            'rows': rows,
+            'repeats': repeats,
+            'p50': median,
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'rows_per_second': rows / median if median else None,
+            'peak_memory': peak}
+
+
+# Import the app in a fresh interpreter, and report seconds and max RSS.
+STARTUP = """
+import resource, sys, time
+start = time.perf_counter()
+import navcom_data_downloader
+{warm_up}
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+"""
+
+
+def measure_startup(name, repeats):
+    """Measure a cold start of a worker, lazily or with the sources warmed up."""
+    warm_up = 'navcom_data_downloader.sources.warm_up()' if name == 'startup_warm' else ''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        os.getcwd(), os.environ.get('PYTHONPATH')])))
+    latencies, rss = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', STARTUP.format(warm_up=warm_up)],
+                                capture_output=True, text=True, check=True, env=env).stdout
+        seconds, maxrss = output.split()[-2:]
+        latencies.append(float(seconds))
+        rss.append(int(maxrss))
+
+    return {'benchmark': name,
+            'rows': 0,
+            'repeats': repeats,
+            'p50': statistics.median(latencies),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'rows_per_second': None,
+            'peak_memory': max(rss)}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    previous = {(r['benchmark'], r['rows']): r for r in (baseline or {}).get('results', [])}
+    print(f"{'benchmark':<26}{'rows':>9}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}"
+          f"{'rows/s':>12}{'peak MiB':>10}{'vs base':>9}")
+    for r in results:
+        before = previous.get((r['benchmark'], r['rows']))
+        ratio = f"{before['p50'] / r['p50']:.2f}x" if before and r['p50'] else ''
+        print(f"{r['benchmark']:<26}{r['rows']:>9}{r['p50']:>10.4f}{r['p90']:>10.4f}"
+              f"{r['p99']:>10.4f}{r['rows_per_second'] or 0:>12.0f}"
+              f"{r['peak_memory'] / 1024 ** 2:>10.1f}{ratio:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='10,1000,100000',
+                        help="Comma separated numbers of rows, up to 1000000")
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help="Comma separated benchmarks to run")
+    parser.add_argument('--repeats', type=int, default=5,
+                        help="Timed repeats, fewer above 100000 rows")
+    parser.add_argument('--startup', action='store_true',
+                        help="Also measure the cold start of a worker, in fresh interpreters")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Compare to results of an earlier run")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.startup:
+        for name in ('startup_lazy', 'startup_warm'):
+            results.append(measure_startup(name, args.repeats))
+
+    stub_sources()
+    for name in args.benchmarks.split(','):
+        for rows in [int(scale) for scale in args.scales.split(',')]:
+            repeats = args.repeats if rows <= 100000 else max(1, args.repeats // 5)
+            results.append(measure(name, rows, repeats))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': commit(),
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,3 +5,7 @@ app = Flask(__name__)
 app.config.from_object(Config)
 
 import navcom_data_downloader.routes
+import navcom_data_downloader.cli
+
+if app.config.get('EAGER_SOURCES'):
+    navcom_data_downloader.sources.warm_up()
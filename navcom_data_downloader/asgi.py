@@ -0,0 +1,139 @@
+"""The app as an ASGI application, with the Reddit exports on asyncio.
+
+    uvicorn navcom_data_downloader.asgi:application
+
+The Reddit submit routes are served here, streaming their exports from
+AsyncRedditDataSource, so that an export waiting on Reddit holds no
+thread. They read their forms with the same helpers as the routes, and
+respond with the same headers and chunks. Everything else is served
+by the Flask app, on threads, through asgiref's WsgiToAsgi: the other
+routes, and the exports the async source does not do, which are those
+in the background, as .gz files, resumed with Range, incremental, in
+a columnar format, or profiled. A submit whose form is refused goes to
+the Flask app too, which refuses it the same way. Exports served here
+are not kept for resuming, see navcom_data_downloader.retention.
+"""
+from navcom_data_downloader import app, routes
+from navcom_data_downloader.async_models import AsyncRedditDataSource, reddit_client, FORMATS
+from navcom_data_downloader import compression, formats
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from werkzeug.test import EnvironBuilder
+
+wsgi = WsgiToAsgi(app)
+
+# Routes served by AsyncRedditDataSource.
+ROUTES = ['/reddit-submission-submit', '/reddit-submissions-submit', '/reddit-subreddit-submit']
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] not in ROUTES:
+        await wsgi(scope, receive, send)
+        return
+
+    body = await _read_body(receive)
+    try:
+        with app.request_context(_environ(scope, body)):
+            export = _requested_export()
+    except Exception:
+        export = None
+    if export is None:
+        await wsgi(scope, _replay(body, receive), send)
+        return
+
+    stream, args, kwargs, headers = export
+    chunks = getattr(AsyncRedditDataSource(await reddit_client()), stream)(*args, **kwargs)
+    encoding = dict(headers).get('Content-Encoding')
+    if encoding:
+        chunks = compression.acompress(chunks, encoding)
+    await send({'type': 'http.response.start',
+                'status': 200,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers]})
+    try:
+        async for chunk in chunks:
+            await send({'type': 'http.response.body',
+                        'body': chunk.encode('utf-8') if isinstance(chunk, str) else chunk,
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await chunks.aclose()
+
+
+def _requested_export():
+    """What the submitted form asks to export, or None if it is for the Flask app.
+
+    Runs in a request context.
+
+    Returns:
+    tuple: Name of the AsyncRedditDataSource method streaming the
+    export, its args and kwargs, and the headers to respond with
+    """
+    form = request.form
+    if (form.get('background') or form.get('gzip') or form.get('incremental') or request.range
+            or request.args.get('profile')):
+        return None
+    format = routes._requested_format()
+    if format not in FORMATS:
+        return None
+
+    kwargs = {'format': format,
+              'columns': routes._requested_columns(AsyncRedditDataSource),
+              'replies': bool(form.get('replies')),
+              'budget': routes._reddit_budget()}
+    if request.path == '/reddit-submission-submit':
+        stream = 'stream_submission'
+        args = [form['submission_id']]
+        name = form['submission_id']
+    elif request.path == '/reddit-submissions-submit':
+        submission_ids = routes._submission_ids(form['submission_ids'])
+        if not submission_ids:
+            return None
+        stream = 'stream_submissions'
+        args = [submission_ids]
+        name = f"submissions-{len(submission_ids)}"
+    else:
+        subreddit, kind = form['subreddit'], form['kind']
+        if kind not in ('hot', 'new'):
+            return None
+        stream = 'stream_' + kind
+        args = [subreddit]
+        name = subreddit + '-' + kind
+
+    mimetype, extension = formats.FORMATS[format]
+    response = routes._attachment_response(iter(()), name + extension, mimetype,
+                                           format in compression.COMPRESSIBLE)
+    response.close()
+    return stream, args, kwargs, response.headers.to_wsgi_list()
+
+
+async def _read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(body)
+
+
+def _replay(body, receive):
+    """A receive giving the body read already, then what comes next."""
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return replay
+
+
+def _environ(scope, body):
+    """A WSGI environ for an ASGI request, for reading it like the routes do."""
+    headers = [(name.decode('latin-1'), value.decode('latin-1'))
+               for name, value in scope.get('headers', [])]
+    return EnvironBuilder(path=scope['path'], method=scope['method'],
+                          query_string=scope.get('query_string', b'').decode('latin-1'),
+                          headers=headers, data=body).get_environ()
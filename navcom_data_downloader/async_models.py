@@ -0,0 +1,263 @@
+"""The Reddit source on asyncio, with asyncpraw, for the ASGI serving mode.
+
+Listing pages and comment expansions are awaited rather than waited
+for on threads, so one worker serves many exports at once. Rows and
+their serialization are those of RedditDataSource, a submission at a
+time, so exports come out the same. Only text formats are streamed
+this way, see navcom_data_downloader.asgi.
+"""
+from navcom_data_downloader.cache import response_cache
+from navcom_data_downloader.jobs import Progress
+from navcom_data_downloader.models import RedditDataSource, EXPANSION_WINDOW, MORE_COMMENTS_LIMIT
+from navcom_data_downloader.ratelimit import reddit_scheduler, INTERACTIVE, Budget
+from navcom_data_downloader.sources import lazy_import
+from navcom_data_downloader import app, formats, metrics
+from config import RedditConfig, RedditCredentials
+import asyncio
+import collections
+import weakref
+
+asyncpraw = lazy_import('asyncpraw')
+
+# Formats which can be serialized a submission at a time.
+FORMATS = ['csv', 'jsonl']
+
+# An asyncpraw.Reddit is bound to the event loop it was made on.
+_clients = weakref.WeakKeyDictionary()
+
+
+async def reddit_client():
+    """Get the asyncpraw.Reddit client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        with metrics.stage_seconds.time(source='reddit', stage='client'):
+            client = asyncpraw.Reddit(client_id=RedditCredentials.client_id,
+                                      client_secret=RedditCredentials.client_secret,
+                                      password=RedditCredentials.password,
+                                      user_agent=RedditCredentials.user_agent,
+                                      username=RedditCredentials.username)
+        reddit_scheduler.install_async(client)
+        _clients[loop] = client
+        app.logger.debug("Created an async Reddit client")
+
+    return client
+
+
+class AsyncRedditDataSource(RedditDataSource):
+    """Model for Reddit datasource, on asyncio.
+
+    The stream methods are those of RedditDataSource, as async
+    generators of chunks, and only for FORMATS.
+    """
+    # The asyncpraw.Reddit client of the event loop, given.
+    reddit = None
+
+    def __init__(self, reddit):
+        app.logger.debug(f"  ... as an async Reddit DataSource instantiated")
+        self.reddit = reddit
+
+    async def stream_submission(self, submission_id, progress=None, format='csv', columns=None,
+                                replies=False, budget=None):
+        """See RedditDataSource.stream_submission."""
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', submission_id=submission_id, format=format,
+                                 columns=','.join(columns), replies=replies or None)
+        submissions = self._iter_submission(submission_id, progress,
+                                            comments=self._per_comment(columns), budget=budget)
+        chunks = self._serialize(submissions, progress, format, 'submission', columns, replies)
+        async for chunk in response_cache.astream('reddit', key, chunks, progress):
+            yield chunk
+
+    async def stream_submissions(self, submission_ids, progress=None, format='csv', columns=None,
+                                 replies=False, budget=None):
+        """See RedditDataSource.stream_submissions."""
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', submission_ids=','.join(submission_ids),
+                                 format=format, columns=','.join(columns), replies=replies or None)
+        budget = budget or Budget()
+        budget.expect(len(submission_ids))
+        comments = self._per_comment(columns)
+        ids = [id[3:] if id.startswith('t3_') else id for id in submission_ids]
+        if comments:
+            # Fetched along with their comments by _expand, like the sync ones.
+            lookup = self._iter_lazy(ids)
+        else:
+            lookup = self.reddit.info(fullnames=['t3_' + id for id in ids])
+        submissions = self._iter_expanded(lookup, 'submissions', progress, comments, budget)
+        chunks = self._serialize(submissions, progress, format, 'submissions', columns, replies)
+        async for chunk in response_cache.astream('reddit', key, chunks, progress):
+            yield chunk
+
+    async def stream_hot(self, subreddit, limit=RedditConfig.limit, progress=None,
+                         format='csv', columns=None, replies=False, budget=None):
+        """See RedditDataSource.stream_hot."""
+        async for chunk in self._stream_listing(subreddit, 'hot', limit, progress, format,
+                                                columns, replies, budget):
+            yield chunk
+
+    async def stream_new(self, subreddit, limit=RedditConfig.limit, progress=None,
+                         format='csv', columns=None, replies=False, budget=None):
+        """See RedditDataSource.stream_new, here without incremental crawls."""
+        async for chunk in self._stream_listing(subreddit, 'new', limit, progress, format,
+                                                columns, replies, budget):
+            yield chunk
+
+    async def _stream_listing(self, subreddit, kind, limit, progress, format, columns=None,
+                              replies=False, budget=None):
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', subreddit=subreddit.lower(), kind=kind,
+                                 limit=limit, format=format, columns=','.join(columns),
+                                 replies=replies or None)
+        budget = budget or Budget()
+        budget.expect(limit)
+        listing = getattr(await self.reddit.subreddit(subreddit), kind)(limit=limit)
+        submissions = self._iter_expanded(listing, kind, progress, self._per_comment(columns),
+                                          budget)
+        chunks = self._serialize(submissions, progress, format, kind, columns, replies)
+        async for chunk in response_cache.astream('reddit', key, chunks, progress):
+            yield chunk
+
+    async def _iter_lazy(self, submission_ids):
+        for submission_id in submission_ids:
+            yield await self.reddit.submission(id=submission_id, fetch=False)
+
+    async def _iter_submission(self, submission_id, progress=None, comments=True, budget=None):
+        progress = progress or Progress()
+        with reddit_scheduler.priority(INTERACTIVE):
+            submission = await self._get_submission(submission_id, comments=comments,
+                                                    budget=budget)
+        progress.count('submissions')
+        if comments:
+            progress.count('comments', len(submission.comments))
+            if not submission.complete:
+                progress.count('incomplete')
+        yield submission
+
+    async def _get_submission(self, submission_id, comments=True, budget=None):
+        """See RedditDataSource._get_submission."""
+        kept = await asyncio.to_thread(self._from_warehouse, submission_id)
+        if kept is not None:
+            return kept
+
+        budget = budget or Budget()
+        with metrics.stage_seconds.time(source='reddit', kind='submission', stage='expand'):
+            if not comments:
+                async for submission in self.reddit.info(fullnames=['t3_' + submission_id]):
+                    return submission
+                raise KeyError(submission_id)
+
+            submission = await self.reddit.submission(id=submission_id)
+            budget.expect(1)
+            skipped = await submission.comments.replace_more(
+                limit=budget.allowance(RedditConfig.comment_limit))
+            budget.spend()
+            submission.complete = not skipped
+            await asyncio.to_thread(self._to_warehouse, submission)
+
+        return submission
+
+    async def _iter_expanded(self, submissions, kind, progress, comments=True, budget=None):
+        """Expand comment trees concurrently, but yield in the given order.
+
+        See RedditDataSource._iter_expanded, here with tasks rather than
+        threads.
+        """
+        progress = progress or Progress()
+        if not comments:
+            async for submission in submissions:
+                progress.count('submissions')
+                yield submission
+            return
+
+        budget = budget or Budget()
+        pending = collections.deque()
+        try:
+            async for submission in submissions:
+                if budget.exhausted():
+                    app.logger.info("Stopped expanding %s at %s, out of budget %s",
+                                    kind, submission.id, budget.as_dict())
+                    progress.count('incomplete')
+                    break
+                pending.append(asyncio.ensure_future(self._expand(submission, kind, budget)))
+                if len(pending) >= EXPANSION_WINDOW:
+                    for expanded in self._expanded(await pending.popleft(), progress):
+                        yield expanded
+            while pending:
+                for expanded in self._expanded(await pending.popleft(), progress):
+                    yield expanded
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _expand(self, submission, kind='', budget=None):
+        """See RedditDataSource._expand."""
+        kept = await asyncio.to_thread(self._from_warehouse, submission.id)
+        if kept is not None:
+            return kept
+
+        budget = budget or Budget()
+        with metrics.stage_seconds.time(source='reddit', kind=kind, stage='expand'):
+            try:
+                await submission.load()
+                comments = submission.comments
+            except Exception:
+                app.logger.warning("Could not retrieve comments for %s",
+                                   submission.id, exc_info=True)
+                return None
+            budget.spend()
+
+            submission.complete = True
+            try:
+                if any([self._is_more(c) for c in comments]):
+                    app.logger.debug("Retrieving more comments for %s", submission.id)
+                    skipped = await comments.replace_more(
+                        limit=budget.allowance(MORE_COMMENTS_LIMIT))
+                    submission.complete = not skipped
+            except Exception:
+                submission.complete = False
+                app.logger.warning("Could not retrieve more comments for %s",
+                                   submission.id, exc_info=True)
+        await asyncio.to_thread(self._to_warehouse, submission)
+
+        return submission
+
+    def _expanded(self, submission, progress):
+        if submission is not None:
+            progress.count('submissions')
+            progress.count('comments', len(submission.comments))
+            if not submission.complete:
+                progress.count('incomplete')
+            yield submission
+
+    @staticmethod
+    def _is_more(comment):
+        return isinstance(comment, asyncpraw.models.MoreComments)
+
+    async def _serialize(self, submissions, progress=None, format='csv', kind='', columns=None,
+                         replies=False):
+        """Format posts a submission at a time, like RedditDataSource._serialize does at once.
+
+        A CSV export has its header first, also without any submission,
+        and only then.
+        """
+        progress = progress or Progress()
+        columns = columns or self.columns
+        if format not in FORMATS:
+            raise KeyError(format)
+        if format == 'csv':
+            yield next(formats.iter_csv(columns, []))
+
+        seconds = 0
+        async for submission in submissions:
+            rows = self._iter_rows([submission], progress, columns, replies)
+            chunks = metrics.Stopwatch(formats.serialize(format, columns, rows, self.types))
+            if format == 'csv':
+                next(chunks)
+            for chunk in chunks:
+                yield chunk
+            seconds += chunks.elapsed
+        metrics.stage_seconds.observe(seconds, source='reddit', kind=kind, stage='serialize')
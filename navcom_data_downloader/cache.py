@@ -0,0 +1,382 @@
+from navcom_data_downloader import app, files, profiling
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import contextvars
+import pickle
+import threading
+import time
+
+
+class MemoryBackend():
+    """Keep cache entries in this process, least recently used first."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, value)
+            self._size += len(value)
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'size': self._size}
+
+    def _remove(self, key):
+        expires, value = self._entries.pop(key)
+        self._size -= len(value)
+
+
+class DiskBackend():
+    """Keep cache entries as files in a directory.
+
+    Meant for sharing a cache between the worker processes of one
+    host. Reading an entry touches its file, so the modification time
+    tells when it was last used.
+    """
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            files.remove(filename)
+            return None
+        os.utime(filename)
+        return value
+
+    def set(self, key, value, ttl):
+        with files.replacing(self._filename(key), 'wb') as f:
+            pickle.dump((time.time() + ttl, value), f)
+        self._evict()
+
+    def stats(self):
+        entries = self._entries()
+        return {'entries': len(entries),
+                'size': sum(stat.st_size for filename, stat in entries)}
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        size = sum(stat.st_size for filename, stat in entries)
+        while entries and size > self.max_size:
+            filename, stat = entries.pop(0)
+            files.remove(filename)
+            size -= stat.st_size
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.cache'):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                entries.append((filename, os.stat(filename)))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.cache')
+
+
+class _Flight():
+    """An export being made, and the chunks of it its followers have yet to read."""
+    def __init__(self, key, chunks, progress):
+        self.key = key
+        self.chunks = chunks
+        self.progress = progress
+        self.condition = threading.Condition()
+        self.buffer = []
+        self.offset = 0
+        self.produced = 0
+        self.buffered = 0
+        self.positions = {}
+        self.open = True
+        self.done = False
+        self.error = None
+
+
+class Flights():
+    """Exports being made in this process, by cache key, each made once for all who ask.
+
+    The first stream of an export starts a flight: a producer thread
+    reads its chunks into a buffer, and each stream of the same export
+    while the flight is open reads them from there at its own pace,
+    from the first chunk on, instead of querying the source again.
+    Followers count the progress of the first stream, if it has any.
+
+    A flight is open until it has produced more than max_size. From
+    then on it keeps only the chunks its slowest follower has yet to
+    read, and its producer waits while those are more than max_size.
+    A flight which all of its followers leave stops.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def follow(self, key, chunks, progress=None):
+        """Stream an export from its flight, starting one with chunks if there is none.
+
+        Parameters:
+        key (str): Cache key of the export, see ResponseCache.key
+        chunks (iterable): Chunks of the export, read only to start a flight
+        progress (Progress): Counters of the export, optional
+
+        Returns:
+        generator: Chunks of the export
+        """
+        follower = object()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight.condition:
+                    if flight.open:
+                        flight.positions[follower] = 0
+                    else:
+                        flight = None
+            if flight is None:
+                flight = _Flight(key, chunks, progress)
+                flight.positions[follower] = 0
+                self._flights[key] = flight
+                started = True
+            else:
+                self.coalesced += 1
+                started = False
+
+        if started:
+            # The producer makes Reddit calls with the priority of the first stream.
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(profiling.run, self._produce, flight),
+                             name='export-flight', daemon=True).start()
+        else:
+            app.logger.debug("Coalesced export %s with the one in flight", key)
+        return self._read(flight, follower, progress)
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._flights), 'coalesced': self.coalesced}
+
+    def _produce(self, flight):
+        try:
+            for chunk in flight.chunks:
+                with flight.condition:
+                    while (not flight.open and flight.positions
+                           and flight.buffered > self.max_size):
+                        flight.condition.wait()
+                    if not flight.positions:
+                        app.logger.debug("Stopped export %s, left by all", flight.key)
+                        flight.open = False
+                        break
+                    flight.buffer.append(chunk)
+                    flight.produced += len(chunk)
+                    flight.buffered += len(chunk)
+                    if flight.produced > self.max_size:
+                        flight.open = False
+                    flight.condition.notify_all()
+                if not flight.open:
+                    self._land(flight)
+        except BaseException as error:
+            flight.error = error
+        finally:
+            if hasattr(flight.chunks, 'close'):
+                flight.chunks.close()
+            with flight.condition:
+                flight.open = False
+                flight.done = True
+                flight.condition.notify_all()
+            self._land(flight)
+
+    def _read(self, flight, follower, progress):
+        position = 0
+        try:
+            while True:
+                with flight.condition:
+                    while position == flight.offset + len(flight.buffer) and not flight.done:
+                        flight.condition.wait()
+                    if position == flight.offset + len(flight.buffer):
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    chunk = flight.buffer[position - flight.offset]
+                    position += 1
+                    flight.positions[follower] = position
+                    self._trim(flight)
+                if progress is not None and flight.progress not in (None, progress):
+                    progress.follow(flight.progress)
+                yield chunk
+        finally:
+            with flight.condition:
+                del flight.positions[follower]
+                self._trim(flight)
+
+    def _trim(self, flight):
+        """Drop the chunks all followers have read, once no more can join.
+
+        Called with the condition of the flight held.
+        """
+        if flight.open:
+            return
+        position = min(flight.positions.values(), default=flight.offset + len(flight.buffer))
+        read = flight.buffer[:position - flight.offset]
+        if read:
+            del flight.buffer[:len(read)]
+            flight.offset = position
+            flight.buffered -= sum(len(chunk) for chunk in read)
+            flight.condition.notify_all()
+
+    def _land(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+
+class ResponseCache():
+    """A TTL and LRU bounded cache of serialized exports.
+
+    Entries are keyed on the normalized query, and live for the TTL of
+    their source. Exports larger than a quarter of the backend size
+    are not cached.
+    """
+    def __init__(self, backend, ttls, default_ttl=300):
+        self.backend = backend
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_entry_size = backend.max_size // 4
+        self.flights = Flights(self.max_entry_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source, **params):
+        """Make a cache key out of a source name and query parameters.
+
+        Empty parameters are the same as missing ones.
+        """
+        params = {name: value for name, value in params.items()
+                  if value not in (None, '')}
+        normalized = json.dumps([source, params], sort_keys=True, default=str)
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def stream(self, source, key, chunks, progress=None):
+        """Stream chunks from the cache, or from chunks while caching them.
+
+        On a miss while the same export is being made for another
+        request of this process, the export is streamed from that one
+        rather than made again, see Flights.
+
+        Parameters:
+        source (str): Name of the source, for choosing the TTL
+        key (str): Cache key, see ResponseCache.key
+        chunks (iterable): Chunks to use on a cache miss
+        progress (Progress): Counters of the export, optional
+
+        Returns:
+        generator: Chunks of the export
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('hits')
+            app.logger.debug("Cache hit for %s", key)
+            yield value
+            return
+
+        self._count('misses')
+        yield from self.flights.follow(key, self._keep(source, key, chunks, progress), progress)
+
+    def _keep(self, source, key, chunks, progress=None):
+        """Pass chunks through, caching them once they are all through, unless incomplete."""
+        kept, size = [], 0
+        for chunk in chunks:
+            if kept is not None:
+                kept.append(chunk)
+                size += len(chunk)
+                if size > self.max_entry_size:
+                    kept = None
+            yield chunk
+
+        if kept and not _incomplete(progress):
+            ttl = self.ttls.get(source, self.default_ttl)
+            # Text formats come in str chunks, the others in bytes.
+            self.backend.set(key, kept[0][:0].join(kept), ttl)
+
+    async def astream(self, source, key, chunks, progress=None):
+        """Like stream, for an async iterable of chunks."""
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('hits')
+            app.logger.debug("Cache hit for %s", key)
+            yield value
+            return
+
+        self._count('misses')
+        kept, size = [], 0
+        async for chunk in chunks:
+            if kept is not None:
+                kept.append(chunk)
+                size += len(chunk)
+                if size > self.max_entry_size:
+                    kept = None
+            yield chunk
+
+        if kept and not _incomplete(progress):
+            ttl = self.ttls.get(source, self.default_ttl)
+            self.backend.set(key, kept[0][:0].join(kept), ttl)
+
+    def stats(self):
+        """Report hits and misses and the size of the cache, as a dict."""
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses}
+        stats.update(self.backend.stats())
+        stats.update(self.flights.stats())
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def _incomplete(progress):
+    """Whether an export was cut short, so that it is not to be cached."""
+    return progress is not None and progress.as_dict()['incomplete'] > 0
+
+
+def _backend():
+    max_size = app.config.get('CACHE_MAX_SIZE', 64 * 1024 * 1024)
+    if app.config.get('CACHE_DIR'):
+        return DiskBackend(app.config['CACHE_DIR'], max_size)
+    return MemoryBackend(max_size)
+
+
+response_cache = ResponseCache(_backend(),
+                               app.config.get('CACHE_TTL', {'reddit': 300,
+                                                            'twitter': 900}))
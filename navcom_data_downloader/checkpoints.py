@@ -0,0 +1,49 @@
+from navcom_data_downloader import app
+import os
+import sqlite3
+import tempfile
+
+
+class CheckpointStore():
+    """Remember the newest submission seen in each subreddit.
+
+    Kept in SQLite, so that a crawl picks up where the last one
+    stopped, whichever worker made it and across restarts.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+                                  subreddit TEXT PRIMARY KEY,
+                                  fullname TEXT NOT NULL,
+                                  created_utc REAL NOT NULL)""")
+
+    def get(self, subreddit):
+        """Get the checkpoint of a subreddit.
+
+        Returns:
+        dict: With 'fullname' and 'created_utc', or None if there is none
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT fullname, created_utc FROM checkpoints WHERE subreddit = ?",
+                                     (subreddit.lower(),)).fetchone()
+        if row is None:
+            return None
+
+        return {'fullname': row[0], 'created_utc': row[1]}
+
+    def set(self, subreddit, fullname, created_utc):
+        """Move the checkpoint of a subreddit forward, never backward."""
+        with self._connect() as connection:
+            connection.execute("""INSERT INTO checkpoints VALUES (?, ?, ?)
+                                  ON CONFLICT (subreddit) DO UPDATE
+                                  SET fullname = excluded.fullname, created_utc = excluded.created_utc
+                                  WHERE excluded.created_utc > checkpoints.created_utc""",
+                               (subreddit.lower(), fullname, created_utc))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+
+reddit_checkpoints = CheckpointStore(app.config.get('CHECKPOINT_DB',
+                                                    os.path.join(tempfile.gettempdir(), 'navcom-checkpoints.sqlite')))
@@ -0,0 +1,182 @@
+"""Bulk exports from the command line, without going through the web tier.
+
+    flask --app navcom_data_downloader export manifest.json --output-dir exports
+
+The manifest is a JSON list of items, each one export like those of
+the forms: a subreddit listing, one or many submissions, or a Twitter
+query with dates.
+
+    [{"subreddit": "dataisbeautiful", "kind": "new", "limit": 500},
+     {"submission_ids": ["7jgnxm", "7jgnxn"], "replies": true},
+     {"string": "giraffe", "start-date": "2020-08-15", "end-date": "2020-09-03", "max": 0}]
+
+Items may also choose their "columns", and a "name" for their file.
+They are exported on a pool of processes, which all draw from the
+same Reddit rate limit, see navcom_data_downloader.ratelimit.
+"""
+from navcom_data_downloader import app
+from navcom_data_downloader.jobs import Progress
+from navcom_data_downloader.ratelimit import Budget
+from navcom_data_downloader import formats, sources
+from concurrent.futures import ProcessPoolExecutor
+import click
+import json
+import os
+import re
+import shutil
+import tempfile
+
+# Formats whose files can be merged by concatenating them.
+MERGEABLE = ['csv', 'jsonl']
+
+
+def _source(item):
+    """Name of the source of a manifest item.
+
+    Raises:
+    KeyError: If the item is none of a subreddit, submissions or a query
+    """
+    if 'subreddit' in item or 'submission_id' in item or 'submission_ids' in item:
+        return 'reddit'
+    if 'string' in item:
+        return 'twitter'
+    raise KeyError(f"Not a subreddit, submissions or query: {item}")
+
+
+def _columns(item):
+    """The columns an item is exported with, checking them."""
+    source = sources.get(_source(item))
+    if _source(item) == 'reddit':
+        return source._export_columns(item.get('columns'), bool(item.get('replies')))
+    return source._chosen_columns(item.get('columns'))
+
+
+def _name(item):
+    """Name of the file of an item, without extension."""
+    if 'name' in item:
+        name = item['name']
+    elif 'subreddit' in item:
+        name = item['subreddit'] + '-' + item.get('kind', 'hot')
+    elif 'submission_id' in item:
+        name = item['submission_id']
+    elif 'submission_ids' in item:
+        name = f"submissions-{len(item['submission_ids'])}"
+    else:
+        name = item['string']
+    return re.sub(r'[^\w.-]+', '_', name)
+
+
+def _stream(item, progress, format, budget):
+    """The chunks of the export of a manifest item."""
+    columns = item.get('columns')
+    replies = bool(item.get('replies'))
+    if 'subreddit' in item:
+        kind = item.get('kind', 'hot')
+        options = {'limit': item['limit']} if 'limit' in item else {}
+        if kind == 'new' and item.get('incremental'):
+            options['incremental'] = True
+        stream = getattr(sources.get('reddit')(), 'stream_' + kind)
+        return stream(item['subreddit'], progress=progress, format=format, columns=columns,
+                      replies=replies, budget=budget, **options)
+    if 'submission_id' in item:
+        return sources.get('reddit')().stream_submission(
+            item['submission_id'], progress=progress, format=format, columns=columns,
+            replies=replies, budget=budget)
+    if 'submission_ids' in item:
+        return sources.get('reddit')().stream_submissions(
+            item['submission_ids'], progress=progress, format=format, columns=columns,
+            replies=replies, budget=budget)
+
+    query = {name: item[name] for name in ('string', 'start-date', 'end-date') if name in item}
+    return sources.get('twitter')().stream(query, max=item.get('max', 10), progress=progress,
+                                           format=format, columns=columns)
+
+
+def export_item(item, path, format='csv', calls=None, seconds=None):
+    """Export a manifest item to a file. Runs in a worker process.
+
+    The file is removed if the export fails.
+
+    Parameters:
+    item (dict): Manifest item
+    path (str): File to write
+    format (str): One of navcom_data_downloader.formats.FORMATS
+    calls (int): Max API calls for expanding comments, None for no limit
+    seconds (float): Max seconds for expanding comments, None for no limit
+
+    Returns:
+    dict: Progress of the export
+    """
+    progress = Progress()
+    try:
+        with open(path, 'wb') as f:
+            for chunk in _stream(item, progress, format, Budget(calls=calls, seconds=seconds)):
+                f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return progress.as_dict()
+
+
+def _merge(paths, output, format):
+    """Concatenate item files into one, with only the first CSV header."""
+    with open(output, 'wb') as merged:
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                if format == 'csv' and i:
+                    f.readline()
+                shutil.copyfileobj(f, merged)
+
+
+@app.cli.command('export')
+@click.argument('manifest', type=click.File())
+@click.option('--output-dir', default='.', type=click.Path(file_okay=False),
+              help="Directory to write a file per item to.")
+@click.option('--merge', type=click.Path(dir_okay=False),
+              help="Write all items to this one file instead, in the order of the manifest.")
+@click.option('--format', default='csv', type=click.Choice(list(formats.FORMATS)))
+@click.option('--processes', default=os.cpu_count(), type=int,
+              help="Number of worker processes, one per core by default.")
+@click.option('--calls', type=int, help="Max Reddit calls expanding comments, per item.")
+@click.option('--seconds', type=float, help="Max seconds expanding comments, per item.")
+def export(manifest, output_dir, merge, format, processes, calls, seconds):
+    """Export the subreddits, submissions and Twitter queries of a MANIFEST."""
+    items = json.load(manifest)
+    if format not in formats.available():
+        raise click.BadParameter(f"{format} needs pyarrow", param_hint='--format')
+    try:
+        columns = [_columns(item) for item in items]
+    except KeyError as e:
+        raise click.BadParameter(f"Unknown {e}", param_hint='MANIFEST')
+    if merge and format not in MERGEABLE:
+        raise click.BadParameter(f"Only {', '.join(MERGEABLE)} can be merged",
+                                 param_hint='--format')
+    if merge and any(c != columns[0] for c in columns):
+        raise click.BadParameter("Merged items need the same columns", param_hint='MANIFEST')
+
+    extension = formats.FORMATS[format][1]
+    directory = tempfile.mkdtemp(prefix='navcom-export-') if merge else output_dir
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f"{i + 1:03d}-{_name(item)}{extension}")
+             for i, item in enumerate(items)]
+
+    exported = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(export_item, item, path, format, calls, seconds)
+                   for item, path in zip(items, paths)]
+        for path, future in zip(paths, futures):
+            try:
+                progress = future.result()
+            except Exception as e:
+                click.echo(f"{os.path.basename(path)}: failed, {e!r}", err=True)
+            else:
+                exported.append(path)
+                click.echo(f"{os.path.basename(path)}: {progress['rows']} rows")
+
+    if merge:
+        _merge(exported, merge, format)
+        shutil.rmtree(directory)
+        click.echo(f"Merged {len(exported)} items into {merge}")
+    if len(exported) < len(items):
+        raise click.ClickException(f"{len(items) - len(exported)} of {len(items)} items failed")
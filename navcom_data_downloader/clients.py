@@ -0,0 +1,113 @@
+from navcom_data_downloader import app
+from navcom_data_downloader.ratelimit import reddit_scheduler
+from navcom_data_downloader import metrics
+from navcom_data_downloader.sources import lazy_import
+from config import RedditCredentials
+import threading
+import weakref
+
+praw = lazy_import('praw')
+
+
+class RedditClientPool():
+    """A process-wide pool of authenticated Reddit clients.
+
+    praw.Reddit is not safe to share between threads, so a thread
+    checks a client out on its first get, and keeps it for as long as
+    it lives. The client is then returned to the pool, for the next
+    thread to check out, so that short-lived threads such as those of
+    the development server do not each log in again. A reused client
+    keeps its OAuth token until it expires, and its HTTP session with
+    its keep-alive connections.
+    """
+    def __init__(self, factory=None):
+        self._factory = factory or self._new_client
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = []
+        self.clients = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self):
+        """Get the Reddit client of the calling thread, checking one out if it has none.
+
+        Returns:
+        praw.Reddit: An authenticated, possibly already used client
+        """
+        checkout = getattr(self._local, 'checkout', None)
+        if checkout is not None:
+            self._count('hits')
+            return checkout.client
+
+        with self._lock:
+            client = self._idle.pop() if self._idle else None
+        if client is not None:
+            self._count('hits')
+        else:
+            client = self._create()
+        checkout = _Checkout(client)
+        # The thread-local checkout goes away with the thread.
+        weakref.finalize(checkout, self._return, client)
+        self._local.checkout = checkout
+
+        return client
+
+    def stats(self):
+        """Report how well the pool is doing, as a dict."""
+        with self._lock:
+            return {'clients': self.clients,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'refreshes': self.refreshes}
+
+    def _create(self):
+        self._count('misses')
+        with metrics.stage_seconds.time(source='reddit', stage='client'):
+            client = self._factory()
+        self._count_refreshes(client)
+        with self._lock:
+            self.clients += 1
+        app.logger.debug("Created Reddit client %s of the pool", self.clients)
+
+        return client
+
+    def _return(self, client):
+        with self._lock:
+            self._idle.append(client)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _count_refreshes(self, client):
+        """Count token exchanges, which prawcore does lazily on expiry."""
+        authorizer = client._core._authorizer
+        refresh = authorizer.refresh
+
+        def counting_refresh():
+            self._count('refreshes')
+            app.logger.debug("Refreshing a Reddit access token")
+            return refresh()
+
+        authorizer.refresh = counting_refresh
+
+    def _new_client(self):
+        client = praw.Reddit(client_id=RedditCredentials.client_id,
+                             client_secret=RedditCredentials.client_secret,
+                             password=RedditCredentials.password,
+                             user_agent=RedditCredentials.user_agent,
+                             username=RedditCredentials.username)
+        reddit_scheduler.install(client)
+
+        return client
+
+
+class _Checkout():
+    """The client a thread checked out, returned once the thread is gone."""
+    def __init__(self, client):
+        self.client = client
+
+
+reddit_clients = RedditClientPool()
@@ -0,0 +1,80 @@
+"""Compressing exports while they stream.
+
+Exports are compressed a chunk at a time, so that a worker never holds
+more than a chunk of an export, compressed or not. Each chunk is
+flushed as it is compressed, so that clients get what is ready of an
+export without waiting for the rest. gzip is always there, zstd needs
+zstandard, which is optional.
+"""
+from navcom_data_downloader import app
+import importlib.util
+import zlib
+
+GZIP_LEVEL = app.config.get('GZIP_LEVEL', 6)
+ZSTD_LEVEL = app.config.get('ZSTD_LEVEL', 3)
+
+# Formats which are text, and compress well. Parquet is compressed
+# already, and Arrow is seldom worth it.
+COMPRESSIBLE = ['csv', 'jsonl']
+
+
+def available():
+    """Names of the encodings which can be used here, the preferred one first."""
+    names = ['gzip']
+    if importlib.util.find_spec('zstandard') is not None:
+        names.insert(0, 'zstd')
+    return names
+
+
+def negotiate(accept_encodings):
+    """The encoding to respond with, or None to respond uncompressed.
+
+    Parameters:
+    accept_encodings (werkzeug.datastructures.Accept): Those of the request
+    """
+    return accept_encodings.best_match(available())
+
+
+def compress(chunks, encoding):
+    """Compress chunks incrementally.
+
+    Parameters:
+    chunks (iterable): Chunks of str, encoded as UTF-8, or of bytes
+    encoding (str): One of available()
+
+    Returns:
+    generator: Chunks of compressed bytes
+    """
+    compressor, block = _compressor(encoding)
+    for chunk in chunks:
+        if chunk:
+            yield _compressed(compressor, block, chunk)
+    yield compressor.flush()
+
+
+async def acompress(chunks, encoding):
+    """Like compress, for an async iterable of chunks."""
+    compressor, block = _compressor(encoding)
+    async for chunk in chunks:
+        if chunk:
+            yield _compressed(compressor, block, chunk)
+    yield compressor.flush()
+
+
+def _compressor(encoding):
+    """A compressor for an encoding, and its mode for flushing a block."""
+    if encoding == 'gzip':
+        # wbits of 16 and more write a gzip header and trailer.
+        return (zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+                zlib.Z_SYNC_FLUSH)
+    if encoding == 'zstd':
+        import zstandard
+        return (zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(),
+                zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    raise KeyError(encoding)
+
+
+def _compressed(compressor, block, chunk):
+    # Flushing keeps the window, so later chunks still compress against earlier ones.
+    data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    return data + compressor.flush(block)
@@ -0,0 +1,55 @@
+"""Files kept by ID in a directory, replaced whole and named only by safe IDs.
+
+Jobs, kept exports and profiles are kept this way, and the disk cache
+is written this way too.
+"""
+import contextlib
+import os
+import re
+import tempfile
+
+
+@contextlib.contextmanager
+def replacing(path, mode='w'):
+    """Open a file to write in place of path, which it replaces once closed.
+
+    The file is written next to path and then renamed, so that no
+    process ever reads half of it.
+    """
+    fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(temp_filename, path)
+    except BaseException:
+        remove(temp_filename)
+        raise
+
+
+def checked_id(file_id, length):
+    """Check that an ID is length hex digits, like uuid4().hex or a SHA-256 digest.
+
+    IDs come from URLs, so only ever accept those in file names.
+
+    Raises:
+    ValueError: If the ID is anything else
+    """
+    if not re.fullmatch(f'[0-9a-f]{{{length}}}', file_id):
+        raise ValueError(file_id)
+    return file_id
+
+
+def ids(directory, suffix, length):
+    """The IDs of the files in a directory with a suffix, see checked_id."""
+    for name in os.listdir(directory):
+        file_id, extension = os.path.splitext(name)
+        if extension == suffix and re.fullmatch(f'[0-9a-f]{{{length}}}', file_id):
+            yield file_id
+
+
+def remove(path):
+    """Remove a file, if it is still there."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,194 @@
+"""Export formats, all serializing the same rows of projected columns.
+
+CSV and JSON Lines are text, and stream a chunk of rows at a time.
+Parquet and Arrow IPC need pyarrow, which is optional, and stream a
+record batch at a time.
+"""
+from navcom_data_downloader import app
+import datetime
+import csv
+import importlib.util
+import io
+import json
+import os
+
+# Rough size in characters of a streamed chunk of text.
+CHUNK_SIZE = 16 * 1024
+
+# Number of rows in a record batch of the columnar formats.
+BATCH_SIZE = app.config.get('EXPORT_BATCH_SIZE', 10000)
+
+# Format name: (mimetype, file extension)
+FORMATS = {'csv': ('text/csv', '.csv'),
+           'jsonl': ('application/x-ndjson', '.jsonl'),
+           'parquet': ('application/vnd.apache.parquet', '.parquet'),
+           'arrow': ('application/vnd.apache.arrow.stream', '.arrows')}
+
+
+def available():
+    """Names of the formats which can be served here."""
+    names = ['csv', 'jsonl']
+    if importlib.util.find_spec('pyarrow') is not None:
+        names += ['parquet', 'arrow']
+    return names
+
+
+def serialize(format, columns, rows, types=None, lineterminator=os.linesep):
+    """Serialize rows in a format.
+
+    Parameters:
+    format (str): One of FORMATS
+    columns (list): Names of the columns
+    rows (iterable): Lists of values, in the order of columns
+    types (dict): Column name to 'timestamp', 'int' or 'bool', others are strings
+    lineterminator (str): Line terminator of CSV
+
+    Returns:
+    generator: Chunks of str for text formats, bytes for the others
+    """
+    types = types or {}
+    if format == 'csv':
+        return iter_csv(columns, rows, lineterminator)
+    if format == 'jsonl':
+        return iter_jsonl(columns, rows, types)
+    if format == 'parquet':
+        return iter_parquet(columns, rows, types)
+    if format == 'arrow':
+        return iter_arrow(columns, rows, types)
+    raise KeyError(format)
+
+
+def iter_csv(columns, rows, lineterminator=os.linesep):
+    """Write rows as CSV, yielding the header and then chunks of roughly CHUNK_SIZE.
+
+    Formatted like pandas.DataFrame.to_csv, None being an empty field.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator=lineterminator)
+
+    writer.writerow(columns)
+    yield output.getvalue()
+    output.seek(0)
+    output.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        if output.tell() >= CHUNK_SIZE:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+
+    if output.tell():
+        yield output.getvalue()
+
+
+def iter_jsonl(columns, rows, types):
+    """Write rows as JSON objects, one per line, in chunks of roughly CHUNK_SIZE."""
+    chunk, size = [], 0
+    for row in rows:
+        line = json.dumps({column: _typed(value, types.get(column))
+                           for column, value in zip(columns, row)},
+                          default=str) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_parquet(columns, rows, types):
+    """Write rows as a Parquet file, one row group per batch."""
+    import pyarrow.parquet as pq
+    return _iter_columnar(columns, rows, types,
+                          lambda sink, schema: pq.ParquetWriter(sink, schema))
+
+
+def iter_arrow(columns, rows, types):
+    """Write rows in the Arrow IPC streaming format, batch by batch."""
+    import pyarrow as pa
+    return _iter_columnar(columns, rows, types, pa.ipc.new_stream)
+
+
+def _iter_columnar(columns, rows, types, new_writer):
+    import pyarrow as pa
+
+    schema = pa.schema([(column, _arrow_type(types.get(column))) for column in columns])
+    sink = _Drain()
+    writer = new_writer(sink, schema)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            writer.write_batch(_record_batch(batch, schema, types))
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        writer.write_batch(_record_batch(batch, schema, types))
+    writer.close()
+    yield sink.drain()
+
+
+def _record_batch(rows, schema, types):
+    import pyarrow as pa
+
+    arrays = [pa.array([_typed(value, types.get(field.name), arrow=True) for value in values],
+                       type=field.type)
+              for field, values in zip(schema, zip(*rows))]
+    return pa.record_batch(arrays, schema=schema)
+
+
+def _arrow_type(kind):
+    import pyarrow as pa
+
+    return {'timestamp': pa.timestamp('us', tz='UTC'),
+            'int': pa.int64(),
+            'bool': pa.bool_()}.get(kind, pa.string())
+
+
+def _typed(value, kind, arrow=False):
+    """Convert a value to its column type, for JSON or else for Arrow."""
+    if value is None:
+        return None
+    if kind == 'timestamp':
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+        return value if arrow else value.isoformat()
+    if kind == 'int':
+        return int(value)
+    if kind == 'bool':
+        return bool(value)
+    if arrow:
+        return str(value)
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
+
+
+class _Drain():
+    """A write-only file which hands over what is written to it."""
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,178 @@
+from navcom_data_downloader import app, files
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+
+class Progress():
+    """Counters of how far an export has come."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submissions = 0
+        self.comments = 0
+        self.rows = 0
+        self.incomplete = 0
+
+    def count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def follow(self, other):
+        """Take the counts of another export, the one this export is streamed from."""
+        counts = other.as_dict()
+        with self._lock:
+            for counter, n in counts.items():
+                setattr(self, counter, n)
+
+    def as_dict(self):
+        with self._lock:
+            return {'submissions': self.submissions,
+                    'comments': self.comments,
+                    'rows': self.rows,
+                    'incomplete': self.incomplete}
+
+
+class JobQueue():
+    """Run exports in the background on a pool of worker threads.
+
+    The status and output of each job are kept as files in a
+    directory, so that any web worker on the host can report on a job
+    and serve its output, no matter which one runs it. Finished jobs
+    are kept for retention seconds. The progress of a running job is
+    saved at most every save_interval seconds, not after every chunk.
+
+    Jobs run in the process which queued them, so each web worker
+    process runs up to workers of them at once, and a job is lost
+    along with its process. The statuses of the jobs of a process are
+    saved again every tenth of stale_after seconds while it has any,
+    and a job whose status was not saved for stale_after seconds is
+    reported failed, and removed like a finished one.
+    """
+    def __init__(self, directory, workers, retention=24 * 60 * 60, save_interval=1,
+                 stale_after=10 * 60):
+        self.directory = directory
+        self.retention = retention
+        self.save_interval = save_interval
+        self.stale_after = stale_after
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='export-job')
+        # Statuses of the jobs of this process not finished yet, by ID.
+        self._live = {}
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def submit(self, export, filename, mimetype='text/csv'):
+        """Queue an export.
+
+        Parameters:
+        export (callable): Called with a Progress in the worker thread,
+        returns the chunks of the export
+        filename (str): Name of the file to download as
+        mimetype (str): Type of the file to download as
+
+        Returns:
+        str: ID of the job
+        """
+        job_id = uuid.uuid4().hex
+        status = {'id': job_id, 'status': 'queued', 'filename': filename,
+                  'mimetype': mimetype, 'progress': Progress().as_dict()}
+        self._save(status)
+        with self._lock:
+            self._live[job_id] = status
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='export-job-heartbeat',
+                                                   daemon=True)
+                self._heartbeat.start()
+        self._executor.submit(self._run, export, status)
+        app.logger.debug("Queued export job %s for %s", job_id, filename)
+
+        return job_id
+
+    def status(self, job_id):
+        """Get the status of a job as a dict, or None if there is no such job."""
+        path = self._path(job_id, '.json')
+        try:
+            with open(path) as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        updated = status.get('updated', 0)
+        if 'expires' not in status and updated + self.stale_after < time.time():
+            status.update(status='failed', error="Lost along with the process running it",
+                          expires=updated + self.stale_after + self.retention)
+        if status.get('expires', float('inf')) < time.time():
+            return None
+
+        return status
+
+    def output(self, job_id):
+        """Get the path of the output file of a job."""
+        return self._path(job_id, '.out')
+
+    def _run(self, export, status):
+        progress = Progress()
+        self._save(status, status='running')
+        saved = time.monotonic()
+        try:
+            with open(self.output(status['id']), 'wb') as f:
+                for chunk in export(progress):
+                    f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                    if time.monotonic() - saved >= self.save_interval:
+                        self._save(status, progress=progress.as_dict())
+                        saved = time.monotonic()
+        except Exception as e:
+            app.logger.exception("Export job %s failed", status['id'])
+            finished = {'status': 'failed', 'error': repr(e)}
+        else:
+            finished = {'status': 'done'}
+        with self._lock:
+            del self._live[status['id']]
+        self._evict()
+        self._save(status, progress=progress.as_dict(), expires=time.time() + self.retention,
+                   **finished)
+
+    def _beat(self):
+        """Save the statuses of the jobs of this process while it has any."""
+        while True:
+            time.sleep(self.stale_after / 10)
+            with self._lock:
+                live = list(self._live.values())
+                if not live:
+                    self._heartbeat = None
+                    return
+            try:
+                for status in live:
+                    self._save(status)
+                self._evict()
+            except OSError:
+                app.logger.warning("Could not save the statuses of export jobs", exc_info=True)
+
+    def _save(self, job, **changes):
+        """Change the status of a job, and save it along with when, as a heartbeat."""
+        with self._lock:
+            job.update(changes, updated=time.time())
+            with files.replacing(self._path(job['id'], '.json')) as f:
+                json.dump(job, f)
+
+    def _evict(self):
+        """Remove the jobs finished, or lost, longer than the retention ago."""
+        for job_id in list(files.ids(self.directory, '.json', 32)):
+            if self.status(job_id) is None:
+                for suffix in ('.json', '.out'):
+                    files.remove(self._path(job_id, suffix))
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.directory, files.checked_id(job_id, 32) + suffix)
+
+
+export_jobs = JobQueue(app.config.get('JOBS_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'navcom-jobs')),
+                       app.config.get('JOB_WORKERS', 2),
+                       app.config.get('JOB_RETENTION', 24 * 60 * 60),
+                       app.config.get('JOB_SAVE_INTERVAL', 1),
+                       app.config.get('JOB_STALE_AFTER', 10 * 60))
@@ -0,0 +1,137 @@
+"""Timing metrics in the Prometheus text format.
+
+Metrics are kept per process, so with several workers each scrape of
+/metrics sees the worker which happened to answer it.
+"""
+from navcom_data_downloader import app
+from flask import request
+import bisect
+import contextlib
+import threading
+import time
+
+
+class Histogram():
+    """A Prometheus histogram with labels."""
+    def __init__(self, name, help, labelnames, buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, (counts, total) in series:
+            labels = ','.join(f'{name}="{_escape(value)}"'
+                              for name, value in zip(self.labelnames, key))
+            separator = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Stopwatch():
+    """Wrap an iterable, adding up the seconds spent getting its items."""
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+class MetricsMiddleware():
+    """Observe the latency and payload size of each response, streamed ones to the end."""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        body = self.wsgi_app(environ, start_response)
+        try:
+            size = 0
+            for chunk in body:
+                size += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            route = environ.get('navcom.route', 'unmatched')
+            request_seconds.observe(time.perf_counter() - start, route=route)
+            response_bytes.observe(size, route=route)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def expose(stats=None):
+    """All metrics in the Prometheus text format.
+
+    Parameters:
+    stats (dict): Name to dict of numbers, exposed as gauges
+    """
+    lines = []
+    for histogram in (stage_seconds, request_seconds, response_bytes):
+        lines += histogram.expose()
+    for name, values in (stats or {}).items():
+        for key, value in values.items():
+            metric = f"navcom_{name}_{key}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {float(value)}"]
+    return '\n'.join(lines) + '\n'
+
+
+stage_seconds = Histogram('navcom_stage_seconds',
+                          "Seconds spent in a stage of an export.",
+                          ['source', 'kind', 'stage'],
+                          [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300])
+request_seconds = Histogram('navcom_request_seconds',
+                            "Seconds from request to the end of the response.",
+                            ['route'],
+                            [0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600])
+response_bytes = Histogram('navcom_response_bytes',
+                           "Size of response bodies.",
+                           ['route'],
+                           [1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3])
+
+
+@app.before_request
+def _label_route():
+    """Label requests by their URL rule, so that job IDs do not make new series."""
+    if request.url_rule is not None:
+        request.environ['navcom.route'] = request.url_rule.rule
+
+
+app.wsgi_app = MetricsMiddleware(app.wsgi_app)
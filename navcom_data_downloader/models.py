@@ -1,15 +1,85 @@
 from navcom_data_downloader import app
-from config import RedditCredentials, RedditConfig
+from navcom_data_downloader.clients import reddit_clients
+from navcom_data_downloader.cache import response_cache
+from navcom_data_downloader.jobs import Progress
+from navcom_data_downloader.checkpoints import reddit_checkpoints
+from navcom_data_downloader.warehouse import warehouse
+from navcom_data_downloader.ratelimit import reddit_scheduler, INTERACTIVE, Budget
+from navcom_data_downloader import formats, metrics, profiling
+from navcom_data_downloader.sources import lazy_import
+from config import RedditConfig
 import warnings
-import praw
-import pandas as pd
-import GetOldTweets3 as got
-import csv
-import io
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import contextvars
+import datetime
+import queue
+import threading
+
+praw = lazy_import('praw')
+got = lazy_import('GetOldTweets3')
+
+# Comment trees are expanded on a bounded pool shared by all requests,
+# with at most EXPANSION_WINDOW submissions of a listing in flight.
+EXPANSION_WORKERS = app.config.get('REDDIT_EXPANSION_WORKERS', 4)
+EXPANSION_WINDOW = 2 * EXPANSION_WORKERS
+expansions = ThreadPoolExecutor(max_workers=EXPANSION_WORKERS,
+                                thread_name_prefix='reddit-expansion')
+# Max calls replacing MoreComments of a submission of a listing, as
+# praw's replace_more does by default.
+MORE_COMMENTS_LIMIT = 32
+
+# Tweets are handed over from GetOldTweets3 in pages of TWEET_PAGE_SIZE,
+# with at most TWEET_PAGES_AHEAD pages waiting to be written.
+TWEET_PAGE_SIZE = app.config.get('TWITTER_PAGE_SIZE', 100)
+TWEET_PAGES_AHEAD = 4
+
+
+# Queries over long date ranges are split into windows of TWEET_WINDOW_DAYS,
+# scraped concurrently on a bounded pool shared by all requests.
+TWEET_WINDOW_DAYS = app.config.get('TWITTER_WINDOW_DAYS', 1)
+TWEET_WINDOW_WORKERS = app.config.get('TWITTER_WINDOW_WORKERS', 4)
+tweet_windows = ThreadPoolExecutor(max_workers=TWEET_WINDOW_WORKERS,
+                                   thread_name_prefix='twitter-window')
+
+
+# Submissions kept in the warehouse are reused for exports while younger
+# than WAREHOUSE_MAX_AGE seconds, as their comments go on changing.
+WAREHOUSE_MAX_AGE = app.config.get('WAREHOUSE_MAX_AGE', 24 * 60 * 60)
+
+
+class _Stopped(Exception):
+    """Raised in GetOldTweets3 to stop it, when nobody reads the tweets anymore."""
+
+
+def _timed_serialization(source, kind, items, serialize):
+    """Serialize items, observing the time spent serializing them.
+
+    Time spent getting the items, from Reddit say, is not counted.
+    """
+    upstream = metrics.Stopwatch(items)
+    chunks = metrics.Stopwatch(serialize(upstream))
+    yield from chunks
+    metrics.stage_seconds.observe(chunks.elapsed - upstream.elapsed,
+                                  source=source, kind=kind, stage='serialize')
+
+
+class _Kept():
+    """A submission, comment or tweet from the warehouse, with the fields it was kept with."""
+    def __init__(self, fields):
+        vars(self).update(fields)
+
+    @property
+    def fullname(self):
+        return self.name
 
 
 class DataSource():
     """An \"abstract\" datasource. Inherit from this."""
+    # Columns exported by default, and further ones which can be chosen.
+    columns = []
+    more_columns = []
+
     def __init__(self):
         app.logger.debug(f"Generic DataSource instantiated")
 
@@ -20,64 +90,320 @@ class DataSource():
     def _as_csv(self, data):
         ...
 
+    @classmethod
+    def all_columns(cls):
+        """All the columns which can be chosen, the default ones first."""
+        return cls.columns + cls.more_columns
+
+    @classmethod
+    def _chosen_columns(cls, columns=None):
+        """The chosen columns, or the default ones if none are.
+
+        Raises:
+        KeyError: If a column is not one of all_columns
+        """
+        if not columns:
+            return cls.columns
+        for column in columns:
+            if column not in cls.all_columns():
+                raise KeyError(column)
+        return list(columns)
+
 
 class TwitterDataSource(DataSource):
     """Model for a Twitter datasource."""
+    # Output columns, and the types of those which are not strings.
+    columns = ['id', 'permalink', 'username', 'text',
+               'date', 'retweets', 'hashtags']
+    more_columns = ['to', 'favorites', 'replies', 'mentions', 'geo', 'urls', 'author_id']
+    types = {'date': 'timestamp', 'retweets': 'int', 'favorites': 'int',
+             'replies': 'int', 'author_id': 'int'}
+
     def __init__(self):
         super().__init__()
         app.logger.debug(f"  ... as a Twitter DataSource instantiated")
 
     def query(self, query, max=10):
         app.logger.debug(f"Querying Twitter for '{query}'")
-        tweets = self._query(query, max=max)
-        output = self._as_csv(tweets)
-        return output
+        return ''.join(self.stream(query, max=max))
+
+    def stream(self, query, max=10, progress=None, format='csv', columns=None):
+        """Query Twitter, yielding the result as chunks of CSV or another format.
+
+        Results are cached, see navcom_data_downloader.cache.
+
+        Parameters:
+        query (dict): Query with 'string' and optional 'start-date', 'end-date'
+        max (int): Max number of tweets to get, 0 for no limit
+        progress (Progress): Counters to update, optional
+        format (str): One of navcom_data_downloader.formats.FORMATS
+        columns (list): Columns to export, of all_columns, the default ones if None
+
+        Returns:
+        generator: Chunks of the export
+        """
+        app.logger.debug(f"Streaming Twitter for '{query}'")
+        columns = self._chosen_columns(columns)
+        key = response_cache.key('twitter', max=max, format=format, columns=','.join(columns), **{
+            'string': query['string'],
+            'start-date': query.get('start-date'),
+            'end-date': query.get('end-date')})
+        chunks = self._serialize(self._iter_tweets(query, max=max), progress, format, 'query',
+                                 columns)
+        return response_cache.stream('twitter', key, chunks, progress)
+
+    def _iter_tweets(self, query, max=10):
+        """Yield up to max tweets, newest first, within the dates of the query.
+
+        A query over more than one window is scraped a window at a time,
+        concurrently, and so is any query with both dates when there is
+        a warehouse, so that windows it covers are not scraped again.
+        Twitter sometimes answers with tweets from outside the dates,
+        and with a tweet twice, so those are left out.
+        """
+        since, until = self._dates(query)
+        windows = self._windows(query)
+        if len(windows) > 1 or (warehouse is not None and since and until):
+            tweets = self._iter_windows(windows, max)
+        else:
+            tweets = self._iter_query(query, max=max)
+
+        seen = set()
+        for tweet in tweets:
+            date = tweet.date.date()
+            if (since and date < since) or (until and date >= until) or tweet.id in seen:
+                continue
+            seen.add(tweet.id)
+            yield tweet
+            if len(seen) == max:
+                break
+
+    def _iter_windows(self, windows, max=10):
+        """Scrape windows concurrently, but yield their tweets newest window first."""
+        pending = collections.deque()
+        try:
+            for window in windows:
+                context = contextvars.copy_context()
+                pending.append((window, tweet_windows.submit(context.run, profiling.run,
+                                                             self._query_window, window, max)))
+                if len(pending) >= 2 * TWEET_WINDOW_WORKERS:
+                    window, future = pending.popleft()
+                    yield from self._windowed(window, future.result())
+            while pending:
+                window, future = pending.popleft()
+                yield from self._windowed(window, future.result())
+        finally:
+            for window, future in pending:
+                future.cancel()
+
+    def _windowed(self, window, tweets):
+        """The tweets of a window which are within it, newest first."""
+        since, until = self._dates(window)
+        tweets = [tweet for tweet in tweets if since <= tweet.date.date() < until]
+        return sorted(tweets, key=lambda tweet: tweet.date, reverse=True)
+
+    def _query_window(self, window, max=10):
+        """Get the tweets of a window, from the warehouse if it covers the window.
+
+        Scraped windows are kept in the warehouse, and count as covered
+        once they are over and were not cut short by max.
+        """
+        if warehouse is None:
+            return self._query(window, max=max)
+
+        string, since, until = window['string'], window['start-date'], window['end-date']
+        kept = warehouse.get_tweets(string, since, until)
+        if kept is not None:
+            return [self._unkept(fields) for fields in kept]
+
+        tweets = self._query(window, max=max)
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        covered = (not max or len(tweets) < max) and self._dates(window)[1] <= today
+        kept = [self._kept(tweet) for tweet in self._windowed(window, tweets)]
+        warehouse.put_tweets(string, since, until, kept, covered)
+        return tweets
+
+    @classmethod
+    def _kept(cls, tweet):
+        """The fields of a tweet to keep in the warehouse, the date as a timestamp."""
+        fields = vars(tweet)
+        kept = {column: fields.get(column) for column in cls.all_columns()}
+        kept['date'] = tweet.date.timestamp()
+        return kept
+
+    @staticmethod
+    def _unkept(fields):
+        """A tweet kept in the warehouse, the date back as a datetime."""
+        date = datetime.datetime.fromtimestamp(fields['date'], datetime.timezone.utc)
+        return _Kept({**fields, 'date': date})
+
+    @staticmethod
+    def _dates(query):
+        """The start and end dates of a query, or None, as datetime.date."""
+        return [datetime.date.fromisoformat(query[name]) if query.get(name) else None
+                for name in ('start-date', 'end-date')]
+
+    @classmethod
+    def _windows(cls, query):
+        """Split a query into queries of TWEET_WINDOW_DAYS, newest first.
+
+        Queries without both dates are not split. The end date is not
+        included, like with Twitter's until.
+        """
+        since, until = cls._dates(query)
+        if since is None or until is None:
+            return [query]
+
+        step = datetime.timedelta(days=TWEET_WINDOW_DAYS)
+        windows = []
+        while until > since:
+            start = max(since, until - step)
+            windows.append({**query, 'start-date': start.isoformat(),
+                            'end-date': until.isoformat()})
+            until = start
+
+        return windows or [query]
+
+    def _iter_query(self, query, max=10):
+        """Yield tweets page by page, as GetOldTweets3 scrapes them.
+
+        The scraping runs on a thread of its own, which waits while
+        TWEET_PAGES_AHEAD pages are not yet consumed, and stops when
+        the generator is closed.
+        """
+        pages = queue.Queue(maxsize=TWEET_PAGES_AHEAD)
+        stopped = threading.Event()
+        done = object()
+
+        def put(page):
+            while not stopped.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def receive(tweets):
+            if not put(list(tweets)):
+                raise _Stopped()
+
+        def scrape():
+            try:
+                self._query(query, max=max, receive=receive)
+            except _Stopped:
+                return
+            except Exception as e:
+                put([e])
+            else:
+                put([done])
+
+        threading.Thread(target=scrape, name='twitter-query', daemon=True).start()
+        try:
+            while True:
+                for tweet in pages.get():
+                    if tweet is done:
+                        return
+                    if isinstance(tweet, Exception):
+                        raise tweet
+                    yield tweet
+        finally:
+            stopped.set()
+
+    def _query(self, query, max=10, receive=None):
+        """Get tweets, all at once or page by page.
+
+        Parameters:
+        query (dict): Query with 'string' and optional 'start-date', 'end-date'
+        max (int): Max number of tweets to get, 0 for no limit
+        receive (callable): Called with each page of tweets, optional
 
-    def _query(self, query, max=10):
+        Returns:
+        list: All the tweets
+        """
         twitter_query = got.manager.TweetCriteria()
         # Twitter won't accept empty query but will return 400 Bad Request.
         twitter_query.setQuerySearch(query['string'])
-        if 'start-date' in query:
+        if query.get('start-date'):
             twitter_query.setSince(query['start-date'])
-        if 'end-date' in query:
+        if query.get('end-date'):
             twitter_query.setUntil(query['end-date'])
         twitter_query.setMaxTweets(max)
 
-        tweets = got.manager.TweetManager.getTweets(twitter_query)
+        with metrics.stage_seconds.time(source='twitter', kind='query', stage='get_tweets'):
+            tweets = got.manager.TweetManager.getTweets(twitter_query, receiveBuffer=receive,
+                                                        bufferLength=TWEET_PAGE_SIZE)
         app.logger.debug(tweets)
 
         return tweets
 
     def _as_csv(self, tweets):
         """Format whatever comes out from the source as CSV."""
-        cols = ['id', 'permalink', 'username', 'text',
-                'date', 'retweets', 'hashtags']
-        output = io.StringIO()
-        dict_writer = csv.DictWriter(output, cols, extrasaction='ignore')
+        return ''.join(self._iter_csv(tweets))
 
-        dict_writer.writeheader()
-        for tweet in tweets:
-            dict_writer.writerow(tweet.__dict__)
+    def _iter_csv(self, tweets, progress=None):
+        """Format tweets as CSV, yielding the header and then chunks of rows."""
+        return self._serialize(tweets, progress)
 
-        output_str = output.getvalue()
+    def _serialize(self, tweets, progress=None, format='csv', kind='', columns=None):
+        """Format tweets, see navcom_data_downloader.formats.serialize."""
+        columns = columns or self.columns
 
-        return output_str
+        def serialize(tweets):
+            rows = self._iter_rows(tweets, progress, columns)
+            # Lines end in \r\n, like they always did with csv.DictWriter.
+            return formats.serialize(format, columns, rows, self.types,
+                                     lineterminator='\r\n')
+
+        return _timed_serialization('twitter', kind, tweets, serialize)
+
+    def _iter_rows(self, tweets, progress=None, columns=None):
+        """Project tweets to rows of the output columns."""
+        progress = progress or Progress()
+        columns = columns or self.columns
+        for tweet in tweets:
+            fields = vars(tweet)
+            progress.count('rows')
+            yield [fields.get(column) for column in columns]
 
 
 class RedditDataSource(DataSource):
     """Model for Reddit datasource.
 
     Using the PRAW library. Warnings about unclosed SSL connections
-    are ignored.
+    are ignored. The praw.Reddit client comes from the process-wide
+    pool, so its token and connections outlive the instance, and is
+    that of the thread using it, see reddit.
     """
+    # Output columns, the praw fields they come from when named
+    # differently, and the types of those which are not strings.
+    # The complete column, which can be chosen, tells the submissions
+    # whose comments were cut short, by the budget or by failures.
+    columns = ['header', 'comments', 'author', 'created_utc', 'edited',
+               'score', 'is_submitter', 'parent_id', 'stickied']
+    more_columns = ['id', 'permalink', 'num_comments', 'depth', 'link_id', 'subreddit', 'url',
+                    'complete']
+    renamed = {'header': 'title', 'comments': 'body'}
+    types = {'created_utc': 'timestamp', 'score': 'int',
+             'is_submitter': 'bool', 'stickied': 'bool',
+             'num_comments': 'int', 'depth': 'int', 'complete': 'bool'}
+    # Columns which only comments have. Exports without any of them
+    # have a row per submission, and do not fetch the comments.
+    comment_columns = ['comments', 'is_submitter', 'parent_id', 'depth', 'link_id']
+
     def __init__(self):
         super().__init__()
         app.logger.debug(f"  ... as a Reddit DataSource instantiated")
-        self.reddit = praw.Reddit(client_id=RedditCredentials.client_id,
-                                  client_secret=RedditCredentials.client_secret,
-                                  password=RedditCredentials.password,
-                                  user_agent=RedditCredentials.user_agent,
-                                  username=RedditCredentials.username)
+
+    @property
+    def reddit(self):
+        """The praw.Reddit client of the calling thread.
+
+        Not kept by the instance, since the chunks of an export may be
+        made on another thread than the one which made the source, such
+        as the producer of a flight, see navcom_data_downloader.cache.
+        """
+        return reddit_clients.get()
 
     def get_submission(self, submission_id):
         """Get a table of comments of a single submission.
@@ -88,18 +414,146 @@ class RedditDataSource(DataSource):
         Returns:
         str: String representation as CSV
         """
-        submission = self._get_submission(submission_id)
-        return self._as_csv([submission])
+        return ''.join(self.stream_submission(submission_id))
+
+    def stream_submission(self, submission_id, progress=None, format='csv', columns=None,
+                          replies=False, budget=None):
+        """Get comments of a single submission as chunks of CSV or another format.
 
-    def _get_submission(self, submission_id):
-        """Get an individual submission and its comments."""
-        with warnings.catch_warnings():
+        Parameters:
+        submission_id (str): ID of Reddit submission to get
+        progress (Progress): Counters to update, optional
+        format (str): One of navcom_data_downloader.formats.FORMATS
+        columns (list): Columns to export, of all_columns, the default ones if None
+        replies (bool): Whether to export replies too, at any depth, not only top-level comments
+        budget (Budget): API calls and seconds for expanding comments, unlimited if None
+
+        Returns:
+        generator: Chunks of the export
+        """
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', submission_id=submission_id, format=format,
+                                 columns=','.join(columns), replies=replies or None)
+        submissions = self._iter_submission(submission_id, progress,
+                                            comments=self._per_comment(columns), budget=budget)
+        chunks = self._serialize(submissions, progress, format, 'submission', columns, replies)
+        return response_cache.stream('reddit', key, chunks, progress)
+
+    def _iter_submission(self, submission_id, progress=None, comments=True, budget=None):
+        progress = progress or Progress()
+        with reddit_scheduler.priority(INTERACTIVE):
+            submission = self._get_submission(submission_id, comments=comments, budget=budget)
+        progress.count('submissions')
+        if comments:
+            progress.count('comments', len(submission.comments))
+            if not submission.complete:
+                progress.count('incomplete')
+        yield submission
+
+    def _get_submission(self, submission_id, comments=True, budget=None):
+        """Get an individual submission, and its comments unless asked not to.
+
+        Whether all of its comments were retrieved within the budget is
+        recorded as its complete field. A submission in the warehouse is
+        not retrieved again. Without its comments, it is got by info,
+        which leaves them out.
+
+        Raises:
+        KeyError: If there is no such submission, when getting it without comments
+        """
+        kept = self._from_warehouse(submission_id)
+        if kept is not None:
+            return kept
+
+        budget = budget or Budget()
+        with metrics.stage_seconds.time(source='reddit', kind='submission', stage='expand'), \
+                warnings.catch_warnings():
             warnings.simplefilter('ignore')
-            submission = self.reddit.submission(id=submission_id)
-            submission.comments.replace_more(limit=RedditConfig.comment_limit)
+            if comments:
+                submission = self.reddit.submission(id=submission_id)
+                budget.expect(1)
+                skipped = submission.comments.replace_more(
+                    limit=budget.allowance(RedditConfig.comment_limit))
+                budget.spend()
+                submission.complete = not skipped
+                self._to_warehouse(submission)
+            else:
+                submission = next(self.reddit.info(fullnames=['t3_' + submission_id]), None)
+                if submission is None:
+                    raise KeyError(submission_id)
 
         return submission
 
+    def get_submissions(self, submission_ids):
+        """Get a table of comments of many submissions.
+
+        Parameters:
+        submission_ids (list): IDs of Reddit submissions to get
+
+        Returns:
+        str: String representation as CSV
+        """
+        return ''.join(self.stream_submissions(submission_ids))
+
+    def stream_submissions(self, submission_ids, progress=None, format='csv', columns=None,
+                           replies=False, budget=None):
+        """Get comments of many submissions as one export, in chunks of CSV or another format.
+
+        Their comment trees are expanded concurrently, like those of a
+        listing, a call per submission. Without any comment_columns, the
+        submissions are looked up in batches of 100 instead, a call per
+        batch. Submissions which cannot be found are left out. Results
+        are cached, see navcom_data_downloader.cache.
+
+        Parameters:
+        submission_ids (list): IDs of Reddit submissions to get, with or without t3_
+        progress (Progress): Counters to update, optional
+        format (str): One of navcom_data_downloader.formats.FORMATS
+        columns (list): Columns to export, of all_columns, the default ones if None
+        replies (bool): Whether to export replies too, at any depth, not only top-level comments
+        budget (Budget): API calls and seconds for expanding comments, unlimited if None
+
+        Returns:
+        generator: Chunks of the export
+        """
+        app.logger.debug(f"Querying Reddit for {len(submission_ids)} submissions")
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', submission_ids=','.join(submission_ids),
+                                 format=format, columns=','.join(columns), replies=replies or None)
+        submissions = self._iter_submissions(submission_ids, progress,
+                                             comments=self._per_comment(columns), budget=budget)
+        chunks = self._serialize(submissions, progress, format, 'submissions', columns, replies)
+        return response_cache.stream('reddit', key, chunks, progress)
+
+    def _iter_submissions(self, submission_ids, progress=None, comments=True, budget=None):
+        """Yield submissions by ID, comments expanded unless asked not to, in the given order.
+
+        With comments, each submission is fetched along with them by
+        _expand, so they are not looked up before. Without, they are
+        looked up by info.
+        """
+        progress = progress or Progress()
+        budget = budget or Budget()
+        budget.expect(len(submission_ids))
+        ids = [id[3:] if id.startswith('t3_') else id for id in submission_ids]
+        if comments:
+            # Lazy submissions, which fetch nothing until _expand does.
+            lookup = metrics.Stopwatch(self.reddit.submission(id=id) for id in ids)
+        else:
+            fullnames = ['t3_' + id for id in ids]
+            lookup = metrics.Stopwatch(self._iter_listing(self.reddit.info(fullnames=fullnames)))
+        found = 0
+        for submission in self._iter_expanded(lookup, 'submissions', progress, comments, budget):
+            found += 1
+            yield submission
+
+        metrics.stage_seconds.observe(lookup.elapsed, source='reddit', kind='submissions',
+                                      stage='lookup')
+        if found < len(ids):
+            app.logger.info("Found %s of %s submissions", found, len(ids))
+
     def get_hot(self, subreddit, limit=RedditConfig.limit):
         """Get a table of comments of hot submissions from a subreddit.
 
@@ -110,10 +564,31 @@ class RedditDataSource(DataSource):
         Returns:
         str: String representation as CSV
         """
-        app.logger.debug(f"Querying Reddit for hot in {subreddit}")
-        submissions = self._query(subreddit, 'hot', limit=limit)
+        return ''.join(self.stream_hot(subreddit, limit=limit))
+
+    def stream_hot(self, subreddit, limit=RedditConfig.limit, progress=None,
+                   format='csv', columns=None, replies=False, budget=None):
+        """Get comments of hot submissions from a subreddit as chunks of CSV or another format.
+
+        Submissions are serialized as they are fetched, so the first
+        chunk is available before the whole listing is resolved. Results
+        are cached, see navcom_data_downloader.cache.
+
+        Parameters:
+        subreddit (str): Subreddit to get from
+        limit (int): Max number of submissions to get
+        progress (Progress): Counters to update, optional
+        format (str): One of navcom_data_downloader.formats.FORMATS
+        columns (list): Columns to export, of all_columns, the default ones if None
+        replies (bool): Whether to export replies too, at any depth, not only top-level comments
+        budget (Budget): API calls and seconds for expanding comments, unlimited if None
 
-        return self._as_csv(submissions)
+        Returns:
+        generator: Chunks of the export
+        """
+        app.logger.debug(f"Querying Reddit for hot in {subreddit}")
+        return self._stream_listing(subreddit, 'hot', limit, progress, format, columns, replies,
+                                    budget)
 
     def get_new(self, subreddit, limit=RedditConfig.limit):
         """Get a table of comments of new submissions from a subreddit.
@@ -125,16 +600,111 @@ class RedditDataSource(DataSource):
         Returns:
         str: String representation as CSV
         """
-        app.logger.debug("Querying Reddit for new in {subreddit}")
-        submissions = self._query(subreddit, 'new', limit=limit)
+        return ''.join(self.stream_new(subreddit, limit=limit))
+
+    def stream_new(self, subreddit, limit=RedditConfig.limit, progress=None,
+                   format='csv', incremental=False, columns=None, replies=False,
+                   budget=None):
+        """Get comments of new submissions from a subreddit as chunks of CSV or another format.
+
+        An incremental crawl gets only the submissions newer than those
+        of the previous incremental crawl of the subreddit, however many
+        there are. The first one gets limit submissions. Incremental
+        crawls are not cached.
+
+        Parameters:
+        subreddit (str): Subreddit to get from
+        limit (int): Max number of submissions to get
+        progress (Progress): Counters to update, optional
+        format (str): One of navcom_data_downloader.formats.FORMATS
+        incremental (bool): Whether to crawl incrementally
+        columns (list): Columns to export, of all_columns, the default ones if None
+        replies (bool): Whether to export replies too, at any depth, not only top-level comments
+        budget (Budget): API calls and seconds for expanding comments, unlimited if None
+
+        Returns:
+        generator: Chunks of the export
+        """
+        app.logger.debug(f"Querying Reddit for new in {subreddit}")
+        if incremental:
+            columns = self._export_columns(columns, replies)
+            submissions = self._iter_incremental(subreddit, limit, progress,
+                                                 comments=self._per_comment(columns),
+                                                 budget=budget)
+            return self._serialize(submissions, progress, format, 'new', columns, replies)
 
-        return self._as_csv(submissions)
+        return self._stream_listing(subreddit, 'new', limit, progress, format, columns, replies,
+                                    budget)
 
     def get_top(self, subreddit, limit=RedditConfig.limit):
         raise NotImplementedError
 
+    def stream_top(self, subreddit, limit=RedditConfig.limit, progress=None,
+                   format='csv', columns=None, replies=False, budget=None):
+        raise NotImplementedError
+
+
+    def _stream_listing(self, subreddit, kind, limit, progress, format, columns=None,
+                        replies=False, budget=None):
+        progress = progress or Progress()
+        columns = self._export_columns(columns, replies)
+        key = response_cache.key('reddit', subreddit=subreddit.lower(), kind=kind,
+                                 limit=limit, format=format, columns=','.join(columns),
+                                 replies=replies or None)
+        submissions = self._iter_query(subreddit, kind, limit=limit, progress=progress,
+                                       comments=self._per_comment(columns), budget=budget)
+        chunks = self._serialize(submissions, progress, format, kind, columns, replies)
+        return response_cache.stream('reddit', key, chunks, progress)
 
     def _query(self, subreddit, kind, limit=RedditConfig.limit):
+        return list(self._iter_query(subreddit, kind, limit=limit))
+
+    def _iter_incremental(self, subreddit, limit, progress=None, comments=True, budget=None):
+        """Yield new submissions since the checkpoint, then move the checkpoint.
+
+        A crawl cut short by its budget leaves the checkpoint be, so
+        that the next crawl gets the submissions it did not. The
+        checkpoint moves only past the oldest submissions which were
+        all yielded, so that one whose comments could not be retrieved
+        is crawled again next time, along with those newer than it.
+        """
+        budget = budget or Budget()
+        checkpoint = reddit_checkpoints.get(subreddit)
+        app.logger.debug(f"Crawling new in {subreddit} since {checkpoint}")
+        if checkpoint is not None:
+            limit = None
+
+        listed, yielded = [], set()
+        for submission in self._iter_query(subreddit, 'new', limit=limit, progress=progress,
+                                           checkpoint=checkpoint, comments=comments,
+                                           budget=budget, listed=listed):
+            yielded.add(submission.id)
+            yield submission
+
+        # Only reached when the whole delta has been consumed.
+        if budget.exhausted():
+            return
+        newest = None
+        for id, fullname, created_utc in reversed(listed):
+            if id not in yielded:
+                app.logger.info("Holding the checkpoint of %s before %s, which failed",
+                                subreddit, fullname)
+                break
+            newest = fullname, created_utc
+        if newest is not None:
+            reddit_checkpoints.set(subreddit, *newest)
+
+    def _iter_query(self, subreddit, kind, limit=RedditConfig.limit, progress=None,
+                    checkpoint=None, comments=True, budget=None, listed=None):
+        """Yield submissions of a listing, comments expanded unless asked not to, as they come.
+
+        Paging stops at the checkpoint, if given, or when the budget is
+        exhausted. The ID, fullname and created_utc of each submission
+        listed, yielded or not, are appended to listed, if given.
+        """
+        progress = progress or Progress()
+        budget = budget or Budget()
+        budget.expect(limit)
         app.logger.debug(f"Querying Reddit {subreddit} for '{kind}'")
         subreddit = self.reddit.subreddit(subreddit)
 
@@ -147,38 +717,254 @@ class RedditDataSource(DataSource):
         if kind == 'top':
             raise NotImplementedError("Needs a view.")
 
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            resolved_submissions = list(submissions)
-
-        # Retrieve more comments.
-        for submission in resolved_submissions:
-            if any([isinstance(c, praw.models.MoreComments) for c in submission.comments]):
-                app.logger.debug("Retrieving more comments for %s", submission.id)
-                submission.comments.replace_more()
+        listing = metrics.Stopwatch(self._iter_listing(submissions, checkpoint, listed))
+        yield from self._iter_expanded(listing, kind, progress, comments, budget)
 
+        metrics.stage_seconds.observe(listing.elapsed, source='reddit', kind=kind, stage='listing')
         app.logger.debug("Used %s API calls, %s remaining.",
                          self.reddit.auth.limits['used'],
                          self.reddit.auth.limits['remaining'])
 
-        # return list(submissions)
-        return resolved_submissions
+    def _iter_listing(self, listing, checkpoint=None, listed=None):
+        """Page through a listing, ignoring warnings on each lazy fetch."""
+        listing = iter(listing)
+        while True:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                submission = next(listing, None)
+            if submission is None:
+                break
+            if checkpoint is not None and (submission.fullname == checkpoint['fullname'] or
+                                           submission.created_utc <= checkpoint['created_utc']):
+                app.logger.debug("Reached checkpoint at %s", submission.fullname)
+                break
+            if listed is not None:
+                listed.append((submission.id, submission.fullname, submission.created_utc))
+            yield submission
+
+    def _iter_expanded(self, submissions, kind, progress, comments=True, budget=None):
+        """Expand comment trees concurrently, but yield in the given order.
+
+        The context goes along, for the priority of the Reddit calls.
+        Without comments, submissions are yielded as they are. No more
+        submissions are taken once the budget is exhausted, which
+        counts as incomplete.
+        """
+        if not comments:
+            for submission in submissions:
+                progress.count('submissions')
+                yield submission
+            return
+
+        budget = budget or Budget()
+        pending = collections.deque()
+        try:
+            for submission in submissions:
+                if budget.exhausted():
+                    app.logger.info("Stopped expanding %s at %s, out of budget %s",
+                                    kind, submission.id, budget.as_dict())
+                    # The submissions left out make the export incomplete too.
+                    progress.count('incomplete')
+                    break
+                context = contextvars.copy_context()
+                pending.append(expansions.submit(context.run, profiling.run, self._expand,
+                                                 submission, kind, budget))
+                if len(pending) >= EXPANSION_WINDOW:
+                    yield from self._expanded(pending.popleft(), progress)
+            while pending:
+                yield from self._expanded(pending.popleft(), progress)
+        finally:
+            # Left when the export is closed early, by a client gone away.
+            for future in pending:
+                future.cancel()
+
+    def _expand(self, submission, kind='', budget=None):
+        """Retrieve the comments of a submission, and more comments within the budget.
+
+        Runs on the expansions pool, where the submission is fetched
+        again, on the Reddit client of the pool thread, as praw.Reddit
+        is not to be shared between threads. That call gets the comments
+        too, so it costs nothing extra. Failures are logged rather than
+        raised, so that one bad submission does not abort an export.
+        Whether all of the comments were retrieved is recorded as the
+        complete field of the submission. praw replaces the largest
+        MoreComments first. A submission in the warehouse is not
+        retrieved again.
+
+        Returns:
+        praw.models.Submission: The submission, or None if its comments
+        could not be retrieved at all
+        """
+        kept = self._from_warehouse(submission.id)
+        if kept is not None:
+            return kept
+
+        budget = budget or Budget()
+        submission = reddit_clients.get().submission(id=submission.id)
+        with metrics.stage_seconds.time(source='reddit', kind=kind, stage='expand'):
+            try:
+                comments = submission.comments
+            except Exception:
+                app.logger.warning("Could not retrieve comments for %s",
+                                   submission.id, exc_info=True)
+                return None
+            budget.spend()
+
+            submission.complete = True
+            try:
+                if any([self._is_more(c) for c in comments]):
+                    app.logger.debug("Retrieving more comments for %s", submission.id)
+                    skipped = comments.replace_more(limit=budget.allowance(MORE_COMMENTS_LIMIT))
+                    submission.complete = not skipped
+            except Exception:
+                submission.complete = False
+                app.logger.warning("Could not retrieve more comments for %s",
+                                   submission.id, exc_info=True)
+        self._to_warehouse(submission)
+
+        return submission
+
+    def _expanded(self, future, progress):
+        submission = future.result()
+        if submission is not None:
+            progress.count('submissions')
+            progress.count('comments', len(submission.comments))
+            if not submission.complete:
+                progress.count('incomplete')
+            yield submission
+
+    @classmethod
+    def _kept(cls, thing):
+        """The fields of a submission or comment to keep in the warehouse."""
+        fields = vars(thing)
+        names = [cls.renamed.get(column, column) for column in cls.all_columns()]
+        return {name: fields[name] for name in names + ['name', 'created_utc', 'subreddit']
+                if name in fields}
+
+    def _to_warehouse(self, submission):
+        """Keep a submission and all of its comments, if there is a warehouse."""
+        if warehouse is None:
+            return
+        comments = [self._kept(c) for c in self._iter_tree(submission.comments)
+                    if not self._is_more(c)]
+        warehouse.put_submission(self._kept(submission), comments, submission.complete)
+
+    @staticmethod
+    def _from_warehouse(submission_id):
+        """A complete submission from the warehouse, if kept less than WAREHOUSE_MAX_AGE ago.
+
+        Its comments are put back into a tree, with their replies.
+        """
+        kept = warehouse.get_submission(submission_id, WAREHOUSE_MAX_AGE) if warehouse else None
+        if kept is None:
+            return None
+
+        fields, comments = kept
+        submission = _Kept(fields)
+        submission.comments = []
+        names = {submission.name: submission.comments}
+        for fields in comments:
+            comment = _Kept(fields)
+            comment.replies = []
+            names.get(comment.parent_id, submission.comments).append(comment)
+            names[comment.name] = comment.replies
+
+        return submission
+
+    @classmethod
+    def _export_columns(cls, columns, replies=False):
+        """The chosen columns, and with replies parent_id and depth too if not chosen.
+
+        Forms always send the columns, the default ones selected, so
+        replies are told apart whichever columns are chosen.
+        """
+        columns = cls._chosen_columns(columns)
+        if replies:
+            columns = columns + [column for column in ('parent_id', 'depth')
+                                 if column not in columns]
+        return columns
+
+    @staticmethod
+    def _iter_tree(comments):
+        """Yield comments and all their replies, depth first, in the order of the thread.
+
+        The walk keeps a stack of iterators, one per level, rather than
+        recursing, so deep threads need neither deep recursion nor lists
+        of all their comments.
+        """
+        stack = [iter(comments)]
+        while stack:
+            comment = next(stack[-1], None)
+            if comment is None:
+                stack.pop()
+                continue
+            yield comment
+            replies = getattr(comment, 'replies', None)
+            if replies:
+                stack.append(iter(replies))
+
+    @staticmethod
+    def _is_more(comment):
+        """Whether a comment is in fact a MoreComments, standing in for comments not retrieved."""
+        return isinstance(comment, praw.models.MoreComments)
+
+    @classmethod
+    def _per_comment(cls, columns):
+        """Whether an export of the columns has a row per comment."""
+        return any(column in cls.comment_columns for column in columns)
 
     def _as_csv(self, submissions):
         """Format posts as CSV.
 
         Actually maybe this ought to be in a view, not here in the model."""
-        app.logger.debug(f"Serializing {submissions}")
-        columns = ['header', 'comments', 'author', 'created_utc', 'edited',
-                   'score', 'is_submitter', 'parent_id', 'stickied']
-
-        joined = [{**vars(s), **vars(c)} for s in submissions for c in s.comments]
-        app.logger.debug(f"Joined a {len(joined)} dict.")
-        df = pd.DataFrame.from_records(joined)
-        app.logger.debug(f"Constructed an temp {df.shape} DataFrame")
-        df = df.rename(columns={'title': 'header', 'body': 'comments'})
-        df['comments'] = df['comments'].str.replace('\n', ' ')
-
-        # Project to desired columns.
-        projected_df = df[columns]
-        return projected_df.to_csv(index=False)
+        return ''.join(self._iter_csv(submissions))
+
+    def _iter_csv(self, submissions, progress=None):
+        """Format posts as CSV, yielding the header and then chunks of rows."""
+        return self._serialize(submissions, progress)
+
+    def _serialize(self, submissions, progress=None, format='csv', kind='', columns=None,
+                   replies=False):
+        """Format posts, see navcom_data_downloader.formats.serialize."""
+        columns = columns or self.columns
+
+        def serialize(submissions):
+            rows = self._iter_rows(submissions, progress, columns, replies)
+            return formats.serialize(format, columns, rows, self.types)
+
+        return _timed_serialization('reddit', kind, submissions, serialize)
+
+    def _iter_rows(self, submissions, progress=None, columns=None, replies=False):
+        """Project comments, and their replies if asked to, to rows of the output columns.
+
+        A row is made of the fields of a comment, falling back to the
+        fields of its submission. Only the output columns are read, and
+        the submission fields only once per submission. Without any
+        comment_columns, a row is made of the fields of a submission.
+        """
+        progress = progress or Progress()
+        columns = columns or self.columns
+        fields = [self.renamed.get(column, column) for column in columns]
+        comments = columns.index('comments') if 'comments' in columns else None
+        per_comment = self._per_comment(columns)
+        for s in submissions:
+            app.logger.debug(f"Serializing {s}")
+            submission_fields = vars(s)
+            submission_values = [submission_fields.get(field) for field in fields]
+            if not per_comment:
+                progress.count('rows')
+                yield submission_values
+                continue
+
+            rows = 0
+            for c in (self._iter_tree(s.comments) if replies else s.comments):
+                if self._is_more(c):
+                    continue
+                comment_fields = vars(c)
+                row = [comment_fields[field] if field in comment_fields else value
+                       for field, value in zip(fields, submission_values)]
+                if comments is not None and isinstance(row[comments], str):
+                    row[comments] = row[comments].replace('\n', ' ')
+                rows += 1
+                yield row
+            progress.count('rows', rows)
@@ -0,0 +1,299 @@
+"""Profiling exports on demand, for finding where the time of a slow one goes.
+
+An admin asks for a profile by adding profile=1 to the query string of
+a submit route, along with the ADMIN_TOKEN of Config in an
+X-Admin-Token header or as the password of basic auth. The export then
+runs under cProfile, in the thread streaming it and in the threads
+working for it, which are the expansion and window pools and the
+producer of its flight, see navcom_data_downloader.cache.Flights.
+Their profiles are merged into one when the export is done, and saved
+along with a summary of the memory allocated, from tracemalloc. The
+response points to the saved profile with an X-Profile header, and
+/admin/profiles lists the recent ones.
+
+Profiling slows an export down several times over, tracemalloc most of
+all. Allocations are those of the whole process while any export is
+profiled. From Python 3.12 on, only one cProfile profiler can be on at
+a time in a process, and threads finding another one on go
+unprofiled.
+"""
+from navcom_data_downloader import app, files
+import contextvars
+import cProfile
+import datetime
+import hmac
+import io
+import json
+import marshal
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Lines of the call tree and of the allocation summary in a report.
+REPORT_LINES = 40
+
+_session = contextvars.ContextVar('profiling_session', default=None)
+
+# Exports being profiled, for tracing allocations while there are any.
+_tracing = 0
+_tracing_lock = threading.Lock()
+
+
+def is_admin(request):
+    """Whether a request carries the admin token, in a header or as a basic auth password."""
+    token = app.config.get('ADMIN_TOKEN')
+    given = request.headers.get('X-Admin-Token')
+    if given is None and request.authorization is not None:
+        given = request.authorization.password
+    return bool(token and given) and hmac.compare_digest(given.encode('utf-8'),
+                                                         token.encode('utf-8'))
+
+
+def run(function, *args, **kwargs):
+    """Call a function, profiling it if it works for a profiled export.
+
+    For the threads of pools, called in a copy of the context of the
+    export, see contextvars.copy_context.
+    """
+    session = _session.get()
+    if session is None:
+        return function(*args, **kwargs)
+
+    session.enter()
+    profiler = cProfile.Profile()
+    enabled = _enable(profiler)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if enabled:
+            profiler.disable()
+        session.leave(profiler)
+
+
+class Session():
+    """The profile of one export, from the threads working for it."""
+    def __init__(self, profiles, route):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.started = time.time()
+        self.failed = False
+        self.peak = 0
+        self._profiles = profiles
+        self._profilers = []
+        self._active = 0
+        self._largest = 0
+        self._snapshot = None
+        self._tracing = False
+        self._lock = threading.Lock()
+
+    def wrap(self, export):
+        """Make an export profile itself.
+
+        Parameters:
+        export (callable): Called with a Progress, returns the chunks of the export
+
+        Returns:
+        callable: The export, profiled
+        """
+        def profiled(progress):
+            return self._iterate(export, progress)
+
+        return profiled
+
+    def enter(self):
+        with self._lock:
+            self._active += 1
+
+    def leave(self, profiler):
+        """Add the profile of a thread, saving the profile of the export if it was the last."""
+        with self._lock:
+            self._profilers.append(profiler)
+            self._active -= 1
+            done = self._active == 0
+        if done:
+            self._profiles._save(self)
+
+    def _iterate(self, export, progress):
+        self.enter()
+        self._trace()
+        profiler = cProfile.Profile()
+        try:
+            chunks = self._step(profiler, lambda: iter(export(progress)))
+            while True:
+                try:
+                    chunk = self._step(profiler, lambda: next(chunks))
+                except StopIteration:
+                    return
+                yield chunk
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self._untrace()
+            self.leave(profiler)
+
+    def _step(self, profiler, step):
+        # Only profile making chunks, not sending them.
+        token = _session.set(self)
+        enabled = _enable(profiler)
+        try:
+            return step()
+        finally:
+            if enabled:
+                profiler.disable()
+            _session.reset(token)
+            self._sample()
+
+    def _sample(self):
+        """Keep a snapshot of allocations when they are the most so far, by a tenth."""
+        if not tracemalloc.is_tracing():
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self._largest * 1.1:
+            self._largest = current
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def _trace(self):
+        global _tracing
+        with _tracing_lock:
+            if _tracing == 0:
+                tracemalloc.start()
+            _tracing += 1
+        self._tracing = True
+
+    def _untrace(self):
+        global _tracing
+        if not self._tracing:
+            return
+        self._tracing = False
+        with _tracing_lock:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            _tracing -= 1
+            if _tracing == 0:
+                tracemalloc.stop()
+
+    def report(self):
+        """The merged call tree and the allocation summary, as text."""
+        out = io.StringIO()
+        seconds = time.time() - self.started
+        out.write(f"{self.route}, {seconds:.2f} seconds, "
+                  f"{len(self._profilers)} threads, "
+                  f"peak traced memory {self.peak / 1024 ** 2:.1f} MiB\n\n")
+
+        stats = None
+        for profiler in self._profilers:
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profiler, stream=out)
+            else:
+                stats.add(profiler)
+        if stats is not None:
+            stats.sort_stats('cumulative')
+            out.write("Calls, by cumulative time\n")
+            stats.print_stats(REPORT_LINES)
+            out.write("Callees of the slowest calls\n")
+            stats.print_callees(REPORT_LINES // 2)
+
+        out.write("Allocations held at the most allocated, by line\n\n")
+        if self._snapshot is not None:
+            for statistic in self._snapshot.statistics('lineno')[:REPORT_LINES]:
+                out.write(f"{statistic}\n")
+
+        return stats, out.getvalue()
+
+
+class Profiles():
+    """Keep the profiles of the most recent profiled exports, as files in a directory.
+
+    For each, a report as text, the merged profile for pstats or
+    snakeviz, and what is known of it as JSON, so that the admin page
+    lists the profiles made by any worker.
+    """
+    def __init__(self, directory, kept):
+        self.directory = directory
+        self.kept = kept
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, route):
+        """Start the profile of an export, see Session.wrap."""
+        session = Session(self, route)
+        app.logger.info("Profiling %s as %s", route, session.id)
+        return session
+
+    def get(self, profile_id):
+        """Get what is known of a saved profile, as a dict, or None if there is none.
+
+        Raises:
+        ValueError: If the ID is not a hex UUID
+        """
+        path = self._path(profile_id, '.json')
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def recent(self):
+        """What is known of the saved profiles, the most recent first."""
+        profiles = []
+        for profile_id in files.ids(self.directory, '.json', 32):
+            profile = self.get(profile_id)
+            if profile is not None:
+                profiles.append(profile)
+        return sorted(profiles, key=lambda profile: profile['started'], reverse=True)
+
+    def report(self, profile_id):
+        """Get the path of the report of a profile."""
+        return self._path(profile_id, '.txt')
+
+    def pstats(self, profile_id):
+        """Get the path of the merged profile of a profile, for pstats."""
+        return self._path(profile_id, '.prof')
+
+    def _save(self, session):
+        stats, report = session.report()
+        if stats is not None:
+            with files.replacing(self._path(session.id, '.prof'), 'wb') as f:
+                # What Stats.dump_stats writes.
+                marshal.dump(stats.stats, f)
+        with files.replacing(self._path(session.id, '.txt')) as f:
+            f.write(report)
+        started_at = datetime.datetime.fromtimestamp(session.started, datetime.timezone.utc)
+        profile = {'id': session.id, 'route': session.route, 'started': session.started,
+                   'started_at': started_at.isoformat(timespec='seconds'),
+                   'seconds': time.time() - session.started,
+                   'peak': session.peak,
+                   'status': 'failed' if session.failed else 'done'}
+        with files.replacing(self._path(session.id, '.json')) as f:
+            json.dump(profile, f)
+        app.logger.info("Saved profile %s of %s", session.id, session.route)
+        self._evict()
+
+    def _evict(self):
+        """Remove all but the kept most recent profiles."""
+        for profile in self.recent()[self.kept:]:
+            for suffix in ('.json', '.txt', '.prof'):
+                files.remove(self._path(profile['id'], suffix))
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, files.checked_id(profile_id, 32) + suffix)
+
+
+def _enable(profiler):
+    try:
+        profiler.enable()
+    except ValueError:
+        # From Python 3.12 on, another profiler is profiling this thread already.
+        return False
+    return True
+
+
+profiles = Profiles(app.config.get('PROFILES_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'navcom-profiles')),
+                    app.config.get('PROFILES_KEPT', 50))
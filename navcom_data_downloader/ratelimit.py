@@ -0,0 +1,258 @@
+from navcom_data_downloader import app
+import asyncio
+import contextlib
+import contextvars
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Priorities of Reddit calls. Interactive ones, like getting a single
+# submission, go before bulk ones, like crawling a subreddit.
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+_priority = contextvars.ContextVar('reddit_priority', default=BULK)
+
+# How long an interactive caller keeps bulk callers from the reserve.
+INTERACTIVE_GRACE = 1.0
+
+
+class RateLimitScheduler():
+    """Pace Reddit calls with a token bucket shared by threads and processes.
+
+    The bucket is kept in a small locked file, so all the workers of a
+    host draw from the same budget. Its rate follows the remaining
+    calls and reset time Reddit reports, so the budget is spread over
+    the rest of the rate limit window. While interactive callers are
+    waiting, bulk callers leave the last reserve tokens to them.
+    """
+    def __init__(self, path, rate, burst, reserve=2):
+        self.path = path
+        self.default_rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.waited = 0.0
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """Make the Reddit calls in the block, also those on the expansions pool, of a priority."""
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    def acquire(self):
+        """Block until the caller may make a Reddit call."""
+        priority = _priority.get()
+        waited = 0.0
+        while True:
+            with self._state() as state:
+                now = time.time()
+                if state['blocked_until'] > now:
+                    wait = state['blocked_until'] - now
+                else:
+                    state['tokens'] = min(self.burst,
+                                          state['tokens'] + (now - state['updated']) * state['rate'])
+                    state['updated'] = now
+                    needed = 1
+                    if priority == INTERACTIVE:
+                        state['interactive_at'] = now
+                    elif now - state['interactive_at'] < INTERACTIVE_GRACE:
+                        needed += self.reserve
+                    if state['tokens'] >= needed:
+                        state['tokens'] -= 1
+                        break
+                    wait = (needed - state['tokens']) / state['rate']
+
+            wait = min(wait, 5.0)
+            waited += wait
+            time.sleep(wait)
+
+        with self._lock:
+            self.calls += 1
+            if waited:
+                self.waits += 1
+                self.waited += waited
+
+    def update(self, limits):
+        """Adjust the rate to what is left of Reddit's budget.
+
+        Parameters:
+        limits (dict): praw.Reddit.auth.limits, with 'remaining' and 'reset_timestamp'
+        """
+        remaining = limits.get('remaining')
+        reset = limits.get('reset_timestamp')
+        if remaining is None or reset is None:
+            return
+
+        with self._state() as state:
+            now = time.time()
+            if remaining < 1:
+                state['blocked_until'] = reset
+                state['tokens'] = 0
+            else:
+                state['rate'] = max(remaining / max(reset - now, 1.0), 0.01)
+
+    def install(self, reddit):
+        """Route all the calls of a praw.Reddit through the scheduler."""
+        cores = {id(core): core for core in (getattr(reddit, name, None)
+                                             for name in ('_core', '_authorized_core', '_read_only_core'))
+                 if core is not None}
+        for core in cores.values():
+            self._wrap(core, reddit)
+
+    def install_async(self, reddit):
+        """Route all the calls of an asyncpraw.Reddit through the scheduler.
+
+        Waiting for a token happens on a thread, so that the event loop
+        goes on with other exports meanwhile.
+        """
+        cores = {id(core): core for core in (getattr(reddit, name, None)
+                                             for name in ('_core', '_authorized_core', '_read_only_core'))
+                 if core is not None}
+        for core in cores.values():
+            self._wrap_async(core, reddit)
+
+    def stats(self):
+        """Report calls and waiting, and the current rate, as a dict."""
+        with self._state() as state:
+            rate = state['rate']
+        with self._lock:
+            return {'calls': self.calls, 'waits': self.waits,
+                    'waited': round(self.waited, 3), 'rate': rate}
+
+    def _wrap(self, core, reddit):
+        request = core.request
+
+        def scheduled_request(*args, **kwargs):
+            self.acquire()
+            try:
+                return request(*args, **kwargs)
+            finally:
+                self.update(reddit.auth.limits)
+
+        core.request = scheduled_request
+
+    def _wrap_async(self, core, reddit):
+        request = core.request
+
+        async def scheduled_request(*args, **kwargs):
+            await asyncio.to_thread(self.acquire)
+            try:
+                return await request(*args, **kwargs)
+            finally:
+                self.update(reddit.auth.limits)
+
+        core.request = scheduled_request
+
+    @contextlib.contextmanager
+    def _state(self):
+        """Lock the bucket, across processes too, and give its state for changing."""
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.load(f)
+                except ValueError:
+                    state = {'tokens': self.burst, 'updated': time.time(),
+                             'rate': self.default_rate,
+                             'blocked_until': 0, 'interactive_at': 0}
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Budget():
+    """A budget of API calls and seconds for expanding the comments of one export.
+
+    Each submission gets an allowance to replace its MoreComments
+    with. Given how many submissions are expected, an allowance is at
+    most a fair share of what is left, so that one huge thread cannot
+    take the budget of all the others.
+    """
+    def __init__(self, calls=None, seconds=None):
+        self.calls = calls
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.spent = 0
+        self._items = None
+        self._lock = threading.Lock()
+
+    def expect(self, items):
+        """Expect a number of submissions to share the budget, None if unknown."""
+        with self._lock:
+            self._items = items
+
+    def exhausted(self):
+        """Whether the calls are spent or the deadline has passed."""
+        with self._lock:
+            return self._exhausted()
+
+    def spend(self, calls=1):
+        with self._lock:
+            self.spent += calls
+
+    def allowance(self, limit=None):
+        """An allowance for a submission, to pass as limit to CommentForest.replace_more.
+
+        Parameters:
+        limit (int): Max calls for the submission, None for no limit
+        """
+        with self._lock:
+            cap = limit
+            if self.calls is not None:
+                share = self.calls - self.spent
+                if self._items:
+                    share = -(-share // self._items)
+                    self._items -= 1
+                cap = share if cap is None else min(cap, share)
+            return _Allowance(self, cap)
+
+    def as_dict(self):
+        with self._lock:
+            return {'calls': self.calls, 'seconds': self.seconds, 'spent': self.spent,
+                    'exhausted': self._exhausted()}
+
+    def _exhausted(self):
+        return ((self.calls is not None and self.spent >= self.calls) or
+                (self.deadline is not None and time.monotonic() >= self.deadline))
+
+
+class _Allowance():
+    """A limit for CommentForest.replace_more which draws on a Budget.
+
+    replace_more counts its limit down by one for each call, and stops
+    replacing when it is down to zero. This one is down to zero when
+    its cap is, or when the budget is exhausted.
+    """
+    def __init__(self, budget, cap):
+        self.budget = budget
+        self.cap = cap
+
+    def __le__(self, other):
+        return (self.cap is not None and self.cap <= other) or self.budget.exhausted()
+
+    def __isub__(self, calls):
+        if self.cap is not None:
+            self.cap -= calls
+        self.budget.spend(calls)
+        return self
+
+
+# Reddit allows 600 calls in 10 minutes to an OAuth client.
+reddit_scheduler = RateLimitScheduler(
+    app.config.get('REDDIT_RATE_LIMIT_STATE',
+                   os.path.join(tempfile.gettempdir(), 'navcom-reddit-ratelimit.json')),
+    rate=app.config.get('REDDIT_RATE', 1.0),
+    burst=app.config.get('REDDIT_BURST', 10))
@@ -0,0 +1,152 @@
+from navcom_data_downloader import app, files
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+
+class RetainedExports():
+    """Keep finished exports for a while, for interrupted downloads to resume.
+
+    An export goes into a spooled temporary file as it streams, which
+    stays in memory up to spool_size and then spills to disk, so a
+    worker holds at most that much of an export. Once finished, it is
+    kept as a file in a directory for retention seconds, where a
+    resumed download finds it with Range and ETag, whichever worker
+    serves it.
+
+    An export whose download is interrupted is finished on a thread of
+    its own, so that it can still be resumed, but only up to
+    finish_size bytes in all and for finish_seconds more. Past either,
+    or with either 0, it is stopped and not kept, so that an export
+    without an end, such as all tweets of a query, stops with its
+    download.
+    """
+    def __init__(self, directory, retention, spool_size, finish_size=0, finish_seconds=0):
+        self.directory = directory
+        self.retention = retention
+        self.spool_size = spool_size
+        self.finish_size = finish_size
+        self.finish_seconds = finish_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def retain(self, key, chunks, filename, mimetype, etag):
+        """Pass chunks through, keeping them once they are all through.
+
+        Parameters:
+        key (str): Key of the export, a hex digest, see ResponseCache.key
+        chunks (iterable): Chunks of the export, str or bytes
+        filename (str): Name of the file to download as
+        mimetype (str): Type of the file to download as
+        etag (str): Entity tag of this run of the export
+
+        Returns:
+        generator: The chunks
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size, dir=self.directory)
+        chunks = iter(chunks)
+        try:
+            for chunk in chunks:
+                spool.write(_bytes(chunk))
+                yield chunk
+        except GeneratorExit:
+            # No more threads can be started while the interpreter exits.
+            if (sys.is_finalizing() or not self.finish_seconds
+                    or spool.tell() >= self.finish_size):
+                app.logger.debug("Stopped export %s after its download was interrupted", key)
+                _stop(chunks, spool)
+                raise
+            app.logger.debug("Finishing export %s after its download was interrupted", key)
+            threading.Thread(target=self._finish, args=(key, chunks, spool, filename,
+                                                        mimetype, etag),
+                             name='export-finish', daemon=True).start()
+            raise
+        except BaseException:
+            _stop(chunks, spool)
+            raise
+        self._keep(key, spool, filename, mimetype, etag)
+
+    def get(self, key):
+        """Get what is known of a kept export, as a dict, or None if there is none.
+
+        Raises:
+        ValueError: If the key is not a hex digest
+        """
+        path = self._path(key, '.json')
+        try:
+            with open(path) as f:
+                retained = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if retained['expires'] < time.time():
+            return None
+
+        return retained
+
+    def output(self, key):
+        """Get the path of the file of a kept export."""
+        return self._path(key, '.out')
+
+    def _finish(self, key, chunks, spool, filename, mimetype, etag):
+        deadline = time.monotonic() + self.finish_seconds
+        try:
+            for chunk in chunks:
+                spool.write(_bytes(chunk))
+                if spool.tell() > self.finish_size or time.monotonic() > deadline:
+                    app.logger.info("Stopped finishing export %s, too large or too slow", key)
+                    _stop(chunks, spool)
+                    return
+        except Exception:
+            app.logger.warning("Could not finish export %s", key, exc_info=True)
+            _stop(chunks, spool)
+            return
+        self._keep(key, spool, filename, mimetype, etag)
+
+    def _keep(self, key, spool, filename, mimetype, etag):
+        with spool, files.replacing(self._path(key, '.out'), 'wb') as f:
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+        with files.replacing(self._path(key, '.json')) as f:
+            json.dump({'filename': filename, 'mimetype': mimetype, 'etag': etag,
+                       'expires': time.time() + self.retention}, f)
+        self._evict()
+
+    def _evict(self):
+        """Remove the exports kept for longer than the retention."""
+        for key in list(files.ids(self.directory, '.json', 64)):
+            if self.get(key) is None:
+                for suffix in ('.json', '.out'):
+                    files.remove(self._path(key, suffix))
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, files.checked_id(key, 64) + suffix)
+
+
+def new_etag():
+    """A new entity tag, for a run of an export."""
+    return uuid.uuid4().hex
+
+
+def _stop(chunks, spool):
+    """Stop an export, and drop what there is of it."""
+    try:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    finally:
+        spool.close()
+
+
+def _bytes(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+retained_exports = RetainedExports(app.config.get('EXPORTS_DIR',
+                                                  os.path.join(tempfile.gettempdir(), 'navcom-exports')),
+                                   app.config.get('EXPORT_RETENTION', 15 * 60),
+                                   app.config.get('EXPORT_SPOOL_SIZE', 1024 * 1024),
+                                   app.config.get('EXPORT_FINISH_SIZE', 64 * 1024 * 1024),
+                                   app.config.get('EXPORT_FINISH_SECONDS', 60))
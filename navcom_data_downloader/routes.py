@@ -1,6 +1,190 @@
 from navcom_data_downloader import app
-from navcom_data_downloader.models import TwitterDataSource, RedditDataSource
-from flask import render_template, request
+from navcom_data_downloader.clients import reddit_clients
+from navcom_data_downloader.cache import response_cache
+from navcom_data_downloader.ratelimit import reddit_scheduler, Budget
+from navcom_data_downloader.jobs import Progress, export_jobs
+from navcom_data_downloader.retention import retained_exports, new_etag
+from navcom_data_downloader import compression, formats, metrics, profiling, sources
+from flask import (abort, jsonify, redirect, render_template, request, send_file,
+                   stream_with_context, url_for)
+import os
+
+
+def _attachment_response(chunks, filename, mimetype='text/csv', compressible=False):
+    """Make a chunked attachment response out of a generator of chunks.
+
+    Compressible chunks are compressed as they stream, with the best
+    encoding the client accepts, if any.
+    """
+    encoding = compression.negotiate(request.accept_encodings) if compressible else None
+    if encoding:
+        chunks = compression.compress(chunks, encoding)
+    resp = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    resp.headers["content-disposition"] = "attachment; filename=" + filename
+    if compressible:
+        resp.vary.add('Accept-Encoding')
+    if encoding:
+        resp.content_encoding = encoding
+
+    return resp
+
+
+def _requested_format():
+    """The export format chosen on the form, CSV by default."""
+    format = request.form.get('format', 'csv')
+    if format not in formats.available():
+        abort(400)
+
+    return format
+
+
+def _requested_columns(source):
+    """The columns chosen on the form, None for the default ones of the source."""
+    columns = request.form.getlist('columns')
+    if not columns:
+        return None
+    try:
+        return source._chosen_columns(columns)
+    except KeyError:
+        abort(400)
+
+
+def _reddit_budget():
+    """A budget for expanding the comments of an export, starting now.
+
+    Reddit allows 600 calls in 10 minutes, so by default an export may
+    make as many, for at most 5 minutes.
+    """
+    return Budget(calls=app.config.get('REDDIT_CALL_BUDGET', 600),
+                  seconds=app.config.get('REDDIT_DEADLINE', 300))
+
+
+def _export_response(export, name, format='csv'):
+    """Respond with an export, or with a job ID if asked to run it in the background.
+
+    An export asked for as gzip is downloaded as a .gz file, otherwise
+    it may be compressed on the way only, see _attachment_response.
+    Exports are kept for a while once finished, and a resubmitted form
+    asking for a range is redirected to what is kept, to resume it, see
+    navcom_data_downloader.retention. An export asked to be profiled
+    by an admin points to its profile, see navcom_data_downloader.profiling.
+
+    Parameters:
+    export (callable): Called with a Progress, returns the chunks of the export
+    name (str): Name of the file to download as, without extension
+    format (str): One of navcom_data_downloader.formats.FORMATS
+    """
+    mimetype, extension = formats.FORMATS[format]
+    filename = name + extension
+    compressible = format in compression.COMPRESSIBLE
+    if request.form.get('gzip'):
+        export = _gzipped(export)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+        compressible = False
+    profile = _requested_profile()
+    if profile is not None:
+        export = profile.wrap(export)
+    if not request.form.get('background'):
+        key = _export_key()
+        if request.range and retained_exports.get(key):
+            # Ranges only apply to GET, so resume there.
+            return redirect(url_for('retained_export', key=key), 303)
+
+        etag = new_etag()
+        chunks = retained_exports.retain(key, export(Progress()), filename, mimetype, etag)
+        resp = _attachment_response(chunks, filename, mimetype, compressible)
+        resp.headers['content-location'] = url_for('retained_export', key=key)
+        if not resp.content_encoding:
+            resp.set_etag(etag)
+        if profile is not None:
+            resp.headers['x-profile'] = url_for('admin_profile', profile_id=profile.id)
+        return resp
+
+    job_id = export_jobs.submit(export, filename, mimetype)
+    resp = jsonify(id=job_id,
+                   status=url_for('job_status', job_id=job_id),
+                   download=url_for('job_download', job_id=job_id))
+    resp.status_code = 202
+    resp.headers['location'] = url_for('job_status', job_id=job_id)
+    if profile is not None:
+        resp.headers['x-profile'] = url_for('admin_profile', profile_id=profile.id)
+
+    return resp
+
+
+def _export_key():
+    """Key of the export asked for, the same for the same form to the same route."""
+    form = {name: request.form.getlist(name) for name in request.form if name != 'background'}
+    return response_cache.key('export', route=request.path, **form)
+
+
+def _retained_response(key):
+    """Respond with a kept export, or a range of it."""
+    retained = _found(retained_exports.get, key)
+    return send_file(retained_exports.output(key),
+                     mimetype=retained['mimetype'],
+                     as_attachment=True,
+                     download_name=retained['filename'],
+                     etag=retained['etag'],
+                     conditional=True)
+
+
+def _requested_profile():
+    """A profile of the export, if an admin asked for one, otherwise None."""
+    if not request.args.get('profile'):
+        return None
+    _require_admin()
+
+    return profiling.profiles.start(request.path)
+
+
+def _require_admin():
+    """Abort unless the request is by an admin, asking for credentials if need be."""
+    if not app.config.get('ADMIN_TOKEN'):
+        abort(404)
+    if not profiling.is_admin(request):
+        abort(app.response_class("Admin credentials are needed.", 401,
+                                 {'WWW-Authenticate': 'Basic realm="admin"'}))
+
+
+def _gzipped(export):
+    """Make an export gzip its chunks."""
+    def gzipped(progress):
+        return compression.compress(export(progress), 'gzip')
+
+    return gzipped
+
+
+def _requested_max(default=10):
+    """The max number of tweets chosen on the form, 0 for no limit."""
+    max = request.form.get('max') or default
+    try:
+        max = int(max)
+    except ValueError:
+        abort(400)
+    if max < 0:
+        abort(400)
+
+    return max
+
+
+def _submission_ids(text):
+    """Split pasted submission IDs, on commas and whitespace, dropping repeats."""
+    ids = text.replace(',', ' ').split()
+    return list(dict.fromkeys(id[3:] if id.startswith('t3_') else id for id in ids))
+
+
+def _found(get, file_id):
+    """What get finds by an ID from a URL, or abort with 404 if nothing or a malformed ID."""
+    try:
+        found = get(file_id)
+    except ValueError:
+        abort(404)
+    if found is None:
+        abort(404)
+
+    return found
 
 
 @app.route('/hello')
@@ -9,6 +193,24 @@ def hello_world():
     return "Hello world."
 
 
+@app.route('/stats')
+def stats():
+    app.logger.debug("Route %s", "/stats")
+    return jsonify(reddit_clients=reddit_clients.stats(),
+                   response_cache=response_cache.stats(),
+                   reddit_rate_limit=reddit_scheduler.stats())
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    app.logger.debug("Route %s", "/metrics")
+    exposition = metrics.expose({'reddit_clients': reddit_clients.stats(),
+                                 'response_cache': response_cache.stats(),
+                                 'reddit_rate_limit': reddit_scheduler.stats()})
+
+    return app.response_class(exposition, mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     app.logger.debug("Route %s", "/")
@@ -18,58 +220,140 @@ def index():
 @app.route('/twitter')
 def twitter():
     app.logger.debug("Route %s", "/twitter")
-    return render_template('twitter.html')
+    source = sources.get('twitter')
+    return render_template('twitter.html', formats=formats.available(),
+                           columns=source.all_columns(), default_columns=source.columns)
 
 
 @app.route('/twitter-submit', methods=['POST'])
 def twitter_submit():
     app.logger.debug("Route %s, payload %s", "/twitter-submit", request.form)
-    ds = TwitterDataSource()
-    ds_resp = ds.query(request.form)
+    query = request.form.to_dict()
+    name = request.form['string']
+    max = _requested_max()
+    format = _requested_format()
+    columns = _requested_columns(sources.get('twitter'))
 
-    resp = app.make_response(ds_resp)
-    resp.mimetype = 'text/csv'
-    resp.headers["content-disposition"] = "attachment; filename=" + request.form['string'] + '.csv'
+    def export(progress):
+        return sources.get('twitter')().stream(query, max=max, progress=progress, format=format,
+                                               columns=columns)
 
-    return resp
+    return _export_response(export, name, format)
 
 
 @app.route('/reddit')
 def reddit():
     app.logger.debug("Route %s", "/reddit")
-    return render_template('reddit.html')
+    source = sources.get('reddit')
+    return render_template('reddit.html', formats=formats.available(),
+                           columns=source.all_columns(), default_columns=source.columns)
 
 
 @app.route('/reddit-submission-submit', methods=['POST'])
 def reddit_submission_submit():
     app.logger.debug("Route %s, payload %s", "/reddit-submission-submit", request.form)
-    rds = RedditDataSource()
-    submission = rds.get_submission(request.form['submission_id'])
+    submission_id = request.form['submission_id']
+    format = _requested_format()
+    columns = _requested_columns(sources.get('reddit'))
+    replies = bool(request.form.get('replies'))
 
-    resp = app.make_response(submission)
-    resp.mimetype = 'text/csv'
-    resp.headers["content-disposition"] = "attachment; filename=" + request.form['submission_id'] + '.csv'
+    def export(progress):
+        return sources.get('reddit')().stream_submission(
+            submission_id, progress=progress, format=format, columns=columns,
+            replies=replies, budget=_reddit_budget())
 
-    return resp
+    return _export_response(export, submission_id, format)
+
+
+@app.route('/reddit-submissions-submit', methods=['POST'])
+def reddit_submissions_submit():
+    app.logger.debug("Route %s, payload %s", "/reddit-submissions-submit", request.form)
+    submission_ids = _submission_ids(request.form['submission_ids'])
+    if not submission_ids:
+        abort(400)
+    format = _requested_format()
+    columns = _requested_columns(sources.get('reddit'))
+    replies = bool(request.form.get('replies'))
+
+    def export(progress):
+        return sources.get('reddit')().stream_submissions(
+            submission_ids, progress=progress, format=format, columns=columns,
+            replies=replies, budget=_reddit_budget())
+
+    return _export_response(export, f"submissions-{len(submission_ids)}", format)
 
 
 @app.route('/reddit-subreddit-submit', methods=['POST'])
 def reddit_subreddit_submit():
     app.logger.debug("Route %s, payload %s", "/reddit-subreddit-submit", request.form)
-    rds = RedditDataSource()
-    data = None
-    if request.form['kind'] == 'hot':
-        data = rds.get_hot(request.form['subreddit'])
-    elif request.form['kind'] == 'new':
-        data = rds.get_new(request.form['subreddit'])
-    elif request.form['kind'] == 'top':
-        data = rds.get_top(request.form['subreddit'])
-    else:
-        raise KeyError
-
-    resp = app.make_response(data)
-    resp.mimetype = 'text/csv'
-    filename = request.form['subreddit'] + '-' + request.form['kind'] + '.csv'
-    resp.headers["content-disposition"] = "attachment; filename=" + filename
+    subreddit = request.form['subreddit']
+    kind = request.form['kind']
+    streams = {'hot': 'stream_hot', 'new': 'stream_new', 'top': 'stream_top'}
+    if kind not in streams:
+        raise KeyError(kind)
+    format = _requested_format()
+    columns = _requested_columns(sources.get('reddit'))
+    replies = bool(request.form.get('replies'))
+    options = {}
+    if kind == 'new' and request.form.get('incremental'):
+        options['incremental'] = True
 
-    return resp
+    def export(progress):
+        stream = getattr(sources.get('reddit')(), streams[kind])
+        return stream(subreddit, progress=progress, format=format, columns=columns,
+                      replies=replies, budget=_reddit_budget(), **options)
+
+    return _export_response(export, subreddit + '-' + kind, format)
+
+
+@app.route('/exports/<key>')
+def retained_export(key):
+    app.logger.debug("Route %s", "/exports/" + key)
+    return _retained_response(key)
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    app.logger.debug("Route %s", "/jobs/" + job_id)
+    return jsonify(_found(export_jobs.status, job_id))
+
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    app.logger.debug("Route %s", "/jobs/" + job_id + "/download")
+    status = _found(export_jobs.status, job_id)
+    if status['status'] != 'done':
+        return jsonify(status), 409
+
+    return send_file(export_jobs.output(job_id),
+                     mimetype=status['mimetype'],
+                     as_attachment=True,
+                     download_name=status['filename'])
+
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    app.logger.debug("Route %s", "/admin/profiles")
+    _require_admin()
+    return render_template('profiles.html', profiles=profiling.profiles.recent())
+
+
+@app.route('/admin/profiles/<profile_id>')
+def admin_profile(profile_id):
+    app.logger.debug("Route %s", "/admin/profiles/" + profile_id)
+    _require_admin()
+    _found(profiling.profiles.get, profile_id)
+    return send_file(profiling.profiles.report(profile_id), mimetype='text/plain')
+
+
+@app.route('/admin/profiles/<profile_id>/pstats')
+def admin_profile_pstats(profile_id):
+    app.logger.debug("Route %s", "/admin/profiles/" + profile_id + "/pstats")
+    _require_admin()
+    _found(profiling.profiles.get, profile_id)
+    path = profiling.profiles.pstats(profile_id)
+    if not os.path.exists(path):
+        abort(404)
+
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=profile_id + '.prof')
@@ -0,0 +1,86 @@
+"""Data sources, loaded with their heavy dependencies on first use.
+
+Importing praw and GetOldTweets3 takes a good part of a second and
+tens of megabytes, which a worker only serving the Twitter form, or
+only the static pages, does not need. Sources are registered by name
+here, and their modules import those libraries through lazy_import,
+so nothing heavy is loaded before a source is used. Deployments which
+prefer to pay up front, like a preforking server loading the app
+before forking, call warm_up, or set EAGER_SOURCES.
+"""
+from navcom_data_downloader import app
+import importlib
+import importlib.util
+import threading
+
+# Source name: (module:class, modules it needs)
+SOURCES = {'reddit': ('navcom_data_downloader.models:RedditDataSource', ['praw']),
+           'twitter': ('navcom_data_downloader.models:TwitterDataSource', ['GetOldTweets3'])}
+
+_lock = threading.RLock()
+_loaded = {}
+
+
+class _LazyModule():
+    """Stand in for a module until one of its attributes is needed."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def _load(self):
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    app.logger.debug("Loading %s", self._name)
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+
+def lazy_import(name):
+    """Import a module on first use of its attributes.
+
+    A module which is not installed fails right away, like with import.
+    Unlike importlib.util.LazyLoader, loading is safe with threads.
+    """
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
+
+
+def register(name, source, needs=()):
+    """Register a source class, or where to import it from, as module:class."""
+    with _lock:
+        SOURCES[name] = (source, list(needs))
+        _loaded.pop(name, None)
+
+
+def get(name):
+    """The class of a source, imported on first use.
+
+    Raises:
+    KeyError: If no such source is registered
+    """
+    with _lock:
+        if name not in _loaded:
+            source, needs = SOURCES[name]
+            if isinstance(source, str):
+                module, attribute = source.split(':')
+                source = getattr(importlib.import_module(module), attribute)
+            _loaded[name] = source
+        return _loaded[name]
+
+
+def warm_up(names=None):
+    """Load sources and all of their dependencies now, rather than on first use.
+
+    Parameters:
+    names (list): Names of sources to load, all by default
+    """
+    for name in names or list(SOURCES):
+        get(name)
+        for module in SOURCES[name][1]:
+            importlib.import_module(module)
+        app.logger.debug("Warmed up the %s source", name)
@@ -0,0 +1,156 @@
+from navcom_data_downloader import app
+import datetime
+import json
+import sqlite3
+import time
+
+
+class Warehouse():
+    """Keep fetched submissions, comments and tweets, for exports to reuse.
+
+    Records are dicts of the fields of praw and GetOldTweets3 objects
+    which can be exported, kept in SQLite as JSON next to the fields
+    they are looked up by. A Twitter query is covered between two dates
+    once all of its tweets between them are kept.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    id TEXT PRIMARY KEY,
+                    subreddit TEXT,
+                    created_utc REAL,
+                    complete INTEGER NOT NULL,
+                    fetched REAL NOT NULL,
+                    fields TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS comments (
+                    id TEXT PRIMARY KEY,
+                    submission_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    parent_id TEXT,
+                    fields TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS comments_by_submission
+                    ON comments (submission_id, position);
+                CREATE TABLE IF NOT EXISTS tweets (
+                    id TEXT PRIMARY KEY,
+                    date REAL NOT NULL,
+                    fields TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS tweets_by_date ON tweets (date);
+                CREATE TABLE IF NOT EXISTS tweet_queries (
+                    query TEXT NOT NULL,
+                    tweet_id TEXT NOT NULL,
+                    PRIMARY KEY (query, tweet_id));
+                CREATE TABLE IF NOT EXISTS tweet_coverage (
+                    query TEXT NOT NULL,
+                    since TEXT NOT NULL,
+                    until TEXT NOT NULL,
+                    PRIMARY KEY (query, since, until));""")
+
+    def put_submission(self, submission, comments, complete):
+        """Keep a submission and its comments, replacing those kept before.
+
+        Parameters:
+        submission (dict): Fields of the submission, with at least 'id'
+        comments (list): Fields of the comments, in the order of the thread
+        complete (bool): Whether all of the comments are there
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM comments WHERE submission_id = ?", (submission['id'],))
+            connection.execute("INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?)",
+                               (submission['id'], _lower(submission.get('subreddit')),
+                                submission.get('created_utc'), complete, time.time(),
+                                _dumps(submission)))
+            connection.executemany("INSERT OR REPLACE INTO comments VALUES (?, ?, ?, ?, ?)",
+                                   [(comment['id'], submission['id'], position,
+                                     comment.get('parent_id'), _dumps(comment))
+                                    for position, comment in enumerate(comments)])
+
+    def get_submission(self, submission_id, max_age=None):
+        """Get a complete submission and its comments, if kept and fresh enough.
+
+        Parameters:
+        submission_id (str): ID of the submission, without t3_
+        max_age (float): Max seconds since it was fetched, None for any
+
+        Returns:
+        tuple: Fields of the submission and a list of fields of its
+        comments, in the order of the thread, or None
+        """
+        with self._connect() as connection:
+            row = connection.execute("""SELECT fields FROM submissions
+                                        WHERE id = ? AND complete AND fetched >= ?""",
+                                     (submission_id, time.time() - max_age if max_age else 0)).fetchone()
+            if row is None:
+                return None
+            comments = connection.execute("""SELECT fields FROM comments WHERE submission_id = ?
+                                             ORDER BY position""", (submission_id,)).fetchall()
+
+        return json.loads(row[0]), [json.loads(fields) for fields, in comments]
+
+    def put_tweets(self, query, since, until, tweets, covered):
+        """Keep the tweets of a query between two dates.
+
+        Parameters:
+        query (str): Query string
+        since (str): Start date, as yyyy-mm-dd
+        until (str): End date, as yyyy-mm-dd, not included
+        tweets (list): Fields of the tweets, with 'id' and 'date' as a timestamp
+        covered (bool): Whether these are all the tweets of the query between the dates
+        """
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO tweets VALUES (?, ?, ?)",
+                                   [(str(tweet['id']), tweet['date'], _dumps(tweet))
+                                    for tweet in tweets])
+            connection.executemany("INSERT OR IGNORE INTO tweet_queries VALUES (?, ?)",
+                                   [(query, str(tweet['id'])) for tweet in tweets])
+            if covered:
+                connection.execute("INSERT OR IGNORE INTO tweet_coverage VALUES (?, ?, ?)",
+                                   (query, since, until))
+
+    def get_tweets(self, query, since, until):
+        """Get the tweets of a query between two dates, newest first, if covered.
+
+        Parameters:
+        query (str): Query string
+        since (str): Start date, as yyyy-mm-dd
+        until (str): End date, as yyyy-mm-dd, not included
+
+        Returns:
+        list: Fields of the tweets, or None if the dates are not covered
+        """
+        with self._connect() as connection:
+            if connection.execute("""SELECT 1 FROM tweet_coverage
+                                     WHERE query = ? AND since = ? AND until = ?""",
+                                  (query, since, until)).fetchone() is None:
+                return None
+            rows = connection.execute("""SELECT tweets.fields FROM tweets
+                                         JOIN tweet_queries ON tweet_queries.tweet_id = tweets.id
+                                         WHERE tweet_queries.query = ?
+                                         AND tweets.date >= ? AND tweets.date < ?
+                                         ORDER BY tweets.date DESC""",
+                                      (query, _timestamp(since), _timestamp(until))).fetchall()
+
+        return [json.loads(fields) for fields, in rows]
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+
+def _lower(value):
+    """Lower case name of a value, like a praw Subreddit, or None."""
+    return None if value is None else str(value).lower()
+
+
+def _timestamp(day):
+    """Timestamp of the start of a yyyy-mm-dd day, in UTC."""
+    return datetime.datetime.fromisoformat(day).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _dumps(fields):
+    """JSON of fields, with objects like a praw Redditor as their names."""
+    return json.dumps(fields, default=str)
+
+
+# Only kept when configured, with WAREHOUSE_DB.
+warehouse = Warehouse(app.config['WAREHOUSE_DB']) if app.config.get('WAREHOUSE_DB') else None
@@ -0,0 +1,175 @@
+import unittest
+import asyncio
+import gzip
+import importlib.machinery
+import importlib.util
+import inspect
+import sys
+import types
+from types import SimpleNamespace
+from unittest import mock
+from navcom_data_downloader import app
+from navcom_data_downloader.cache import ResponseCache, MemoryBackend
+
+
+def _call(path, method='GET', fields=(), headers=()):
+    """Call the ASGI application, returning the status and the body."""
+    from navcom_data_downloader.asgi import application
+
+    boundary = 'boundary'
+    body = ''.join(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                   for name, value in fields)
+    body = (body + f'--{boundary}--\r\n').encode('utf-8') if fields else b''
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'root_path': '', 'http_version': '1.1', 'server': ('localhost', 80),
+             'headers': [(b'content-type', f'multipart/form-data; boundary={boundary}'.encode()),
+                         (b'content-length', str(len(body)).encode())]
+             + [(name.encode(), value.encode()) for name, value in headers]}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'body': b''}
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'] += message.get('body', b'')
+
+    asyncio.run(application(scope, receive, send))
+    return response['status'], response['body']
+
+
+class _Comments(list):
+    """Comments of a stub submission, with none left to replace."""
+    def replace_more(self, limit=32, threshold=0):
+        return []
+
+
+class _AsyncComments(_Comments):
+    async def replace_more(self, limit=32, threshold=0):
+        return []
+
+
+def _submission(submission_id, comments=_Comments):
+    """A stub submission, with the fields exported by default."""
+    async def load():
+        pass
+
+    number = int(submission_id, 36)
+    return SimpleNamespace(
+        id=submission_id, name='t3_' + submission_id, title=f"Submission {submission_id}",
+        author='op', created_utc=1513140000.0 + number, edited=False, score=number % 100,
+        stickied=False, load=load,
+        comments=comments(SimpleNamespace(body=f"Comment {i}\non {submission_id}",
+                                          author=f'user{i}', created_utc=1513140549.0 + i,
+                                          edited=False, score=i - 1, is_submitter=i == 2,
+                                          parent_id='t3_' + submission_id, stickied=False)
+                          for i in range(3)))
+
+
+class _Reddit():
+    """Stands in for praw.Reddit, for the submissions and info calls."""
+    def submission(self, id):
+        return _submission(id)
+
+    def info(self, fullnames):
+        return (_submission(fullname[3:]) for fullname in fullnames)
+
+
+class _AsyncReddit():
+    """Stands in for asyncpraw.Reddit, for the submissions and info calls."""
+    async def submission(self, id, fetch=True):
+        return _submission(id, _AsyncComments)
+
+    async def info(self, fullnames):
+        for fullname in fullnames:
+            yield _submission(fullname[3:], _AsyncComments)
+
+
+def _asyncpraw():
+    """Stands in for the asyncpraw module, for importing the ASGI app without it."""
+    module = types.ModuleType('asyncpraw')
+    module.__spec__ = importlib.machinery.ModuleSpec('asyncpraw', None)
+    module.models = SimpleNamespace(MoreComments=type('MoreComments', (), {}))
+    return module
+
+
+# Installed for the whole module, so that the app is imported once.
+_modules = mock.patch.dict(sys.modules, {'asyncpraw': _asyncpraw()})
+_installed = importlib.util.find_spec('asyncpraw') is not None
+
+
+def setUpModule():
+    if not _installed:
+        _modules.start()
+
+
+def tearDownModule():
+    if not _installed:
+        _modules.stop()
+
+
+class TestAsgiApplicationOffline(unittest.TestCase):
+    """The ASGI app against stub Reddit clients, also without asyncpraw installed."""
+    def setUp(self):
+        from navcom_data_downloader import asgi
+
+        # Not cached, so that both apps make their export.
+        cache = ResponseCache(MemoryBackend(0), {})
+        clients = mock.Mock()
+        clients.get.return_value = _Reddit()
+        self.reddit_client = mock.AsyncMock(return_value=_AsyncReddit())
+        for patch in [mock.patch('navcom_data_downloader.models.reddit_clients', clients),
+                      mock.patch('navcom_data_downloader.models.warehouse', None),
+                      mock.patch('navcom_data_downloader.models.response_cache', cache),
+                      mock.patch('navcom_data_downloader.async_models.response_cache', cache),
+                      mock.patch.object(asgi, 'reddit_client', self.reddit_client)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_other_routes_should_be_served_by_flask(self):
+        self.assertEqual(_call('/hello'), (200, b'Hello world.'))
+
+    def test_async_submission_export_should_equal_the_flask_one(self):
+        fields = [('submission_id', '7jgnxm')]
+        flask = app.test_client().post('/reddit-submission-submit', data=dict(fields))
+        self.assertEqual(flask.status_code, 200)
+        self.assertEqual(_call('/reddit-submission-submit', 'POST', fields), (200, flask.data))
+        self.reddit_client.assert_awaited_once()
+
+    def test_async_submissions_export_should_equal_the_flask_one(self):
+        fields = [('submission_ids', '7jgnxm 7jgnxn 7jgnxo'), ('format', 'jsonl')]
+        flask = app.test_client().post('/reddit-submissions-submit', data=dict(fields))
+        self.assertEqual(flask.status_code, 200)
+        self.assertEqual(_call('/reddit-submissions-submit', 'POST', fields), (200, flask.data))
+        self.reddit_client.assert_awaited_once()
+
+    def test_async_export_should_be_compressed_when_accepted(self):
+        fields = [('submission_id', '7jgnxm')]
+        flask = app.test_client().post('/reddit-submission-submit', data=dict(fields))
+        status, body = _call('/reddit-submission-submit', 'POST', fields,
+                             [('accept-encoding', 'gzip')])
+        self.assertEqual(status, 200)
+        self.assertEqual(gzip.decompress(body), flask.data)
+
+    def test_serialize_should_take_the_arguments_of_the_sync_one(self):
+        from navcom_data_downloader.async_models import AsyncRedditDataSource
+        from navcom_data_downloader.models import RedditDataSource
+
+        self.assertEqual(inspect.signature(AsyncRedditDataSource._serialize),
+                         inspect.signature(RedditDataSource._serialize))
+
+
+@unittest.skipUnless(_installed, "Needs asyncpraw.")
+class TestAsgiApplication(unittest.TestCase):
+    def test_background_exports_should_be_served_by_flask(self):
+        status, body = _call('/reddit-submission-submit', 'POST',
+                             [('submission_id', '7jgnxm'), ('background', '1')])
+        self.assertEqual(status, 202)
+
+    def test_async_export_should_equal_the_flask_one(self):
+        fields = [('submission_id', '7jgnxm')]
+        flask = app.test_client().post('/reddit-submission-submit', data=dict(fields))
+        self.assertEqual(_call('/reddit-submission-submit', 'POST', fields), (200, flask.data))
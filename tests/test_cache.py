@@ -0,0 +1,174 @@
+import unittest
+import asyncio
+import tempfile
+import threading
+import time
+from navcom_data_downloader.cache import MemoryBackend, DiskBackend, ResponseCache, Flights
+from navcom_data_downloader.jobs import Progress
+
+
+class TestMemoryBackend(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend(max_size=10)
+
+    def test_set_entry_should_be_gotten(self):
+        self.backend.set('a', 'abc', ttl=60)
+        self.assertEqual(self.backend.get('a'), 'abc')
+
+    def test_expired_entry_should_be_gone(self):
+        self.backend.set('a', 'abc', ttl=-1)
+        self.assertIsNone(self.backend.get('a'))
+
+    def test_least_recently_used_entry_should_be_evicted_first(self):
+        self.backend.set('a', 'aaaa', ttl=60)
+        self.backend.set('b', 'bbbb', ttl=60)
+        self.backend.get('a')
+        self.backend.set('c', 'cccc', ttl=60)
+        self.assertIsNone(self.backend.get('b'))
+        self.assertEqual(self.backend.get('a'), 'aaaa')
+        self.assertEqual(self.backend.stats(), {'entries': 2, 'size': 8})
+
+
+class TestDiskBackend(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries_should_be_shared_between_backends(self):
+        DiskBackend(self.directory.name, 1024).set('a', 'abc', ttl=60)
+        self.assertEqual(DiskBackend(self.directory.name, 1024).get('a'), 'abc')
+
+    def test_expired_entry_should_be_gone(self):
+        backend = DiskBackend(self.directory.name, 1024)
+        backend.set('a', 'abc', ttl=-1)
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.stats()['entries'], 0)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(MemoryBackend(1024), {'reddit': 60})
+
+    def test_keys_should_ignore_empty_parameters(self):
+        self.assertEqual(ResponseCache.key('twitter', string='owl', max=10),
+                         ResponseCache.key('twitter', string='owl', max=10, **{'end-date': ''}))
+
+    def test_keys_should_differ_on_parameters(self):
+        self.assertNotEqual(ResponseCache.key('twitter', string='owl', max=10),
+                            ResponseCache.key('twitter', string='owl', max=20))
+
+    def test_streaming_twice_should_hit_the_cache(self):
+        first = ''.join(self.cache.stream('reddit', 'k', iter(['a,b\n', '1,2\n'])))
+        second = ''.join(self.cache.stream('reddit', 'k', iter([])))
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_async_streaming_should_share_the_cache(self):
+        async def chunks():
+            yield 'a,b\n'
+            yield '1,2\n'
+
+        async def read(chunks):
+            return ''.join([chunk async for chunk in chunks])
+
+        first = asyncio.run(read(self.cache.astream('reddit', 'k', chunks())))
+        second = ''.join(self.cache.stream('reddit', 'k', iter([])))
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_failed_stream_should_not_be_cached(self):
+        def failing():
+            yield 'a,b\n'
+            raise RuntimeError("Upstream failed.")
+
+        with self.assertRaises(RuntimeError):
+            ''.join(self.cache.stream('reddit', 'k', failing()))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_incomplete_exports_should_not_be_cached(self):
+        progress = Progress()
+        progress.count('incomplete')
+        ''.join(self.cache.stream('reddit', 'k', iter(['a,b\n']), progress))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_too_large_exports_should_not_be_cached(self):
+        ''.join(self.cache.stream('reddit', 'k', iter(['x' * 1000])))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+class TestFlights(unittest.TestCase):
+    def setUp(self):
+        self.flights = Flights(max_size=100)
+        self.queries = 0
+        self.released = threading.Event()
+
+    def _export(self, rows=3, size=10):
+        self.queries += 1
+        yield 'header\n'
+        self.released.wait(5)
+        for _ in range(rows):
+            yield 'x' * size
+
+    def test_concurrent_streams_should_share_one_export(self):
+        first = self.flights.follow('k', self._export())
+        self.assertEqual(next(first), 'header\n')
+        second = self.flights.follow('k', self._export())
+        self.released.set()
+        self.assertEqual('header\n' + ''.join(first), ''.join(second))
+        self.assertEqual(self.queries, 1)
+        self.assertEqual(self.flights.stats()['coalesced'], 1)
+
+    def test_followers_should_follow_the_progress_of_the_first(self):
+        progress = Progress()
+        progress.count('rows', 3)
+        first = self.flights.follow('k', self._export(), progress)
+        next(first)
+        followed = Progress()
+        second = self.flights.follow('k', self._export(), followed)
+        self.released.set()
+        list(second)
+        self.assertEqual(followed.as_dict()['rows'], 3)
+
+    def test_failures_should_reach_all_followers(self):
+        def failing():
+            yield 'header\n'
+            self.released.wait(5)
+            raise RuntimeError("Upstream failed.")
+
+        first = self.flights.follow('k', failing())
+        next(first)
+        second = self.flights.follow('k', failing())
+        self.released.set()
+        for follower in (first, second):
+            with self.assertRaises(RuntimeError):
+                list(follower)
+
+    def test_large_exports_should_not_be_joined_once_past_max_size(self):
+        self.released.set()
+        first = self.flights.follow('k', self._export(rows=50))
+        next(first)
+        for _ in range(100):
+            if not self.flights.stats()['in_flight']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(''.join(self.flights.follow('k', self._export(rows=50)))), 507)
+        self.assertEqual(self.queries, 2)
+        self.assertEqual(len(''.join(first)), 500)
+
+    def test_exports_left_by_all_should_stop(self):
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    yield 'x' * 10
+            finally:
+                closed.set()
+
+        follower = self.flights.follow('k', endless())
+        next(follower)
+        follower.close()
+        self.assertTrue(closed.wait(5))
@@ -0,0 +1,30 @@
+import unittest
+import os
+import tempfile
+from navcom_data_downloader.checkpoints import CheckpointStore
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore(os.path.join(self.directory.name, 'checkpoints.sqlite'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unknown_subreddit_should_have_no_checkpoint(self):
+        self.assertIsNone(self.store.get('dataisbeautiful'))
+
+    def test_set_checkpoint_should_be_gotten(self):
+        self.store.set('dataisbeautiful', 't3_abc', 1600000000.0)
+        self.assertEqual(self.store.get('dataisbeautiful'),
+                         {'fullname': 't3_abc', 'created_utc': 1600000000.0})
+
+    def test_subreddit_names_should_be_case_insensitive(self):
+        self.store.set('DataIsBeautiful', 't3_abc', 1600000000.0)
+        self.assertIsNotNone(self.store.get('dataisbeautiful'))
+
+    def test_checkpoint_should_never_move_backward(self):
+        self.store.set('dataisbeautiful', 't3_new', 1600000000.0)
+        self.store.set('dataisbeautiful', 't3_old', 1500000000.0)
+        self.assertEqual(self.store.get('dataisbeautiful')['fullname'], 't3_new')
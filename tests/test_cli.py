@@ -0,0 +1,104 @@
+import unittest
+import functools
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from navcom_data_downloader import app
+from navcom_data_downloader.cli import _merge, _name, _source
+from navcom_data_downloader.models import RedditDataSource
+
+
+class _RedditDataSource(RedditDataSource):
+    """Exports a row per submission ID, without Reddit, failing for 'broken'."""
+    def stream_submission(self, submission_id, progress, **options):
+        return self.stream_submissions([submission_id], progress, **options)
+
+    def stream_submissions(self, submission_ids, progress, format='csv', **options):
+        yield 'id\r\n'
+        for submission_id in submission_ids:
+            if submission_id == 'broken':
+                raise KeyError(submission_id)
+            progress.count('rows')
+            yield f'{submission_id}\r\n'
+
+
+class TestManifest(unittest.TestCase):
+    def test_items_should_be_told_apart_by_their_keys(self):
+        self.assertEqual(_source({'subreddit': 'dataisbeautiful'}), 'reddit')
+        self.assertEqual(_source({'submission_ids': ['7jgnxm']}), 'reddit')
+        self.assertEqual(_source({'string': 'giraffe'}), 'twitter')
+        with self.assertRaises(KeyError):
+            _source({'hashtag': 'giraffe'})
+
+    def test_item_names_should_be_safe_file_names(self):
+        self.assertEqual(_name({'subreddit': 'dataisbeautiful', 'kind': 'new'}),
+                         'dataisbeautiful-new')
+        self.assertEqual(_name({'submission_ids': ['a', 'b']}), 'submissions-2')
+        self.assertEqual(_name({'string': 'giraffe OR zebra/okapi'}), 'giraffe_OR_zebra_okapi')
+
+
+class TestExportCommand(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.runner = app.test_cli_runner()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _manifest(self, items):
+        path = os.path.join(self.directory.name, 'manifest.json')
+        with open(path, 'w') as f:
+            json.dump(items, f)
+        return path
+
+    def test_merging_csv_should_keep_only_the_first_header(self):
+        paths = []
+        for i, content in enumerate([b'a,b\r\n1,2\r\n', b'a,b\r\n3,4\r\n']):
+            paths.append(os.path.join(self.directory.name, f'{i}.csv'))
+            with open(paths[-1], 'wb') as f:
+                f.write(content)
+        merged = os.path.join(self.directory.name, 'merged.csv')
+        _merge(paths, merged, 'csv')
+        with open(merged, 'rb') as f:
+            self.assertEqual(f.read(), b'a,b\r\n1,2\r\n3,4\r\n')
+
+    def test_unknown_items_should_be_refused(self):
+        result = self.runner.invoke(args=['export', self._manifest([{'hashtag': 'giraffe'}])])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_unknown_columns_should_be_refused(self):
+        manifest = self._manifest([{'subreddit': 'dataisbeautiful', 'columns': ['nonsense']}])
+        result = self.runner.invoke(args=['export', manifest])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_merging_items_with_other_columns_should_be_refused(self):
+        manifest = self._manifest([{'subreddit': 'dataisbeautiful'}, {'string': 'giraffe'}])
+        merged = os.path.join(self.directory.name, 'merged.csv')
+        result = self.runner.invoke(args=['export', manifest, '--merge', merged])
+        self.assertEqual(result.exit_code, 2)
+        self.assertFalse(os.path.exists(merged))
+
+    def test_items_should_be_exported_to_a_file_each_by_the_processes(self):
+        manifest = self._manifest([{'submission_ids': ['7jgnxm', '7jgnxn']},
+                                   {'submission_id': 'broken'},
+                                   {'submission_id': '7jgnxo', 'name': 'one'}])
+        output_dir = os.path.join(self.directory.name, 'exports')
+        # Forked, so that the worker processes get the stub source too.
+        pool = functools.partial(ProcessPoolExecutor,
+                                 mp_context=multiprocessing.get_context('fork'))
+        with mock.patch('navcom_data_downloader.cli.ProcessPoolExecutor', pool), \
+                mock.patch('navcom_data_downloader.cli.sources.get',
+                           return_value=_RedditDataSource):
+            result = self.runner.invoke(args=['export', manifest, '--output-dir', output_dir,
+                                              '--processes', '2'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("001-submissions-2.csv: 2 rows", result.output)
+        self.assertIn("1 of 3 items failed", result.output)
+        self.assertEqual(sorted(os.listdir(output_dir)), ['001-submissions-2.csv', '003-one.csv'])
+        with open(os.path.join(output_dir, '001-submissions-2.csv'), 'rb') as f:
+            self.assertEqual(f.read(), b'id\r\n7jgnxm\r\n7jgnxn\r\n')
+        with open(os.path.join(output_dir, '003-one.csv'), 'rb') as f:
+            self.assertEqual(f.read(), b'id\r\n7jgnxo\r\n')
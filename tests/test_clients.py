@@ -0,0 +1,58 @@
+import unittest
+import threading
+from unittest import mock
+import praw
+from navcom_data_downloader.clients import RedditClientPool, reddit_clients
+
+
+class TestRedditClientPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = RedditClientPool()
+
+    def test_getting_a_client_should_return_a_reddit_client(self):
+        self.assertIsInstance(self.pool.get(), praw.reddit.Reddit)
+
+    def test_getting_twice_in_a_thread_should_reuse_the_client(self):
+        self.assertIs(self.pool.get(), self.pool.get())
+        self.assertEqual(self.pool.stats()['misses'], 1)
+        self.assertEqual(self.pool.stats()['hits'], 1)
+
+    def test_other_threads_should_get_their_own_client(self):
+        clients = []
+        got, done = threading.Event(), threading.Event()
+
+        def get():
+            clients.append(self.pool.get())
+            got.set()
+            done.wait()
+
+        thread = threading.Thread(target=get)
+        thread.start()
+        got.wait()
+        self.assertIsNot(clients[0], self.pool.get())
+        done.set()
+        thread.join()
+        self.assertEqual(self.pool.stats()['clients'], 2)
+
+    def test_client_of_a_finished_thread_should_be_reused(self):
+        pool = RedditClientPool(mock.Mock)
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(pool.get()))
+        thread.start()
+        thread.join()
+        self.assertIs(pool.get(), clients[0])
+        self.assertEqual(pool.stats(), {'clients': 1, 'hits': 1, 'misses': 1, 'refreshes': 0})
+
+    def test_token_refresh_should_be_counted(self):
+        reddit = mock.Mock()
+        refresh = reddit._core._authorizer.refresh
+        pool = RedditClientPool(lambda: reddit)
+        pool.get()._core._authorizer.refresh()
+        refresh.assert_called_once_with()
+        self.assertEqual(pool.stats()['refreshes'], 1)
+
+    def test_stats_should_have_all_counters(self):
+        self.assertEqual(set(self.pool.stats()), {'clients', 'hits', 'misses', 'refreshes'})
+
+    def test_module_should_have_a_shared_pool(self):
+        self.assertIsInstance(reddit_clients, RedditClientPool)
@@ -0,0 +1,73 @@
+import unittest
+import asyncio
+import gzip
+import zlib
+from werkzeug.http import parse_accept_header
+from navcom_data_downloader import compression
+
+
+class TestCompression(unittest.TestCase):
+    def test_gzip_should_always_be_available(self):
+        self.assertIn('gzip', compression.available())
+
+    def test_negotiating_should_prefer_zstd_if_available(self):
+        accepted = parse_accept_header('gzip, deflate, br, zstd')
+        self.assertEqual(compression.negotiate(accepted), compression.available()[0])
+
+    def test_negotiating_should_respect_refused_encodings(self):
+        self.assertEqual(compression.negotiate(parse_accept_header('gzip;q=0, zstd;q=0')), None)
+        self.assertEqual(compression.negotiate(parse_accept_header('identity')), None)
+        self.assertEqual(compression.negotiate(parse_accept_header('')), None)
+
+    def test_compressed_chunks_should_decompress_to_the_original(self):
+        chunks = ['header,comments\r\n'] + ['a row,"with, a comma"\r\n' * 100] * 50
+        compressed = b''.join(compression.compress(iter(chunks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed).decode('utf-8'), ''.join(chunks))
+        self.assertLess(len(compressed), len(''.join(chunks)) / 10)
+
+    def test_async_chunks_should_compress_the_same(self):
+        chunks = ['header,comments\r\n'] + ['a row\r\n' * 100] * 10
+
+        async def compressed():
+            async def iterate():
+                for chunk in chunks:
+                    yield chunk
+            return b''.join([data async for data in compression.acompress(iterate(), 'gzip')])
+
+        self.assertEqual(gzip.decompress(asyncio.run(compressed())).decode('utf-8'), ''.join(chunks))
+
+    def test_compressing_should_not_wait_for_all_chunks(self):
+        def chunks():
+            for _ in range(1000):
+                yield zlib.compress(bytes(range(256)) * 64, 0)
+            raise AssertionError("Read all the chunks")
+
+        compressed = compression.compress(chunks(), 'gzip')
+        self.assertTrue(next(compressed))
+
+    def test_compressed_chunks_should_decompress_before_the_export_finishes(self):
+        def chunks():
+            yield 'header,comments\r\n'
+            yield 'a row\r\n'
+            raise AssertionError("Read past the rows")
+
+        compressed = compression.compress(chunks(), 'gzip')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(next(compressed)), b'header,comments\r\n')
+        self.assertEqual(decompressor.decompress(next(compressed)), b'a row\r\n')
+
+    @unittest.skipUnless('zstd' in compression.available(), "zstandard is not installed")
+    def test_zstd_chunks_should_decompress_before_the_export_finishes(self):
+        import zstandard
+
+        def chunks():
+            yield 'header,comments\r\n'
+            raise AssertionError("Read past the header")
+
+        compressed = compression.compress(chunks(), 'zstd')
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self.assertEqual(decompressor.decompress(next(compressed)), b'header,comments\r\n')
+
+    def test_unknown_encodings_should_raise_an_error(self):
+        with self.assertRaises(KeyError):
+            list(compression.compress(['a'], 'br'))
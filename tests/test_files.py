@@ -0,0 +1,44 @@
+import unittest
+import os
+import tempfile
+from navcom_data_downloader import files
+
+
+class TestFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'a' * 32 + '.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replacing_should_replace_the_file_once_written(self):
+        with files.replacing(self.path) as f:
+            f.write('{}')
+            self.assertFalse(os.path.exists(self.path))
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '{}')
+
+    def test_failed_replacing_should_leave_the_file_and_nothing_else(self):
+        with open(self.path, 'w') as f:
+            f.write('{}')
+        with self.assertRaises(NotImplementedError):
+            with files.replacing(self.path) as f:
+                f.write('{"half": ')
+                raise NotImplementedError
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '{}')
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(self.path)])
+
+    def test_ids_should_only_list_wellformed_ones(self):
+        for name in ['a' * 32 + '.json', 'a' * 32 + '.out', 'A' * 32 + '.json', 'x.json']:
+            open(os.path.join(self.directory.name, name), 'w').close()
+        self.assertEqual(list(files.ids(self.directory.name, '.json', 32)), ['a' * 32])
+
+    def test_malformed_id_should_be_refused(self):
+        for file_id in ['../../etc/passwd', 'a' * 31, 'A' * 32]:
+            with self.assertRaises(ValueError):
+                files.checked_id(file_id, 32)
+
+    def test_removing_a_missing_file_should_do_nothing(self):
+        files.remove(self.path)
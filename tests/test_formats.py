@@ -0,0 +1,46 @@
+import unittest
+import datetime
+import io
+import json
+from navcom_data_downloader import formats
+
+COLUMNS = ['comments', 'created_utc', 'score']
+TYPES = {'created_utc': 'timestamp', 'score': 'int'}
+ROWS = [['first, "quoted"', 1513140549.0, 3],
+        [None, 1513140550.0, -1]]
+
+
+class TestFormats(unittest.TestCase):
+    def test_csv_should_have_header_and_rows(self):
+        output = ''.join(formats.serialize('csv', COLUMNS, iter(ROWS), TYPES, lineterminator='\n'))
+        self.assertEqual(output, 'comments,created_utc,score\n'
+                                 '"first, ""quoted""",1513140549.0,3\n'
+                                 ',1513140550.0,-1\n')
+
+    def test_jsonl_should_have_typed_values(self):
+        lines = ''.join(formats.serialize('jsonl', COLUMNS, iter(ROWS), TYPES)).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]),
+                         {'comments': None, 'created_utc': '2017-12-13T04:49:10+00:00', 'score': -1})
+
+    def test_unknown_format_should_raise_an_error(self):
+        with self.assertRaises(KeyError):
+            formats.serialize('xls', COLUMNS, iter(ROWS))
+
+    @unittest.skipUnless('parquet' in formats.available(), "Needs pyarrow.")
+    def test_parquet_should_have_typed_columns(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        output = b''.join(formats.serialize('parquet', COLUMNS, iter(ROWS), TYPES))
+        table = pq.read_table(io.BytesIO(output))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.schema.field('score').type, pa.int64())
+        self.assertEqual(table.column('created_utc')[0].as_py(),
+                         datetime.datetime(2017, 12, 13, 4, 49, 9, tzinfo=datetime.timezone.utc))
+
+    @unittest.skipUnless('arrow' in formats.available(), "Needs pyarrow.")
+    def test_arrow_should_be_read_as_a_stream(self):
+        import pyarrow as pa
+        output = b''.join(formats.serialize('arrow', COLUMNS, iter(ROWS), TYPES))
+        table = pa.ipc.open_stream(io.BytesIO(output)).read_all()
+        self.assertEqual(table.column('comments').to_pylist(), ['first, "quoted"', None])
@@ -0,0 +1,117 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from navcom_data_downloader.jobs import Progress, JobQueue
+
+
+def wait_for(queue, job_id):
+    for _ in range(100):
+        status = queue.status(job_id)
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+
+
+class TestProgress(unittest.TestCase):
+    def test_counting_should_add_up(self):
+        progress = Progress()
+        progress.count('rows')
+        progress.count('rows', 2)
+        self.assertEqual(progress.as_dict(), {'submissions': 0, 'comments': 0, 'rows': 3, 'incomplete': 0})
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(self.directory.name, workers=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_finished_job_should_have_its_output(self):
+        def export(progress):
+            for chunk in ['a,b\n', '1,2\n']:
+                progress.count('rows')
+                yield chunk
+
+        job_id = self.queue.submit(export, 'test.csv')
+        status = wait_for(self.queue, job_id)
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['progress']['rows'], 2)
+        with open(self.queue.output(job_id)) as f:
+            self.assertEqual(f.read(), 'a,b\n1,2\n')
+
+    def test_failing_job_should_be_reported_failed(self):
+        def export(progress):
+            raise NotImplementedError
+
+        job_id = self.queue.submit(export, 'test.csv')
+        self.assertEqual(wait_for(self.queue, job_id)['status'], 'failed')
+
+    def test_unknown_job_should_have_no_status(self):
+        self.assertIsNone(self.queue.status('a' * 32))
+
+    def test_malformed_job_id_should_be_refused(self):
+        with self.assertRaises(ValueError):
+            self.queue.status('../../etc/passwd')
+
+    def test_finished_job_should_be_removed_after_the_retention(self):
+        queue = JobQueue(self.directory.name, workers=1, retention=0.2)
+        job_id = queue.submit(lambda progress: ['a,b\n'], 'test.csv')
+        self.assertEqual(wait_for(queue, job_id)['status'], 'done')
+        time.sleep(0.3)
+        self.assertIsNone(queue.status(job_id))
+
+        later_id = queue.submit(lambda progress: ['a,b\n'], 'test.csv')
+        self.assertEqual(wait_for(queue, later_id)['status'], 'done')
+        self.assertFalse(os.path.exists(queue.output(job_id)))
+        self.assertTrue(os.path.exists(queue.output(later_id)))
+
+    def test_progress_should_be_saved_at_most_every_save_interval(self):
+        queue = JobQueue(self.directory.name, workers=1, save_interval=60)
+
+        def export(progress):
+            for _ in range(100):
+                progress.count('rows')
+                yield 'a,b\n'
+
+        with mock.patch.object(queue, '_save', wraps=queue._save) as save:
+            job_id = queue.submit(export, 'test.csv')
+            status = wait_for(queue, job_id)
+        self.assertEqual(status['progress']['rows'], 100)
+        # Queued, running and done.
+        self.assertEqual(save.call_count, 3)
+
+    def test_slow_job_should_be_kept_alive_by_its_process(self):
+        queue = JobQueue(self.directory.name, workers=1, stale_after=0.5)
+        released = threading.Event()
+
+        def export(progress):
+            released.wait(5)
+            yield 'a,b\n'
+
+        job_id = queue.submit(export, 'test.csv')
+        time.sleep(1)
+        self.assertEqual(queue.status(job_id)['status'], 'running')
+        released.set()
+        self.assertEqual(wait_for(queue, job_id)['status'], 'done')
+
+    def test_lost_job_should_be_reported_failed(self):
+        job_id = 'a' * 32
+        queue = JobQueue(self.directory.name, workers=1, stale_after=60)
+        queue._save({'id': job_id, 'status': 'running'})
+        self.assertEqual(queue.status(job_id)['status'], 'running')
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(queue.status(job_id)['status'], 'failed')
+
+    def test_lost_job_should_be_removed_after_the_retention(self):
+        job_id = 'a' * 32
+        queue = JobQueue(self.directory.name, workers=1, retention=60, stale_after=60)
+        queue._save({'id': job_id, 'status': 'queued'})
+        with mock.patch('time.time', return_value=time.time() + 121):
+            self.assertIsNone(queue.status(job_id))
+            queue._evict()
+        self.assertEqual(os.listdir(self.directory.name), [])
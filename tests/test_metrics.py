@@ -0,0 +1,34 @@
+import unittest
+from navcom_data_downloader.metrics import Histogram, Stopwatch, expose
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.histogram = Histogram('test_seconds', "Test.", ['stage'], [0.1, 1])
+
+    def test_observations_should_be_counted_in_cumulative_buckets(self):
+        self.histogram.observe(0.05, stage='listing')
+        self.histogram.observe(0.5, stage='listing')
+        self.histogram.observe(5, stage='listing')
+        lines = self.histogram.expose()
+        self.assertIn('test_seconds_bucket{stage="listing",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="listing",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="listing",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="listing"} 3', lines)
+
+    def test_timing_a_block_should_observe_it(self):
+        with self.histogram.time(stage='expand'):
+            pass
+        self.assertIn('test_seconds_count{stage="expand"} 1', self.histogram.expose())
+
+
+class TestStopwatch(unittest.TestCase):
+    def test_stopwatch_should_pass_items_through(self):
+        stopwatch = Stopwatch(range(3))
+        self.assertEqual(list(stopwatch), [0, 1, 2])
+        self.assertGreaterEqual(stopwatch.elapsed, 0)
+
+
+class TestExpose(unittest.TestCase):
+    def test_stats_should_be_exposed_as_gauges(self):
+        self.assertIn('navcom_response_cache_hits 3.0', expose({'response_cache': {'hits': 3}}))
@@ -1,11 +1,21 @@
 import unittest
 import datetime
+import os
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
 import praw
 import pandas as pd
 from io import StringIO
 from config import RedditCredentials, RedditConfig
 from navcom_data_downloader import app
 from navcom_data_downloader.models import DataSource, TwitterDataSource, RedditDataSource
+from navcom_data_downloader.checkpoints import CheckpointStore
+from navcom_data_downloader.clients import RedditClientPool
+from navcom_data_downloader.jobs import Progress
+from navcom_data_downloader.warehouse import Warehouse
 
 
 class TestDataSource(unittest.TestCase):
@@ -39,13 +49,57 @@ class TestTwitterDataSource(unittest.TestCase):
         data = tds._query(query)
         self.assertEqual(10, len(data))
 
+    def test_iterating_a_query_should_yield_up_to_max_tweets(self):
+        query = {'string': 'goats'}
+        tds = TwitterDataSource()
+        data = list(tds._iter_query(query, max=150))
+        self.assertEqual(150, len(data))
+
+    def test_long_queries_should_be_split_into_windows_newest_first(self):
+        query = {'string': 'goats', 'start-date': '2020-08-30', 'end-date': '2020-09-02'}
+        windows = TwitterDataSource._windows(query)
+        self.assertEqual([(w['start-date'], w['end-date']) for w in windows],
+                         [('2020-09-01', '2020-09-02'),
+                          ('2020-08-31', '2020-09-01'),
+                          ('2020-08-30', '2020-08-31')])
+
+    def test_queries_without_both_dates_should_not_be_split(self):
+        query = {'string': 'goats', 'start-date': '2020-08-30'}
+        self.assertEqual(TwitterDataSource._windows(query), [query])
+
+    def test_windowed_query_should_stay_within_the_dates_without_repeats(self):
+        start_date = datetime.date(2020, 8, 15)
+        end_date = datetime.date(2020, 8, 18)
+        query = {'string': "giraffe",
+                 'start-date': str(start_date),
+                 'end-date': str(end_date)}
+        tds = TwitterDataSource()
+        data = list(tds._iter_tweets(query, max=50))
+        self.assertTrue(all([start_date <= datum.date.date() < end_date for datum in data]))
+        self.assertEqual(len(data), len({datum.id for datum in data}))
+        self.assertEqual(data, sorted(data, key=lambda datum: datum.date, reverse=True))
+
+    def test_covered_windows_should_come_from_the_warehouse(self):
+        query = {'string': 'giraffe', 'start-date': '2020-08-15', 'end-date': '2020-08-17'}
+        tds = TwitterDataSource()
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('navcom_data_downloader.models.warehouse',
+                           Warehouse(os.path.join(directory, 'warehouse.sqlite'))):
+            scraped = list(tds._iter_tweets(query, max=0))
+            with mock.patch.object(tds, '_query', side_effect=AssertionError("Scraped again")):
+                kept = list(tds._iter_tweets(query, max=0))
+        self.assertEqual([(t.id, t.date) for t in kept], [(t.id, t.date) for t in scraped])
+
     def test_query_results_should_be_not_older_than_start_time(self):
         """Twitter sometimes returns tweets beyond the start-time."""
         start_date = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
         query = {'string': "sheepie",
                  'start-date': str(start_date.date())}
         tds = TwitterDataSource()
-        data = tds._query(query)
+        with mock.patch('navcom_data_downloader.models.warehouse', None), \
+                mock.patch.object(tds, '_query', side_effect=_answering(start_date)):
+            data = list(tds._iter_tweets(query, max=0))
+        self.assertEqual([datum.id for datum in data], ['2', '1'])
         self.assertTrue(all([datum.date >= start_date for datum in data]))
 
     def test_query_results_should_be_not_newer_than_end_time(self):
@@ -54,11 +108,24 @@ class TestTwitterDataSource(unittest.TestCase):
         query = {'string': "owl",
                  'end-date': str(end_date.date())}
         tds = TwitterDataSource()
-        data = tds._query(query)
-        [print(str(datum.date), datum.permalink) for datum in data]
+        with mock.patch('navcom_data_downloader.models.warehouse', None), \
+                mock.patch.object(tds, '_query', side_effect=_answering(end_date)):
+            data = list(tds._iter_tweets(query, max=0))
+        self.assertEqual([datum.id for datum in data], ['-1', '-2'])
         self.assertTrue(all([datum.date <= end_date for datum in data]))
 
 
+def _answering(date):
+    """Stands in for TwitterDataSource._query, with tweets on both sides of a date, some twice."""
+    def query(query, max=10, receive=None):
+        tweets = [SimpleNamespace(id=str(hours), date=date + datetime.timedelta(hours=hours))
+                  for hours in [2, 1, 1, -1, -1, -2]]
+        for page in [tweets[:3], tweets[3:]]:
+            receive(page)
+        return tweets
+    return query
+
+
 class TestRedditCredentials(unittest.TestCase):
     def setUp(self):
         self.reddit_conf = RedditCredentials
@@ -117,6 +184,192 @@ class TestRedditDataSource(unittest.TestCase):
         more_submissions = self.rds._query(subreddit, 'hot', RedditConfig.limit + 5)
         self.assertEqual(len(more_submissions), RedditConfig.limit + 5)
 
+    def test_getting_hot_should_keep_the_listing_order(self):
+        subreddit = 'dataisbeautiful'
+        listing = [s.id for s in self.rds.reddit.subreddit(subreddit).hot(limit=5)]
+        submissions = self.rds._query(subreddit, 'hot', limit=5)
+        self.assertEqual([s.id for s in submissions], listing)
+
+    def test_getting_many_submissions_should_keep_their_order(self):
+        sids = ['7jgnxm', '7jhl8k']
+        submissions = list(self.rds._iter_submissions(sids[::-1]))
+        self.assertEqual([s.id for s in submissions], sids[::-1])
+
+    def test_getting_many_submissions_should_leave_out_missing_ones(self):
+        csv = self.rds.get_submissions(['7jgnxm', 'zzzzzzzzz'])
+        df = pd.read_csv(StringIO(csv))
+        self.assertEqual(set(df['header']), {'Error with PRAW'})
+
+    def test_choosing_only_submission_columns_should_give_a_row_per_submission(self):
+        csv = ''.join(self.rds.stream_hot('dataisbeautiful', limit=3, columns=['header', 'num_comments']))
+        df = pd.read_csv(StringIO(csv))
+        self.assertEqual(list(df.columns), ['header', 'num_comments'])
+        self.assertEqual(len(df), 3)
+
+    def test_choosing_extra_columns_should_export_them(self):
+        csv = ''.join(self.rds.stream_submission('7jgnxm', columns=['comments', 'depth', 'permalink']))
+        df = pd.read_csv(StringIO(csv))
+        self.assertEqual(list(df.columns), ['comments', 'depth', 'permalink'])
+        self.assertEqual(df.iloc[0]['depth'], 0)
+
+    def test_choosing_an_unknown_column_should_raise_an_error(self):
+        with self.assertRaises(KeyError):
+            self.rds.stream_hot('dataisbeautiful', columns=['header', 'karma'])
+
+    def test_walking_a_comment_tree_should_yield_replies_depth_first(self):
+        class Comment():
+            def __init__(self, id, *replies):
+                self.id = id
+                self.replies = list(replies)
+
+        tree = [Comment('a', Comment('a1', Comment('a11')), Comment('a2')), Comment('b')]
+        self.assertEqual([c.id for c in RedditDataSource._iter_tree(tree)],
+                         ['a', 'a1', 'a11', 'a2', 'b'])
+
+    def test_walking_a_deep_comment_tree_should_not_recurse(self):
+        class Comment():
+            replies = []
+
+        tree = [Comment()]
+        for _ in range(10 * sys.getrecursionlimit()):
+            parent = Comment()
+            parent.replies = tree
+            tree = [parent]
+        self.assertEqual(sum(1 for _ in RedditDataSource._iter_tree(tree)),
+                         10 * sys.getrecursionlimit() + 1)
+
+    def test_exporting_replies_should_add_depth_and_more_rows(self):
+        top_level = pd.read_csv(StringIO(''.join(self.rds.stream_submission('7jgnxm'))))
+        all_levels = pd.read_csv(StringIO(''.join(self.rds.stream_submission('7jgnxm', replies=True))))
+        self.assertEqual(list(all_levels.columns), RedditDataSource.columns + ['depth'])
+        self.assertGreaterEqual(len(all_levels), len(top_level))
+
+    def test_kept_submission_should_export_like_the_fetched_one(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('navcom_data_downloader.models.warehouse',
+                           Warehouse(os.path.join(directory, 'warehouse.sqlite'))):
+            fetched = ''.join(self.rds._serialize([self.rds._get_submission('7jgnxm')],
+                                                  replies=True))
+            with mock.patch.object(self.rds.reddit, 'submission',
+                                   side_effect=AssertionError("Fetched again")):
+                kept = ''.join(self.rds._serialize([self.rds._get_submission('7jgnxm')],
+                                                   replies=True))
+        self.assertEqual(kept, fetched)
+
+    def test_failing_expansion_should_not_abort_the_query(self):
+        class BrokenSubmission():
+            id = 'broken'
+
+            @property
+            def comments(self):
+                raise praw.exceptions.PRAWException("Broken on purpose.")
+
+        with mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            clients.get.return_value.submission.return_value = BrokenSubmission()
+            self.assertIsNone(self.rds._expand(BrokenSubmission()))
+
+    def test_expansions_should_use_the_client_of_their_thread(self):
+        with mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            clients.get.return_value.submission.return_value.comments = []
+            expanded = self.rds._expand(mock.Mock(id='7jgnxm'))
+        clients.get.return_value.submission.assert_called_once_with(id='7jgnxm')
+        self.assertIs(expanded, clients.get.return_value.submission.return_value)
+
+    def test_closed_export_should_cancel_the_pending_expansions(self):
+        with mock.patch('navcom_data_downloader.models.expansions') as expansions:
+            futures = [mock.Mock() for _ in range(20)]
+            for future in futures:
+                future.result.return_value = SimpleNamespace(id='7jgnxm', comments=[],
+                                                             complete=True)
+            expansions.submit.side_effect = futures
+            expanded = self.rds._iter_expanded(iter(futures), 'submissions', Progress())
+            next(expanded)
+            expanded.close()
+        submitted = futures[:expansions.submit.call_count]
+        self.assertGreater(len(submitted), 1)
+        submitted[0].cancel.assert_not_called()
+        for future in submitted[1:]:
+            future.cancel.assert_called_once_with()
+
+    def test_client_should_be_that_of_the_calling_thread(self):
+        with mock.patch('navcom_data_downloader.models.reddit_clients',
+                        RedditClientPool(mock.Mock)):
+            source = RedditDataSource()
+            elsewhere = []
+            got, done = threading.Event(), threading.Event()
+
+            def get():
+                elsewhere.append(source.reddit)
+                got.set()
+                done.wait()
+
+            thread = threading.Thread(target=get)
+            thread.start()
+            got.wait()
+            self.assertIs(source.reddit, source.reddit)
+            self.assertIsNot(elsewhere[0], source.reddit)
+            done.set()
+            thread.join()
+
+    def test_submissions_with_comments_should_not_be_looked_up_before(self):
+        with mock.patch('navcom_data_downloader.models.warehouse', None), \
+                mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            reddit = clients.get.return_value
+            reddit.submission.side_effect = lambda id: SimpleNamespace(id=id, comments=[])
+            submissions = list(self.rds._iter_submissions(['7jgnxm', 't3_7jgnxn']))
+        self.assertEqual([submission.id for submission in submissions], ['7jgnxm', '7jgnxn'])
+        reddit.info.assert_not_called()
+
+    def test_submissions_without_comments_should_be_looked_up_by_info(self):
+        with mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            reddit = clients.get.return_value
+            reddit.info.return_value = iter([SimpleNamespace(id='7jgnxm')])
+            submissions = list(self.rds._iter_submissions(['7jgnxm'], comments=False))
+        self.assertEqual([submission.id for submission in submissions], ['7jgnxm'])
+        reddit.info.assert_called_once_with(fullnames=['t3_7jgnxm'])
+        reddit.submission.assert_not_called()
+
+    def test_submission_without_comments_should_be_got_by_info(self):
+        submission = SimpleNamespace(id='7jgnxm', title="A submission")
+        with mock.patch('navcom_data_downloader.models.warehouse', None), \
+                mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            reddit = clients.get.return_value
+            reddit.info.return_value = iter([submission])
+            self.assertIs(self.rds._get_submission('7jgnxm', comments=False), submission)
+        reddit.info.assert_called_once_with(fullnames=['t3_7jgnxm'])
+        reddit.submission.assert_not_called()
+
+    def test_missing_submission_without_comments_should_fail(self):
+        with mock.patch('navcom_data_downloader.models.warehouse', None), \
+                mock.patch('navcom_data_downloader.models.reddit_clients') as clients:
+            clients.get.return_value.info.return_value = iter([])
+            with self.assertRaises(KeyError):
+                self.rds._get_submission('7jgnxm', comments=False)
+
+    def test_incremental_crawl_should_stop_at_the_checkpoint(self):
+        subreddit = 'dataisbeautiful'
+        first = list(self.rds._iter_incremental(subreddit, 3))
+        again = list(self.rds._iter_incremental(subreddit, 3))
+        self.assertFalse({s.id for s in first} & {s.id for s in again})
+
+    def test_incremental_crawl_should_hold_the_checkpoint_before_a_failure(self):
+        listing = [SimpleNamespace(id=id, fullname='t3_' + id, created_utc=created_utc)
+                   for id, created_utc in [('c', 3.0), ('b', 2.0), ('a', 1.0)]]
+
+        def query(subreddit, kind, listed=None, **kwargs):
+            for submission in listing:
+                listed.append((submission.id, submission.fullname, submission.created_utc))
+                if submission.id != 'b':
+                    yield submission
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('navcom_data_downloader.models.reddit_checkpoints',
+                           CheckpointStore(os.path.join(directory, 'checkpoints.sqlite'))) as checkpoints, \
+                mock.patch.object(self.rds, '_iter_query', side_effect=query):
+            self.assertEqual([s.id for s in self.rds._iter_incremental('dataisbeautiful', 3)],
+                             ['c', 'a'])
+            self.assertEqual(checkpoints.get('dataisbeautiful')['fullname'], 't3_a')
+
     # Test serialization.
     def test_serializing_a_single_submission_should_work(self):
         submission = self.rds._get_submission('7jgnxm')
@@ -141,6 +394,15 @@ class TestRedditDataSource(unittest.TestCase):
         self.assertEqual(df.iloc[0]['created_utc'], 1513140549.0)
         self.assertEqual(df.iloc[0]['is_submitter'], False)
 
+    def test_serialized_submission_should_equal_pandas_to_csv(self):
+        submission = self.rds._get_submission('7jgnxm')
+        joined = [{**vars(submission), **vars(c)} for c in submission.comments]
+        df = pd.DataFrame.from_records(joined)
+        df = df.rename(columns={'title': 'header', 'body': 'comments'})
+        df['comments'] = df['comments'].str.replace('\n', ' ')
+        self.assertEqual(self.rds._as_csv([submission]),
+                         df[RedditDataSource.columns].to_csv(index=False))
+
     def test_serialized_entries_should_be_free_of_newlines(self):
         submissions = self.rds.get_hot('dataisbeautiful', limit=50)
         df = pd.read_csv(StringIO(submissions))
@@ -155,6 +417,18 @@ class TestRedditDataSource(unittest.TestCase):
         df = pd.read_csv(StringIO(submission))
         self.assertEqual(df.iloc[0]['header'], "Error with PRAW")
 
+    def test_streaming_a_specific_submission_should_yield_csv_chunks(self):
+        chunks = list(self.rds.stream_submission('7jgnxm'))
+        self.assertTrue(chunks[0].startswith('header,comments,author'))
+        self.assertEqual(542, len(''.join(chunks)))
+
+    def test_streaming_hot_should_equal_getting_hot(self):
+        subreddit = 'dataisbeautiful'
+        streamed = self.rds.stream_hot(subreddit, limit=3)
+        df = pd.read_csv(StringIO(''.join(streamed)))
+        self.assertLessEqual(len(df['header'].unique()), 3)
+        self.assertEqual(len(df.columns), 9)
+
     def test_getting_hot_from_a_subreddit_should_return_csv(self):
         subreddit = 'dataisbeautiful'
         submissions = self.rds.get_hot(subreddit, limit=3)
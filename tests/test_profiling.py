@@ -0,0 +1,85 @@
+import unittest
+import concurrent.futures
+import contextvars
+import tempfile
+from types import SimpleNamespace
+from navcom_data_downloader import app, profiling
+from navcom_data_downloader.profiling import Profiles
+
+
+def slow_square(n):
+    return sum(n for _ in range(n))
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiles = Profiles(self.directory.name, kept=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _export(self, progress):
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        context = contextvars.copy_context()
+        future = pool.submit(context.run, profiling.run, slow_square, 1000)
+        yield 'header\r\n'
+        yield str(future.result())
+        pool.shutdown()
+
+    def _profile(self, export=None):
+        session = self.profiles.start('/reddit-subreddit-submit')
+        chunks = list(session.wrap(export or self._export)(None))
+        return session, chunks
+
+    def test_profiled_exports_should_pass_their_chunks_through(self):
+        session, chunks = self._profile()
+        self.assertEqual(chunks, ['header\r\n', '1000000'])
+
+    def test_profiles_should_cover_the_threads_of_pools(self):
+        session, chunks = self._profile()
+        self.assertEqual(self.profiles.get(session.id)['status'], 'done')
+        with open(self.profiles.report(session.id)) as f:
+            report = f.read()
+        self.assertIn('2 threads', report)
+        self.assertIn('slow_square', report)
+
+    def test_failed_exports_should_be_saved_as_failed(self):
+        def failing(progress):
+            yield 'header\r\n'
+            raise RuntimeError("Failed on purpose.")
+
+        with self.assertRaises(RuntimeError):
+            self._profile(failing)
+        self.assertEqual(self.profiles.recent()[0]['status'], 'failed')
+
+    def test_only_the_most_recent_profiles_should_be_kept(self):
+        sessions = [self._profile()[0] for _ in range(3)]
+        self.assertEqual([profile['id'] for profile in self.profiles.recent()],
+                         [session.id for session in reversed(sessions[1:])])
+
+    def test_ids_should_be_hex_uuids(self):
+        with self.assertRaises(ValueError):
+            self.profiles.get('../../etc/passwd')
+
+    def test_unprofiled_calls_should_just_be_called(self):
+        self.assertEqual(profiling.run(slow_square, 10), 100)
+
+
+class TestIsAdmin(unittest.TestCase):
+    def tearDown(self):
+        app.config['ADMIN_TOKEN'] = None
+
+    def _request(self, token=None):
+        return SimpleNamespace(headers={'X-Admin-Token': token} if token else {},
+                               authorization=None)
+
+    def test_admin_should_need_a_configured_token(self):
+        app.config['ADMIN_TOKEN'] = None
+        self.assertFalse(profiling.is_admin(self._request('')))
+
+    def test_admin_should_need_the_right_token(self):
+        app.config['ADMIN_TOKEN'] = 'secret'
+        self.assertFalse(profiling.is_admin(self._request('wrong')))
+        self.assertFalse(profiling.is_admin(self._request()))
+        self.assertTrue(profiling.is_admin(self._request('secret')))
@@ -0,0 +1,132 @@
+import unittest
+import asyncio
+import os
+import types
+import tempfile
+import threading
+import time
+from navcom_data_downloader.ratelimit import RateLimitScheduler, Budget, INTERACTIVE, BULK
+
+
+class TestRateLimitScheduler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'ratelimit.json')
+        self.scheduler = RateLimitScheduler(self.path, rate=20.0, burst=2, reserve=1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_calls_within_the_burst_should_not_wait(self):
+        self.scheduler.acquire()
+        self.scheduler.acquire()
+        self.assertEqual(self.scheduler.stats()['waits'], 0)
+
+    def test_calls_beyond_the_burst_should_be_paced(self):
+        start = time.time()
+        for _ in range(6):
+            self.scheduler.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        self.assertEqual(self.scheduler.stats()['calls'], 6)
+
+    def test_bucket_should_be_shared_through_its_file(self):
+        other = RateLimitScheduler(self.path, rate=20.0, burst=2)
+        self.scheduler.acquire()
+        self.scheduler.acquire()
+        other.acquire()
+        self.assertEqual(other.stats()['waits'], 1)
+
+    def test_reported_limits_should_set_the_rate(self):
+        self.scheduler.update({'remaining': 100.0, 'reset_timestamp': time.time() + 50})
+        self.assertAlmostEqual(self.scheduler.stats()['rate'], 2.0, places=1)
+
+    def test_exhausted_limits_should_block_until_reset(self):
+        self.scheduler.update({'remaining': 0.0, 'reset_timestamp': time.time() + 0.2})
+        start = time.time()
+        self.scheduler.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_interactive_calls_should_go_before_bulk_calls(self):
+        order = []
+
+        def call(priority):
+            with self.scheduler.priority(priority):
+                self.scheduler.acquire()
+            order.append(priority)
+
+        self.scheduler.acquire()
+        self.scheduler.acquire()
+        threads = [threading.Thread(target=call, args=(BULK,)),
+                   threading.Thread(target=call, args=(INTERACTIVE,))]
+        threads[1].start()
+        time.sleep(0.01)
+        threads[0].start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [INTERACTIVE, BULK])
+
+    def test_async_calls_should_be_paced_without_blocking_the_loop(self):
+        async def request():
+            return 'response'
+
+        core = types.SimpleNamespace(request=request)
+        reddit = types.SimpleNamespace(_core=core, auth=types.SimpleNamespace(limits={}))
+        self.scheduler.install_async(reddit)
+
+        async def calls():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            responses = [await core.request() for _ in range(6)]
+            ticker.cancel()
+            return responses, ticks
+
+        responses, ticks = asyncio.run(calls())
+        self.assertEqual(responses, ['response'] * 6)
+        self.assertEqual(self.scheduler.stats()['calls'], 6)
+        self.assertGreater(ticks, 5)
+
+
+def replace_more(limit):
+    """Count calls down like praw's CommentForest.replace_more, returning how many were made."""
+    calls, remaining = 0, limit
+    for _ in range(100):
+        if remaining is not None and remaining <= 0:
+            break
+        calls += 1
+        remaining -= 1
+    return calls
+
+
+class TestBudget(unittest.TestCase):
+    def test_unlimited_budget_should_leave_the_limit(self):
+        budget = Budget()
+        self.assertEqual(replace_more(budget.allowance(5)), 5)
+        self.assertEqual(budget.spent, 5)
+        self.assertFalse(budget.exhausted())
+
+    def test_allowance_should_stop_when_the_calls_are_spent(self):
+        budget = Budget(calls=7)
+        self.assertEqual(replace_more(budget.allowance()), 7)
+        self.assertTrue(budget.exhausted())
+        self.assertEqual(replace_more(budget.allowance()), 0)
+
+    def test_allowance_should_be_a_fair_share(self):
+        budget = Budget(calls=10)
+        budget.expect(3)
+        self.assertEqual(replace_more(budget.allowance()), 4)
+        self.assertEqual(replace_more(budget.allowance()), 3)
+        self.assertEqual(replace_more(budget.allowance()), 3)
+
+    def test_budget_should_be_exhausted_after_the_deadline(self):
+        budget = Budget(seconds=0.05)
+        self.assertFalse(budget.exhausted())
+        time.sleep(0.06)
+        self.assertTrue(budget.exhausted())
+        self.assertEqual(replace_more(budget.allowance()), 0)
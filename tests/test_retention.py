@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from navcom_data_downloader.retention import RetainedExports
+
+KEY = 'a' * 64
+
+
+class TestRetainedExports(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.exports = RetainedExports(self.directory.name, retention=60, spool_size=16,
+                                       finish_size=1024, finish_seconds=5)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _retain(self, chunks, key=KEY):
+        return self.exports.retain(key, chunks, 'export.csv', 'text/csv', 'etag')
+
+    def test_chunks_should_pass_through(self):
+        chunks = ['header\r\n', 'a' * 100, b'bytes too']
+        self.assertEqual(list(self._retain(chunks)), chunks)
+
+    def test_finished_export_should_be_kept(self):
+        list(self._retain(['header\r\n', 'a' * 100]))
+        self.assertEqual(self.exports.get(KEY)['etag'], 'etag')
+        with open(self.exports.output(KEY), 'rb') as f:
+            self.assertEqual(f.read(), b'header\r\n' + b'a' * 100)
+
+    def test_failed_export_should_not_be_kept(self):
+        def chunks():
+            yield 'header\r\n'
+            raise RuntimeError("Failed on purpose.")
+
+        with self.assertRaises(RuntimeError):
+            list(self._retain(chunks()))
+        self.assertIsNone(self.exports.get(KEY))
+
+    def test_interrupted_export_should_be_finished_and_kept(self):
+        retained = self._retain(iter(['header\r\n', 'a' * 100, 'b' * 100]))
+        next(retained)
+        retained.close()
+        for _ in range(100):
+            if self.exports.get(KEY) is not None:
+                break
+            time.sleep(0.01)
+        with open(self.exports.output(KEY), 'rb') as f:
+            self.assertEqual(f.read(), b'header\r\n' + b'a' * 100 + b'b' * 100)
+
+    def test_expired_exports_should_be_removed(self):
+        self.exports.retention = -1
+        list(self._retain(['old']))
+        self.exports.retention = 60
+        list(self._retain(['new'], key='b' * 64))
+        self.assertIsNone(self.exports.get(KEY))
+        self.assertFalse(os.path.exists(self.exports.output(KEY)))
+        self.assertIsNotNone(self.exports.get('b' * 64))
+
+    def test_keys_should_be_hex_digests(self):
+        with self.assertRaises(ValueError):
+            self.exports.get('../../etc/passwd')
+
+    def _endless(self, closed):
+        try:
+            while True:
+                yield 'a' * 100
+        finally:
+            closed.set()
+
+    def test_interrupted_export_past_the_finish_size_should_be_stopped(self):
+        closed = threading.Event()
+        retained = self._retain(self._endless(closed))
+        next(retained)
+        retained.close()
+        self.assertTrue(closed.wait(5))
+        self.assertIsNone(self.exports.get(KEY))
+        self.assertEqual([name for name in os.listdir(self.directory.name)
+                          if not name.endswith('.tmp')], [])
+
+    def test_interrupted_export_should_be_stopped_if_not_to_be_finished(self):
+        self.exports.finish_seconds = 0
+        closed = threading.Event()
+        retained = self._retain(self._endless(closed))
+        next(retained)
+        retained.close()
+        self.assertTrue(closed.is_set())
+        self.assertIsNone(self.exports.get(KEY))
@@ -1,7 +1,9 @@
 import unittest
+import gzip
 from io import StringIO
 import pandas as pd
 from navcom_data_downloader import app, routes
+from navcom_data_downloader.models import RedditDataSource
 
 
 class TestRoutes(unittest.TestCase):
@@ -34,6 +36,7 @@ class TestTwitterRoutes(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertTrue(b'Please define your Twitter query.' in resp.data)
         self.assertTrue(b'<input id="string" type="text" name="string" required>' in resp.data)
+        self.assertTrue(b'<input id="max" type="number" name="max" min="0" value="10">' in resp.data)
         self.assertTrue(b'<button type="submit">Submit</button>' in resp.data)
 
     def test_submitted_form_should_return_response(self):
@@ -44,6 +47,13 @@ class TestTwitterRoutes(unittest.TestCase):
                                 follow_redirects=True)
         self.assertEqual(resp.status_code, 200)
 
+    def test_submitted_form_with_weird_max_should_return_400(self):
+        resp = self.client.post('/twitter-submit',
+                                content_type='multipart/form-data',
+                                data={'string': "kittens", 'max': 'many'},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 400)
+
     def test_submitted_form_should_return_csv(self):
         query = "lama"
         resp = self.client.post('/twitter-submit',
@@ -70,8 +80,12 @@ class TestRedditRoutes(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertTrue(b'Please define your Reddit query.' in resp.data)
         self.assertTrue(b'<input id="submission-id" type="text" name="submission_id" required>' in resp.data)
+        self.assertTrue(b'<textarea id="submission-ids" name="submission_ids" rows="6" required></textarea>' in resp.data)
         self.assertTrue(b'<input id="subreddit" type="text" name="subreddit" required>' in resp.data)
         self.assertTrue(b'<select name="kind" id="kind" required>' in resp.data)
+        self.assertTrue(b'<option value="num_comments">num_comments</option>' in resp.data)
+        self.assertTrue(b'<input id="subreddit-replies" type="checkbox" name="replies" value="1">' in resp.data)
+        self.assertTrue(b'<input id="subreddit-gzip" type="checkbox" name="gzip" value="1">' in resp.data)
         self.assertTrue(b'<button type="submit">Submit</button>' in resp.data)
 
     def test_submitted_empty_submission_form_should_fail(self):
@@ -89,6 +103,93 @@ class TestRedditRoutes(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertTrue(b'Error with PRAW' in resp.data)
 
+    def test_submitted_submission_form_with_replies_should_export_depth(self):
+        # Like a browser, which sends the preselected default columns.
+        resp = self.client.post('/reddit-submission-submit',
+                                content_type='multipart/form-data',
+                                data={'submission_id':  '7jgnxm', 'replies': '1',
+                                      'columns': RedditDataSource.columns},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 200)
+        header = resp.data.splitlines()[0].decode('utf-8').split(',')
+        self.assertEqual(header, RedditDataSource.columns + ['depth'])
+
+    def test_submitted_submission_form_should_be_streamed(self):
+        resp = self.client.post('/reddit-submission-submit',
+                                content_type='multipart/form-data',
+                                data={'submission_id':  '7jgnxm'},
+                                follow_redirects=True)
+        self.assertTrue(resp.is_streamed)
+        self.assertTrue(resp.data.startswith(b'header,comments,author'))
+
+    def test_submitted_submission_form_should_be_compressed_if_accepted(self):
+        data = {'submission_id':  '7jgnxm'}
+        plain = self.client.post('/reddit-submission-submit', data=data)
+        resp = self.client.post('/reddit-submission-submit', data=data,
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['content-encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.data), plain.data)
+
+    def test_submitted_gzip_submission_form_should_download_a_gz_file(self):
+        resp = self.client.post('/reddit-submission-submit',
+                                data={'submission_id':  '7jgnxm', 'gzip': '1'},
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', resp.headers)
+        self.assertTrue(resp.headers['content-disposition'].endswith('7jgnxm.csv.gz'))
+        self.assertTrue(gzip.decompress(resp.data).startswith(b'header,comments,author'))
+
+    def test_submitted_submission_form_should_be_resumable(self):
+        resp = self.client.post('/reddit-submission-submit', data={'submission_id':  '7jgnxm'})
+        resumed = self.client.get(resp.headers['content-location'],
+                                  headers={'Range': 'bytes=10-', 'If-Range': resp.headers['etag']})
+        self.assertEqual(resumed.status_code, 206)
+        self.assertEqual(resumed.data, resp.data[10:])
+
+    def test_resubmitted_submission_form_with_a_range_should_resume(self):
+        resp = self.client.post('/reddit-submission-submit', data={'submission_id':  '7jgnxm'})
+        headers = {'Range': 'bytes=10-', 'If-Range': resp.headers['etag']}
+        resubmitted = self.client.post('/reddit-submission-submit',
+                                       data={'submission_id':  '7jgnxm'}, headers=headers)
+        self.assertEqual(resubmitted.status_code, 303)
+        self.assertEqual(resubmitted.headers['location'], resp.headers['content-location'])
+        resumed = self.client.get(resubmitted.headers['location'], headers=headers)
+        self.assertEqual(resumed.status_code, 206)
+        self.assertEqual(resumed.data, resp.data[10:])
+
+    def test_unknown_export_should_return_404(self):
+        resp = self.client.get('/exports/' + 'a' * 64)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_submitted_background_submission_form_should_return_a_job(self):
+        resp = self.client.post('/reddit-submission-submit',
+                                content_type='multipart/form-data',
+                                data={'submission_id':  '7jgnxm', 'background': '1'},
+                                follow_redirects=False)
+        self.assertEqual(resp.status_code, 202)
+        job = resp.get_json()
+        status = self.client.get(job['status'])
+        self.assertEqual(status.status_code, 200)
+        self.assertIn(status.get_json()['status'], ['queued', 'running', 'done'])
+
+    def test_submitted_submissions_form_should_return_one_export(self):
+        resp = self.client.post('/reddit-submissions-submit',
+                                content_type='multipart/form-data',
+                                data={'submission_ids': '7jgnxm,\nt3_7jgnxm 7jhl8k'},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['content-disposition'].endswith('submissions-2.csv'))
+
+    def test_submitted_empty_submissions_form_should_return_400(self):
+        resp = self.client.post('/reddit-submissions-submit',
+                                content_type='multipart/form-data',
+                                data={'submission_ids': ' ,\n'},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_unknown_job_should_return_404(self):
+        resp = self.client.get('/jobs/' + 'a' * 32)
+        self.assertEqual(resp.status_code, 404)
+
     def test_submitted_empty_subreddit_form_should_fail(self):
         with self.assertRaises(KeyError) as cm:
             resp = self.client.post('/reddit-subreddit-submit',
@@ -187,6 +288,31 @@ class TestRedditRoutes(unittest.TestCase):
         self.assertEqual(disposition, 'attachment')
         self.assertEqual(filename, "filename=" + subreddit + '-' + kind + ".csv")
 
+    def test_submitted_subreddit_form_with_jsonl_format_should_return_jsonl(self):
+        subreddit = "dataisbeautiful"
+        resp = self.client.post('/reddit-subreddit-submit',
+                                content_type='multipart/form-data',
+                                data={'subreddit': subreddit, 'kind': 'hot', 'format': 'jsonl'},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(resp.headers['content-disposition'].endswith(subreddit + '-hot.jsonl'))
+
+    def test_submitted_subreddit_form_with_weird_format_should_fail(self):
+        resp = self.client.post('/reddit-subreddit-submit',
+                                content_type='multipart/form-data',
+                                data={'subreddit': "dataisbeautiful", 'kind': 'hot', 'format': 'xls'},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_submitted_subreddit_form_with_unknown_column_should_fail(self):
+        resp = self.client.post('/reddit-subreddit-submit',
+                                content_type='multipart/form-data',
+                                data={'subreddit': "dataisbeautiful", 'kind': 'hot',
+                                      'columns': ['header', 'karma']},
+                                follow_redirects=True)
+        self.assertEqual(resp.status_code, 400)
+
     def test_submitted_subreddit_form_should_return_parseable_csv(self):
         subreddit = "dataisbeautiful"
         kind = 'hot'
@@ -197,3 +323,58 @@ class TestRedditRoutes(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         df = pd.read_csv(StringIO(str(resp.data)))
         self.assertIsInstance(df, pd.DataFrame)
+
+
+class TestStatsRoute(unittest.TestCase):
+    def setUp(self):
+        with routes.app.test_client() as client:
+            self.client = client
+
+    def test_stats_should_report_the_reddit_client_pool(self):
+        resp = self.client.get('/stats')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('hits', resp.get_json()['reddit_clients'])
+
+
+class TestMetricsRoute(unittest.TestCase):
+    def setUp(self):
+        with routes.app.test_client() as client:
+            self.client = client
+
+    def test_metrics_should_be_in_prometheus_text_format(self):
+        self.client.get('/hello')
+        resp = self.client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'navcom_request_seconds_count{route="/hello"}', resp.data)
+
+
+class TestProfilesRoutes(unittest.TestCase):
+    def setUp(self):
+        app.config['ADMIN_TOKEN'] = 'secret'
+        with routes.app.test_client() as client:
+            self.client = client
+
+    def tearDown(self):
+        app.config['ADMIN_TOKEN'] = None
+
+    def test_profiles_should_need_the_admin_token(self):
+        self.assertEqual(self.client.get('/admin/profiles').status_code, 401)
+        resp = self.client.get('/admin/profiles', headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'<h1>Profiles</h1>', resp.data)
+
+    def test_profiling_an_export_should_need_the_admin_token(self):
+        resp = self.client.post('/reddit-submission-submit?profile=1',
+                                data={'submission_id': 'a2q5r9'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_profiled_export_should_point_to_its_profile(self):
+        resp = self.client.post('/reddit-submission-submit?profile=1',
+                                data={'submission_id': 'a2q5r9'},
+                                headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(resp.status_code, 200)
+        resp.close()
+        resp = self.client.get(resp.headers['X-Profile'], headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'Calls, by cumulative time', resp.data)
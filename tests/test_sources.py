@@ -0,0 +1,41 @@
+import unittest
+import subprocess
+import sys
+from navcom_data_downloader import sources
+from navcom_data_downloader.models import TwitterDataSource
+
+
+class TestSources(unittest.TestCase):
+    def test_lazy_import_should_load_on_first_use(self):
+        sys.modules.pop('colorsys', None)
+        colorsys = sources.lazy_import('colorsys')
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual(colorsys.rgb_to_hsv(1, 0, 0), (0, 1, 1))
+        self.assertIn('colorsys', sys.modules)
+
+    def test_lazy_import_of_a_missing_module_should_fail_right_away(self):
+        with self.assertRaises(ModuleNotFoundError):
+            sources.lazy_import('no_such_module_xxxx')
+
+    def test_getting_a_source_should_give_its_class(self):
+        self.assertIs(sources.get('twitter'), TwitterDataSource)
+
+    def test_getting_an_unknown_source_should_fail(self):
+        with self.assertRaises(KeyError):
+            sources.get('myspace')
+
+    def test_registered_source_should_replace_the_previous_one(self):
+        previous = sources.SOURCES['twitter']
+        try:
+            sources.register('twitter', dict)
+            self.assertIs(sources.get('twitter'), dict)
+        finally:
+            sources.register('twitter', *previous)
+        self.assertIs(sources.get('twitter'), TwitterDataSource)
+
+    def test_importing_the_app_should_not_load_the_backends(self):
+        code = ("import sys, navcom_data_downloader; "
+                "print(sorted({'praw', 'GetOldTweets3', 'navcom_data_downloader.models'} & set(sys.modules)))")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                                text=True, check=True).stdout
+        self.assertEqual(output.split('\n')[-2], '[]')
@@ -0,0 +1,59 @@
+import unittest
+import os
+import tempfile
+from navcom_data_downloader.warehouse import Warehouse
+
+
+class TestWarehouse(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.warehouse = Warehouse(os.path.join(self.directory.name, 'warehouse.sqlite'))
+        self.submission = {'id': 'abc', 'name': 't3_abc', 'subreddit': 'DataIsBeautiful',
+                           'created_utc': 1600000000.0, 'title': 'A chart'}
+        self.comments = [{'id': 'c1', 'name': 't1_c1', 'parent_id': 't3_abc', 'body': 'Nice'},
+                         {'id': 'c2', 'name': 't1_c2', 'parent_id': 't1_c1', 'body': 'Indeed'}]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unknown_submission_should_not_be_gotten(self):
+        self.assertIsNone(self.warehouse.get_submission('abc'))
+
+    def test_kept_submission_should_be_gotten_with_its_comments_in_order(self):
+        self.warehouse.put_submission(self.submission, self.comments, True)
+        self.assertEqual(self.warehouse.get_submission('abc'), (self.submission, self.comments))
+
+    def test_incomplete_submission_should_not_be_gotten(self):
+        self.warehouse.put_submission(self.submission, self.comments, False)
+        self.assertIsNone(self.warehouse.get_submission('abc'))
+
+    def test_submission_kept_too_long_ago_should_not_be_gotten(self):
+        self.warehouse.put_submission(self.submission, self.comments, True)
+        with self.warehouse._connect() as connection:
+            connection.execute("UPDATE submissions SET fetched = fetched - 3600")
+        self.assertIsNone(self.warehouse.get_submission('abc', max_age=60))
+        self.assertIsNotNone(self.warehouse.get_submission('abc', max_age=7200))
+
+    def test_keeping_a_submission_again_should_replace_its_comments(self):
+        self.warehouse.put_submission(self.submission, self.comments, True)
+        self.warehouse.put_submission(self.submission, self.comments[:1], True)
+        self.assertEqual(self.warehouse.get_submission('abc')[1], self.comments[:1])
+
+    def test_uncovered_dates_should_have_no_tweets(self):
+        self.warehouse.put_tweets('goats', '2020-08-15', '2020-08-16', [], False)
+        self.assertIsNone(self.warehouse.get_tweets('goats', '2020-08-15', '2020-08-16'))
+
+    def test_covered_dates_should_have_their_tweets_newest_first(self):
+        tweets = [{'id': '1', 'date': 1597449600.0, 'text': 'Midnight'},
+                  {'id': '2', 'date': 1597500000.0, 'text': 'Afternoon'}]
+        self.warehouse.put_tweets('goats', '2020-08-15', '2020-08-16', tweets, True)
+        self.assertEqual(self.warehouse.get_tweets('goats', '2020-08-15', '2020-08-16'),
+                         tweets[::-1])
+
+    def test_covered_dates_should_only_have_tweets_of_the_query(self):
+        self.warehouse.put_tweets('goats', '2020-08-15', '2020-08-16',
+                                  [{'id': '1', 'date': 1597500000.0}], True)
+        self.warehouse.put_tweets('sheep', '2020-08-15', '2020-08-16',
+                                  [{'id': '2', 'date': 1597500000.0}], True)
+        self.assertEqual(self.warehouse.get_tweets('sheep', '2020-08-15', '2020-08-16'),
+                         [{'id': '2', 'date': 1597500000.0}])